@@ -20,11 +20,12 @@ setup_kwargs = dict(
     #     "Source Code": "https://github.com/..,
     # },
     zip_safe=False,
+    python_requires='>=3.6',
 
     # what packages/distributions (python) need to be installed when this one is. (Roughly what is imported in source code)
     install_requires=[
         'numpy', 'scipy', 'EasyPlot==1.0.0', 'nltk',
-        'pandas', 'gensim', 'tqdm', 'in-place', 'protobuf',
+        'pandas', 'gensim', 'tqdm', 'protobuf',
         'click', 'future', 'attrs',
         'PyInquirer',  # # for the transform.py interface
         # 'configparser'  # to make statement 'from configparser import ConfigParser' python 2 and 3 compatible
@@ -48,8 +49,6 @@ setup_kwargs = dict(
     classifiers=[
         'Development Status :: 4 - Beta',
         'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3.6',
         'Topic :: Scientific/Engineering :: Artificial Intelligence',
@@ -85,7 +84,10 @@ setup_kwargs = dict(
     },
     # A dictionary mapping names of "extras" (optional features of your project: eg imports that a console_script uses) to strings or lists of strings
     # specifying what other distributions must be installed to support those features.
-    # extras_require={},
+    extras_require={
+        'arrow': ['pyarrow'],  # for reading the documents from Parquet/Feather files
+        'zstd': ['zstandard'],  # for writing zstd compressed dataset files
+    },
 
 )
 
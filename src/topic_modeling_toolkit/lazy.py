@@ -0,0 +1,39 @@
+"""Package attributes resolved on first access, so that importing a package does not import all of its submodules and their heavy
+dependencies (ie artm, gensim, pandas, matplotlib) up front.\n
+A module level __getattr__ (PEP 562) needs python 3.7, so the package module is given the LazyModule class instead; assigning the
+__class__ of a module works since python 3.5."""
+import sys
+import importlib
+import types
+
+# package names mapped to their (attributes, factories) pair
+_lazy_packages = {}
+
+
+class LazyModule(types.ModuleType):
+    """A package module that imports the submodule of a public name when the name is first accessed and caches it in its namespace"""
+
+    def __getattr__(self, name):
+        attributes, factories = _lazy_packages.get(self.__name__, ({}, {}))
+        if name in attributes:
+            value = getattr(importlib.import_module(attributes[name], self.__name__), name)
+        elif name in factories:
+            value = factories[name]()
+        else:
+            raise AttributeError("module '{}' has no attribute '{}'".format(self.__name__, name))
+        setattr(self, name, value)  # later lookups do not reach __getattr__
+        return value
+
+    def __dir__(self):
+        attributes, factories = _lazy_packages.get(self.__name__, ({}, {}))
+        return sorted(set(self.__dict__) | set(attributes) | set(factories))
+
+
+def lazy_attributes(package_name, attributes, factories=None):
+    """Make the public names of a package resolve on first access, by importing the submodule that defines them.\n
+    :param str package_name: the __name__ of the package
+    :param dict attributes: public names mapped to the (relative) submodule defining them
+    :param dict factories: public names mapped to callables computing them on first access, ie a shared instance
+    """
+    _lazy_packages[package_name] = (attributes, factories or {})
+    sys.modules[package_name].__class__ = LazyModule
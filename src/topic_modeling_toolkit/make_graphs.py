@@ -4,7 +4,7 @@ import os
 import re
 import sys
 import click
-from .reporting import GraphMaker
+from . import reporting  # matplotlib is imported on first access, after the arguments are parsed
 # from .patm.definitions import COLLECTIONS_DIR_PATH
 
 c = ['perplexity', 'kernel-size', 'kernel-coherence', 'kernel-contrast', 'kernel-purity', 'top-tokens-coherence', 'sparsity-phi',
@@ -67,7 +67,7 @@ def main(dataset, models_labels, sort, model_indices, top, range_tuple, allmetri
     if not collections_dir:
         raise RuntimeError(
             "Please set the COLLECTIONS_DIR environment variable with the path to a directory containing collections/datasets")
-    graph_maker = GraphMaker(collections_dir)
+    graph_maker = reporting.GraphMaker(collections_dir)
     graph_maker.build_graphs_from_collection(dataset, selection,
                                              metric=sort,
                                              score_definitions=metrics,
@@ -1,19 +1,20 @@
+import sys
 import logging
 import logging.config
 
-from .dataset import TextDataset
-
-from .tuning import Tuner
-
-from .modeling import TrainerFactory, Experiment
-from .build_coherence import CoherenceFilesBuilder
-from .pipe_handler import PipeHandler
+from topic_modeling_toolkit.lazy import lazy_attributes
 
 # logging.config.fileConfig(path.join(path.dirname(path.realpath(__file__)), 'logging.ini'), disable_existing_loggers=True)
 #
 # logger = logging.getLogger(__name__)
 
-from .discreetization import PoliticalSpectrumManager
-
-political_spectrum = PoliticalSpectrumManager()
-
+# the public classes are imported on first access, so that ie the reporting commands do not load artm, gensim and pandas
+lazy_attributes(__name__, {
+    'TextDataset': '.dataset',
+    'Tuner': '.tuning',
+    'TrainerFactory': '.modeling',
+    'Experiment': '.modeling',
+    'CoherenceFilesBuilder': '.build_coherence',
+    'PipeHandler': '.pipe_handler',
+    'PoliticalSpectrumManager': '.discreetization',
+}, factories={'political_spectrum': lambda: sys.modules[__name__].PoliticalSpectrumManager()})
@@ -2,9 +2,12 @@
 
 import os
 import re
-import in_place
-import subprocess
 from glob import glob
+from collections import OrderedDict
+from multiprocessing import Pool
+
+from . import cooccurrence
+from .dataset import read_manifest
 
 import logging
 
@@ -22,7 +25,13 @@ class CoherenceFilesBuilder:
         if self._col_name not in os.path.basename(self._vocab):
             logger.warning("{} Instead '{}' found.".format("Vocabulary file usually has the format 'vocab.{col_name}.txt.", os.path.basename(self._vocab)))
 
-        self._splits = sorted([(re.search(r"vowpal\.{}-?([\w\-]*)\.txt".format(self._col_name), f).group(1), f) for f in self._glob("vowpal*.txt")], key=lambda x: x[0], reverse=True)
+        manifest = read_manifest(self._root)
+        if manifest:  # a sharded dataset; all its vowpal shards make up a single split
+            self._splits = [('', [os.path.join(self._root, shard['vowpal']) for shard in manifest['shards']])]
+        else:  # the vowpal files may be compressed (see the 'compression' setting); they are decompressed on the fly while counting
+            split_file = re.compile(r"vowpal\.{}-?([\w\-]*)\.txt(?:\.gz|\.zst)?$".format(re.escape(self._col_name)))
+            self._splits = sorted([(split_file.match(os.path.basename(f)).group(1), f) for f in self._glob("vowpal*.txt*") if split_file.match(os.path.basename(f))],
+                                  key=lambda x: x[0], reverse=True)
         if [_[0] for _ in self._splits] != [''] and [_[0] for _ in self._splits] != ['train', 'test']:
             raise InvalidSplitsError("Either 'train' and 'test' splits must be defined or a '' split no splitting; all dataset used for training)")
 
@@ -32,7 +41,16 @@ class CoherenceFilesBuilder:
     def _path(self, *args, **kwargs):
         return os.path.join(self._root, '_'.join(map(str, [_ for _ in args if _ != ''])) + (lambda x: '.'+x if x else '')(kwargs.get('extension', '')))
 
-    def create_files(self, cooc_window=5, min_tf=0, min_df=0, apply_zero_index=True):
+    def create_files(self, cooc_window=5, min_tf=0, min_df=0, apply_zero_index=True, workers=None, max_memory=512, top_k=None, min_token_df=0):
+        """Create the cooc and ppmi files of each split. The splits are counted concurrently, each split over line-aligned ranges of
+        its vowpal file, by a pool of worker processes (see cooccurrence.count_files). The token ids in the files are zero-based,
+        matching the lines of the vocabulary file, so 'apply_zero_index' has no effect; it is kept for backwards compatibility (see
+        zero_index for files created by the bigartm CLI).\n
+        :param int workers: the number of worker processes; by default the number of cpus
+        :param int max_memory: the MB of partial counts each worker holds before spilling them to disk
+        :param int top_k: if given, the ppmi files keep only the top_k pairs of each token by ppmi value
+        :param int min_token_df: the ppmi files keep only the pairs of tokens found in at least that many documents
+        """
         _file = {}
         for s, vowpal in self._splits:
             _file.update({s: {'cooc_tf': self._path('cooc', min_tf, 'tf', s, extension='txt'),
@@ -40,27 +58,18 @@ class CoherenceFilesBuilder:
                               'ppmi_tf': self._path('ppmi', min_tf, 'tf', s, extension='txt'),
                               'ppmi_df': self._path('ppmi', min_df, 'df', s, extension='txt')}
                           })
-
-            _ = self.create_cooc_files(vowpal, self._vocab,
-                                       _file[s]['cooc_tf'], _file[s]['cooc_df'],
-                                       _file[s]['ppmi_tf'], _file[s]['ppmi_df'],
-                                       cooc_window=cooc_window, min_tf=min_tf, min_df=min_df)
-            if _ == 0:
-                print("Created ppmi files for '{}' split.".format((lambda x: 'all' if not x else x)(s)))
-            else:
-                print("Something went wrong when creating ppmi files for '{}' split.".format((lambda x: 'all' if not x else x)(s)))
-
-            if apply_zero_index:
-                print("Applying zero indexing of tokens (ids)")
-                for key, path in _file[s].items():
-                    with in_place.InPlace(path, backup_ext='.bak') as fp:
-                        for line in fp:
-                            match_obj = re.search(r'^(\d+) (\d+) (.+)$', line).groups()
-                            fp.write('{} {} {}\n'.format(int(match_obj[0])-1, int(match_obj[1])-1 , match_obj[2]))
+        counts = cooccurrence.count_files(OrderedDict(self._splits), self._vocab, window=cooc_window, workers=workers or os.cpu_count() or 1,
+                                          max_bytes=max_memory * 1024 * 1024, spill_dir=self._root)
+        for s, split_counts in counts.items():
+            self.write_files(split_counts, _file[s]['cooc_tf'], _file[s]['cooc_df'], _file[s]['ppmi_tf'], _file[s]['ppmi_df'], min_tf=min_tf, min_df=min_df,
+                             top_k=top_k, min_token_df=min_token_df)
+            print("Created ppmi files for '{}' split.".format((lambda x: 'all' if not x else x)(s)))
 
     @staticmethod
-    def create_cooc_files(vowpal_file, vocab_file, cooc_tf, cooc_df, ppmi_tf, ppmi_df, cooc_window=5, min_tf=0, min_df=0):
+    def create_cooc_files(vowpal_file, vocab_file, cooc_tf, cooc_df, ppmi_tf, ppmi_df, cooc_window=5, min_tf=0, min_df=0, workers=1):
         """
+        Count the co-occurrences of the tokens in the documents of a vowpal file and write them, along with their ppmi, in the text
+        format artm.Dictionary.gather reads: one line per token, with its zero-based id followed by 'token_id value' pairs.\n
         :param str vowpal_file: path to vowpal-formated bag-of-words file
         :param str vocab_file: path to uci-formated (list of unique tokens) vocabulary file
         :param str cooc_tf: file path to save the terms frequency (tf) dictionary of co-occurrences of every specific pair of tokens: total number of times a pair of tokens appears in the dataset
@@ -70,17 +79,49 @@ class CoherenceFilesBuilder:
         :param int min_tf: minimal value of cooccurrences of a pair of tokens that are saved in dictionary of cooccurrences
         :param int min_df: minimal value of documents in which a specific pair of tokens occurred together closely
         :param int cooc_window: number of tokens around specific token, which are used in calculation of cooccurrences
-        :return:
+        :param int workers: the number of worker processes to count with
+        :return: 0 on success
+        :rtype: int
         """
-        # let everything flow into the terminal
-        args = ['bigartm', '-c', vowpal_file, '-v', vocab_file, '--cooc-window', str(cooc_window),
-                '--cooc-min-tf', str(min_tf), '--write-cooc-tf', cooc_tf,
-                '--cooc-min-df', str(min_df), '--write-cooc-df', cooc_df,
-                '--write-ppmi-tf', ppmi_tf,
-                '--write-ppmi-df', ppmi_df,
-                '--force']
-        print('Executing:', ' '.join(args))
-        return subprocess.call(args)
+        counts = cooccurrence.count_files({'': vowpal_file}, vocab_file, window=cooc_window, workers=workers)['']
+        CoherenceFilesBuilder.write_files(counts, cooc_tf, cooc_df, ppmi_tf, ppmi_df, min_tf=min_tf, min_df=min_df)
+        return 0
+
+    def zero_index(self, workers=4):
+        """Make the token ids of the cooc and ppmi files of the collection zero-based, in place. Only needed for files created by the
+        bigartm CLI, which numbers tokens from one; the four files of each split are rewritten in parallel."""
+        paths = sorted(self._glob('cooc_*.txt') + self._glob('ppmi_*.txt'))
+        pool = Pool(processes=min(workers, len(paths)) or 1)
+        try:
+            nb_lines = pool.map(cooccurrence.shift_token_ids, paths)
+        finally:
+            pool.close()
+            pool.join()
+        for path, lines in zip(paths, nb_lines):
+            logger.info("Zero-indexed {} lines of '{}'".format(lines, path))
+
+    @staticmethod
+    def write_files(counts, cooc_tf, cooc_df, ppmi_tf, ppmi_df, min_tf=0, min_df=0, top_k=None, min_token_df=0):
+        """Write the cooc and ppmi files of the co-occurrence counts (a cooccurrence.CooccurrenceCounts). The ppmi pairs can be pruned
+        to the top_k partners of each token and to the tokens appearing in at least min_token_df documents, since coherence scores only
+        look at pairs among the top (or kernel) tokens of the topics; the reduction is reported."""
+        for matrix, file_path, value_format in ((cooccurrence.at_least(counts.tf, min_tf), cooc_tf, '{}'),
+                                                (cooccurrence.at_least(counts.df, min_df), cooc_df, '{}')):
+            nb_lines = cooccurrence.write_pairs(matrix, file_path, value_format=value_format)
+            logger.info("Wrote {} pairs of {} tokens in '{}'".format(matrix.nnz, nb_lines, file_path))
+        for matrix, file_path in ((cooccurrence.ppmi_tf(counts.tf, min_tf=min_tf), ppmi_tf),
+                                  (cooccurrence.ppmi_df(counts.df, counts.token_dfs, counts.nb_docs, min_df=min_df), ppmi_df)):
+            pruned = matrix
+            if min_token_df:
+                pruned = cooccurrence.frequent_pairs(pruned, counts.token_dfs, min_token_df)
+            if top_k:
+                pruned = cooccurrence.top_k_per_token(pruned, top_k)
+            nb_lines = cooccurrence.write_pairs(pruned, file_path, value_format='{:g}')
+            logger.info("Wrote {} pairs of {} tokens in '{}'".format(pruned.nnz, nb_lines, file_path))
+            if pruned is not matrix:
+                print("Pruned '{}' from {} to {} pairs ({:.1%}); {:.1f} MB in memory instead of {:.1f} MB and {:.1f} MB on disk".format(
+                    os.path.basename(file_path), matrix.nnz, pruned.nnz, 1 - float(pruned.nnz) / (matrix.nnz or 1),
+                    cooccurrence.nbytes(pruned) / 2 ** 20, cooccurrence.nbytes(matrix) / 2 ** 20, os.path.getsize(file_path) / 2 ** 20))
 
 
 class VocabularyNotFoundError(Exception): pass
@@ -94,9 +135,12 @@ import click
 @click.option('--window', '-w', default=5, show_default=True, help="number of tokens around specific token, which are used in calculation of cooccurrences")
 @click.option('--cooc_min_tf', '-min_tf', default=0, show_default=True, help="minimal value of cooccurrences of a pair of tokens that are saved in dictionary of cooccurrences")
 @click.option('--cooc_min_df', '-min_df', default=0, show_default=True, help="minimal value of documents in which a specific pair of tokens occurred together closely")
-def main(collection, window, cooc_min_tf, cooc_min_df):
+@click.option('--workers', default=None, type=int, help="number of processes counting co-occurrences; defaults to the number of cpus")
+@click.option('--top-k', default=None, type=int, help="keep only the pairs of each token with the top-k ppmi values in the ppmi files")
+@click.option('--min-token-df', default=0, show_default=True, help="keep only the pairs of tokens found in at least that many documents in the ppmi files")
+def main(collection, window, cooc_min_tf, cooc_min_df, workers, top_k, min_token_df):
     cfb = CoherenceFilesBuilder(os.path.join(collections_root, collection))
-    cfb.create_files(cooc_window=window, min_tf=cooc_min_tf, min_df=cooc_min_df)
+    cfb.create_files(cooc_window=window, min_tf=cooc_min_tf, min_df=cooc_min_df, workers=workers, top_k=top_k, min_token_df=min_token_df)
 
 
 if __name__ == '__main__':
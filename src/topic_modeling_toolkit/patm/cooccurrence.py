@@ -0,0 +1,458 @@
+"""Co-occurrence statistics of the pairs of tokens found close to each other in the documents and their positive pointwise mutual
+information (ppmi), as used by the coherence scores of artm. Counts are accumulated per block of documents in scipy.sparse matrices,
+with one row and one column per token of the vocabulary. Large corpora are counted in parallel, over line-aligned byte ranges of a
+vowpal file; each worker spills its partial counts to disk as sorted runs, which are then combined by a k-way merge."""
+import os
+import json
+import uuid
+import shutil
+import tempfile
+from collections import OrderedDict
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+
+from topic_modeling_toolkit.processors.processor import open_input, file_compression
+
+DEFAULT_MODALITY = '@default_class'
+
+
+def read_vocabulary(vocab_file):
+    """Map each token of the default modality to its (zero-based) line number in a vocabulary file, with one 'token [@modality]' per line.\n
+    :return: the token ids and the number of lines (tokens of all modalities)
+    :rtype: tuple
+    """
+    token2id, nb_lines = {}, 0
+    with open(vocab_file) as f:
+        for line in f:
+            fields = line.split()
+            if fields and (len(fields) == 1 or fields[1] == DEFAULT_MODALITY):
+                token2id[fields[0]] = nb_lines
+            nb_lines += 1
+    return token2id, nb_lines
+
+
+def line_aligned_ranges(file_path, nb_ranges):
+    """Split a file in up to nb_ranges (start, end) byte ranges of about equal size, each starting at the beginning of a line. A
+    compressed file can not be seeked, so it is read as a single (0, None) range"""
+    if file_compression(file_path):
+        return [(0, None)]
+    size = os.path.getsize(file_path)
+    offsets = [0]
+    with open(file_path, 'rb') as f:
+        for i in range(1, nb_ranges):
+            f.seek(max(size * i // nb_ranges, offsets[-1]))
+            f.readline()
+            offsets.append(min(f.tell(), size))
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets[:-1], offsets[1:]) if start < end]
+
+
+def vowpal_token_ids(vowpal_file, token2id, start=0, end=None):
+    """Iterate over the documents of a Vowpal Wabbit file, each as the list of the ids of its default modality tokens, in the order they
+    are listed; a 'token:weight' feature appears once, regardless of its weight. Tokens missing from the vocabulary are skipped.\n
+    :param int start: the byte offset of the first line to read; only 0 for a compressed (.gz or .zst) file
+    :param int end: the byte offset where reading stops; by default the end of the file
+    """
+    with open_input(vowpal_file, 'rb') as f:
+        if start:
+            f.seek(start)
+        position = start
+        for line in f:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            tokens = []
+            for modality in line.decode('utf-8').rstrip('\n').split('|')[1:]:
+                features = modality.split()
+                if features and features[0] == DEFAULT_MODALITY:
+                    tokens.extend(feature.rsplit(':', 1)[0] if ':' in feature else feature for feature in features[1:])
+            yield [token2id[token] for token in tokens if token in token2id]
+
+
+class CooccurrenceCounts(object):
+    """
+    Accumulates, over blocks of documents, how many times each pair of distinct tokens occurs within 'window' positions of each other
+    (tf) and in how many documents they do so (df), along with the number of documents each token appears in. Both matrices are
+    symmetric: a pair is counted in both (u, v) and (v, u). The counts of each block are pushed on a stack of partial counts, where
+    neighbours of similar size are merged like the digits of a binary counter; so the counts of a pair are copied a logarithmic number
+    of times, rather than once per block, and are fully summed only when the matrices are read.
+    """
+    def __init__(self, nb_tokens, window):
+        self.nb_tokens = nb_tokens
+        self.window = window
+        self.nb_docs = 0
+        self.token_dfs = np.zeros(nb_tokens, dtype=np.int64)
+        self._reset()
+
+    def _reset(self):
+        self._partial_counts = []  # (tf, df) matrices, each summing more blocks than the next one
+
+    @property
+    def tf(self):
+        return self._counts()[0]
+
+    @tf.setter
+    def tf(self, matrix):
+        self._partial_counts = [(matrix, self.df)]
+
+    @property
+    def df(self):
+        return self._counts()[1]
+
+    @df.setter
+    def df(self, matrix):
+        self._partial_counts = [(self.tf, matrix)]
+
+    def _counts(self):
+        if not self._partial_counts:
+            return csr_matrix((self.nb_tokens, self.nb_tokens), dtype=np.int64), csr_matrix((self.nb_tokens, self.nb_tokens), dtype=np.int64)
+        while len(self._partial_counts) > 1:
+            self._merge_last()
+        return self._partial_counts[0]
+
+    def _push(self, tf, df):
+        self._partial_counts.append((tf, df))
+        while len(self._partial_counts) > 1 and self._partial_counts[-2][0].nnz <= 2 * self._partial_counts[-1][0].nnz:
+            self._merge_last()
+
+    def _merge_last(self):
+        (tf, df), (last_tf, last_df) = self._partial_counts[-2], self._partial_counts.pop()
+        self._partial_counts[-1] = (tf + last_tf, df + last_df)
+
+    def update(self, documents):
+        """Count the pairs of a block of documents, each given as a sequence of token ids"""
+        lengths = np.fromiter((len(doc) for doc in documents), dtype=np.int64, count=len(documents))
+        ids = np.fromiter((token_id for doc in documents for token_id in doc), dtype=np.int64, count=int(lengths.sum()))
+        doc_of = np.repeat(np.arange(len(documents), dtype=np.int64), lengths)
+        self.nb_docs += len(documents)
+        self.token_dfs += np.bincount(np.unique(doc_of * self.nb_tokens + ids) % self.nb_tokens, minlength=self.nb_tokens)
+        firsts, seconds, docs = [], [], []
+        for distance in range(1, self.window + 1):
+            same_document = doc_of[:-distance] == doc_of[distance:]
+            firsts.append(ids[:-distance][same_document])
+            seconds.append(ids[distance:][same_document])
+            docs.append(doc_of[:-distance][same_document])
+        firsts, seconds, docs = np.concatenate(firsts), np.concatenate(seconds), np.concatenate(docs)
+        distinct = firsts != seconds
+        rows = np.concatenate([firsts[distinct], seconds[distinct]])
+        cols = np.concatenate([seconds[distinct], firsts[distinct]])
+        docs = np.concatenate([docs[distinct], docs[distinct]])
+        # a pair found multiple times in a document counts once towards its df
+        keys = np.unique((docs * self.nb_tokens + rows) * self.nb_tokens + cols) % (self.nb_tokens * self.nb_tokens)
+        self._push(self._matrix(rows, cols), self._matrix(keys // self.nb_tokens, keys % self.nb_tokens))
+
+    def _matrix(self, rows, cols):
+        return coo_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=(self.nb_tokens, self.nb_tokens)).tocsr()
+
+    @property
+    def nbytes(self):
+        return sum(nbytes(tf) + nbytes(df) for tf, df in self._partial_counts)
+
+
+class SpillingCooccurrenceCounts(CooccurrenceCounts):
+    """
+    Co-occurrence counts that are written to disk, as a run of (pair key, tf, df) rows sorted by key = first * nb_tokens + second,
+    whenever they occupy more than max_bytes; the counts in memory start over after each spill.
+    """
+    def __init__(self, nb_tokens, window, spill_dir, max_bytes):
+        super(SpillingCooccurrenceCounts, self).__init__(nb_tokens, window)
+        self.spill_dir = spill_dir
+        self.max_bytes = max_bytes
+        self.runs = []
+
+    def update(self, documents):
+        super(SpillingCooccurrenceCounts, self).update(documents)
+        if self.nbytes > self.max_bytes:
+            self.spill()
+
+    def spill(self):
+        """Write the counts in memory as a sorted run and reset them"""
+        tf, df = self.tf, self.df
+        if not tf.nnz:
+            return
+        tf.sort_indices()
+        df.sort_indices()
+        rows = np.repeat(np.arange(self.nb_tokens, dtype=np.int64), np.diff(tf.indptr))
+        run = np.column_stack([rows * self.nb_tokens + tf.indices, tf.data, df.data]).astype(np.int64)
+        run_path = os.path.join(self.spill_dir, '{}.npy'.format(uuid.uuid4()))
+        np.save(run_path, run)
+        self.runs.append(run_path)
+        self._reset()
+
+
+def blocks(documents, block_size):
+    block = []
+    for doc in documents:
+        block.append(doc)
+        if len(block) == block_size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def count_cooccurrences(documents, nb_tokens, window=5, block_size=10000):
+    """Accumulate the co-occurrence counts of the documents in blocks of block_size documents.\n
+    :param iterable documents: sequences of token ids
+    :param int nb_tokens: the size of the vocabulary
+    :param int window: the maximum distance, in positions, between two tokens counted as co-occurring
+    :rtype: CooccurrenceCounts
+    """
+    counts = CooccurrenceCounts(nb_tokens, window)
+    for block in blocks(documents, block_size):
+        counts.update(block)
+    return counts
+
+
+def count_range(task):
+    """Count the co-occurrences in a byte range of a vowpal file, spilling sorted runs in spill_dir whenever the partial counts exceed
+    max_bytes. The task is a (split, vowpal_file, vocab_file, start, end, window, spill_dir, max_bytes, block_size) tuple; returns
+    (split, run paths, token document frequencies, number of documents)"""
+    split, vowpal_file, vocab_file, start, end, window, spill_dir, max_bytes, block_size = task
+    token2id, nb_tokens = read_vocabulary(vocab_file)
+    counts = SpillingCooccurrenceCounts(nb_tokens, window, spill_dir, max_bytes)
+    for block in blocks(vowpal_token_ids(vowpal_file, token2id, start=start, end=end), block_size):
+        counts.update(block)
+    counts.spill()
+    return split, counts.runs, counts.token_dfs, counts.nb_docs
+
+
+def merge_runs(run_paths, nb_tokens, chunk_size=1 << 20):
+    """K-way merge of sorted runs of (pair key, tf, df) rows into the tf and df matrices, summing the counts of equal keys. At most
+    chunk_size rows of each run are held in memory, next to the merged output.\n
+    :rtype: tuple
+    """
+    runs = [_ for _ in (np.load(path, mmap_mode='r') for path in run_paths) if len(_)]
+    positions = [0] * len(runs)
+    keys, tfs, dfs = [], [], []
+    while True:
+        active = [i for i, run in enumerate(runs) if positions[i] < len(run)]
+        if not active:
+            break
+        # every key up to the smallest of the last keys in the next chunk of each run is in memory and can be merged
+        boundary = min(runs[i][min(positions[i] + chunk_size, len(runs[i])) - 1, 0] for i in active)
+        parts = []
+        for i in active:
+            chunk = runs[i][positions[i]:positions[i] + chunk_size]
+            end = int(np.searchsorted(chunk[:, 0], boundary, side='right'))
+            parts.append(np.asarray(chunk[:end]))
+            positions[i] += end
+        part = np.concatenate(parts)
+        merged_keys, inverse = np.unique(part[:, 0], return_inverse=True)
+        keys.append(merged_keys)
+        tfs.append(np.bincount(inverse, weights=part[:, 1]).astype(np.int64))
+        dfs.append(np.bincount(inverse, weights=part[:, 2]).astype(np.int64))
+    keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+    rows, cols = keys // nb_tokens, keys % nb_tokens
+    indptr = np.searchsorted(rows, np.arange(nb_tokens + 1))
+    return tuple(csr_matrix((np.concatenate(values) if values else np.zeros(0, dtype=np.int64), cols, indptr), shape=(nb_tokens, nb_tokens))
+                 for values in (tfs, dfs))
+
+
+def ppmi(cooc, token_counts, total):
+    """Positive pointwise mutual information of the pairs of a co-occurrence matrix; max(0, ln(n_uv * total / (n_u * n_v))).\n
+    :param scipy.sparse.csr_matrix cooc: the co-occurrence counts (n_uv)
+    :param numpy.ndarray token_counts: the count of each token (n_u)
+    :param float total: the normalizing total count
+    :return: the pairs with positive values
+    :rtype: scipy.sparse.csr_matrix
+    """
+    cooc = cooc.tocoo()
+    values = np.log(cooc.data * float(total) / (token_counts[cooc.row].astype(np.float64) * token_counts[cooc.col]))
+    positive = values > 0
+    return coo_matrix((values[positive], (cooc.row[positive], cooc.col[positive])), shape=cooc.shape).tocsr()
+
+
+def ppmi_tf(tf, min_tf=0):
+    """ppmi of the tf co-occurrences of at least min_tf, where the count of a token is the number of pairs it takes part in"""
+    token_counts = np.asarray(tf.sum(axis=1)).ravel()
+    return ppmi(at_least(tf, min_tf), token_counts, token_counts.sum())
+
+
+def ppmi_df(df, token_dfs, nb_docs, min_df=0):
+    """ppmi of the df co-occurrences of at least min_df, where the count of a token is the number of documents it appears in"""
+    return ppmi(at_least(df, min_df), token_dfs, nb_docs)
+
+
+def at_least(matrix, min_value):
+    """The entries of a sparse matrix greater or equal to min_value"""
+    matrix = matrix.tocsr(copy=True)
+    matrix.data[matrix.data < min_value] = 0
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def top_k_per_token(matrix, k):
+    """Keep the k largest values of each row (the k strongest partners of each token); ties are broken in favour of smaller ids"""
+    matrix = matrix.tocsr()
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((matrix.indices, -matrix.data, rows))
+    ranks = np.arange(len(order)) - matrix.indptr[rows[order]]
+    kept = np.sort(order[ranks < k])
+    return csr_matrix((matrix.data[kept], matrix.indices[kept], np.concatenate([[0], np.cumsum(np.bincount(rows[kept], minlength=matrix.shape[0]))])),
+                      shape=matrix.shape)
+
+
+def frequent_pairs(matrix, token_counts, min_count):
+    """Keep the pairs of tokens that both have a count (ie document frequency) of at least min_count"""
+    frequent = np.asarray(token_counts) >= min_count
+    matrix = matrix.tocoo()
+    kept = frequent[matrix.row] & frequent[matrix.col]
+    return coo_matrix((matrix.data[kept], (matrix.row[kept], matrix.col[kept])), shape=matrix.shape).tocsr()
+
+
+def nbytes(matrix):
+    """Memory held by a csr matrix"""
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+
+def write_pairs(matrix, file_path, value_format='{}'):
+    """Write the nonzero entries of a square sparse matrix in the cooc file format read by artm.Dictionary.gather: one line per token
+    with pairs, holding the token's (zero-based) id followed by the id and value of each token paired with it.\n
+    :return: the number of lines written
+    :rtype: int
+    """
+    matrix = matrix.tocsr()
+    matrix.sort_indices()
+    indptr, indices, data = matrix.indptr.tolist(), matrix.indices.tolist(), matrix.data.tolist()
+    nb_lines = 0
+    with open(file_path, 'w') as f:
+        for token_id in np.flatnonzero(np.diff(matrix.indptr)).tolist():
+            start, end = indptr[token_id], indptr[token_id + 1]
+            f.write('{} {}\n'.format(token_id, ' '.join('{} {}'.format(other, value_format.format(value)) for other, value in zip(indices[start:end], data[start:end]))))
+            nb_lines += 1
+    return nb_lines
+
+
+
+def count_files(vowpal_files, vocab_file, window=5, workers=1, max_bytes=512 * 1024 * 1024, spill_dir=None, block_size=10000):
+    """Count the co-occurrences in each of the given vowpal files (ie the train and test splits of a collection) concurrently. Each
+    file is split in line-aligned byte ranges, all of which are counted by a pool of 'workers' processes; the runs each worker spills
+    are merged per name afterwards.\n
+    :param dict vowpal_files: names mapped to vowpal file paths or to lists of paths, ie the shards of a collection, counted together
+    :param str vocab_file: the vocabulary shared by the files
+    :param int workers: the number of worker processes (and byte ranges per file)
+    :param int max_bytes: the memory budget of the partial counts of each worker, above which they are spilled to disk
+    :param str spill_dir: the directory to create the temporary directory of the runs in; the system default if not given
+    :return: the names mapped to CooccurrenceCounts
+    :rtype: dict
+    """
+    nb_tokens = read_vocabulary(vocab_file)[1]
+    spill_dir = tempfile.mkdtemp(prefix='cooc-', dir=spill_dir)
+    vowpal_files = OrderedDict((name, [paths] if isinstance(paths, str) else list(paths)) for name, paths in vowpal_files.items())
+    tasks = [(name, vowpal_file, vocab_file, start, end, window, spill_dir, max_bytes, block_size)
+             for name, paths in vowpal_files.items() for vowpal_file in paths
+             for start, end in line_aligned_ranges(vowpal_file, -(-workers // len(paths)))]
+    counts = OrderedDict((name, CooccurrenceCounts(nb_tokens, window)) for name in vowpal_files)
+    runs = {name: [] for name in vowpal_files}
+    try:
+        if workers > 1:
+            pool = Pool(processes=workers)
+            try:
+                results = list(pool.imap_unordered(count_range, tasks))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [count_range(task) for task in tasks]
+        for name, run_paths, token_dfs, nb_docs in results:
+            runs[name].extend(run_paths)
+            counts[name].token_dfs += token_dfs
+            counts[name].nb_docs += nb_docs
+        pool = ThreadPool(len(counts))
+        try:
+            merged = pool.map(lambda name: merge_runs(runs[name], nb_tokens), list(counts))
+        finally:
+            pool.close()
+            pool.join()
+        for (name, name_counts), (tf, df) in zip(counts.items(), merged):
+            name_counts.tf, name_counts.df = tf, df
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return counts
+
+
+def shift_token_ids(file_path, shift=-1, chunk_bytes=64 * 1024 * 1024):
+    """Add 'shift' to the token ids of a cooc or ppmi text file in place, ie to make the one-based ids written by the bigartm CLI
+    zero-based. On each line the first and every other field from the second on ('id id value id value ...') are ids. The file is
+    converted in chunks of whole lines, each split, shifted and joined back in bulk with numpy; the result replaces the file, without
+    keeping a backup.\n
+    :return: the number of lines rewritten
+    :rtype: int
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)))
+    nb_lines = 0
+    try:
+        with open(file_path, 'rb') as source, os.fdopen(fd, 'wb') as target:
+            while True:
+                data = source.read(chunk_bytes)
+                if not data:
+                    break
+                if not data.endswith(b'\n'):
+                    data += source.readline()
+                lines, nb_chunk_lines = _shift_ids(data, shift)
+                target.write(lines)
+                nb_lines += nb_chunk_lines
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return nb_lines
+
+
+def _shift_ids(data, shift):
+    """Shift the ids of the lines in a buffer; returns the new lines and their number"""
+    characters = np.frombuffer(data, dtype=np.uint8)
+    whitespace = np.isin(characters, np.frombuffer(b' \t\r\n', dtype=np.uint8))
+    field_starts = np.flatnonzero(~whitespace & np.concatenate([[True], whitespace[:-1]]))
+    line_of_field = np.cumsum(characters == ord('\n'))[field_starts]
+    first_in_line = np.concatenate([[True], line_of_field[1:] != line_of_field[:-1]]) if len(field_starts) else np.zeros(0, dtype=bool)
+    indices = np.arange(len(field_starts))
+    positions = indices - np.maximum.accumulate(np.where(first_in_line, indices, 0))
+    ids = (positions == 0) | (positions % 2 == 1)
+    fields = np.array(data.split(), dtype='S')
+    fields = fields.astype('S{}'.format(max(fields.dtype.itemsize, 20)))  # room for the widest int64
+    fields[ids] = (fields[ids].astype(np.int64) + shift).astype(fields.dtype)
+    separators = np.where(np.concatenate([first_in_line[1:], [True]]), b'\n', b' ')
+    return b''.join(np.char.add(fields, separators).tolist()), int(first_in_line.sum())
+
+
+def load_cooc_dictionary(name, data_path, cooc_file_path, vocab_file_path, symmetric_cooc_values=True):
+    """An artm.Dictionary with the co-occurrence values of a cooc or ppmi text file. The first time, the dictionary is gathered from
+    the text files and saved in BigARTM's binary form next to the cooc file (ie ppmi_0_tf.dict); later calls load the binary file,
+    skipping the parsing, as long as the cooc and vocabulary files and the batches in data_path are unchanged. A .json file next to
+    the binary one records the sizes and modification times of the sources it was gathered from.\n
+    :param str name: the name of the dictionary
+    :param str data_path: the directory to gather batches from (see artm.Dictionary.gather)
+    :rtype: artm.Dictionary
+    """
+    import artm
+    binary_path = os.path.splitext(cooc_file_path)[0] + '.dict'
+    signature_path = binary_path + '.json'
+    signature = _sources_signature(data_path, cooc_file_path, vocab_file_path, symmetric_cooc_values)
+    dictionary = artm.Dictionary(name=name)
+    if os.path.isfile(binary_path) and os.path.isfile(signature_path):
+        with open(signature_path) as f:
+            if json.load(f) == signature:
+                dictionary.load(binary_path)
+                return dictionary
+    dictionary.gather(data_path=data_path, cooc_file_path=cooc_file_path, vocab_file_path=vocab_file_path,
+                      symmetric_cooc_values=symmetric_cooc_values)
+    for path in (signature_path, binary_path):  # the signature goes first, so that a partially saved dictionary is never trusted
+        if os.path.isfile(path):
+            os.remove(path)
+    dictionary.save(binary_path)
+    with open(signature_path, 'w') as f:
+        json.dump(signature, f)
+    return dictionary
+
+
+def _sources_signature(data_path, cooc_file_path, vocab_file_path, symmetric_cooc_values):
+    def stat(path):
+        info = os.stat(path)
+        return [os.path.basename(path), info.st_size, info.st_mtime_ns]
+    batches = sorted(os.path.join(data_path, _) for _ in os.listdir(data_path) if _.endswith('.batch'))
+    return {'cooc': stat(cooc_file_path), 'vocab': stat(vocab_file_path), 'batches': [stat(_) for _ in batches],
+            'symmetric_cooc_values': symmetric_cooc_values}
@@ -0,0 +1,360 @@
+import io
+import os
+import shutil
+import tempfile
+import weakref
+from array import array
+from itertools import islice
+from collections import Counter
+import attr
+import numpy as np
+
+
+@attr.s(repr=True)
+class CorpusStats(object):
+    """Statistics of a bag-of-words corpus, computed with array reductions"""
+    nb_docs = attr.ib()
+    num_pos = attr.ib()  # number of word positions; the sum of all counts
+    num_nnz = attr.ib()  # number of (token_id, count) pairs
+    empty_docs = attr.ib()
+
+    @classmethod
+    def from_arrays(cls, indptr, counts):
+        lengths = np.diff(indptr)
+        return cls(len(lengths), int(counts.sum(dtype=np.int64)), int(indptr[-1]), int(np.count_nonzero(lengths == 0)))
+
+    def __str__(self):
+        return "BOW-MODEL:\nnumber of word position (num_pos): {}\ntotal number of tuples (num_nnz): {}\n number of docs: {}\nempty docs: {}".format(
+            self.num_pos, self.num_nnz, self.nb_docs, self.empty_docs)
+
+
+class BaseBowCorpus(object):
+    """A bag-of-words corpus in 'compressed sparse row' layout: the (token_id, count) pairs of all documents are stored in two flat
+    arrays and a third one holds the offsets where each document starts. Iterating yields each document as a list of
+    (token_id, count) tuples, like a gensim corpus does. Subclasses hold the arrays in memory or on disk.
+    """
+    block_size = 10000  # number of documents to convert to lists at once
+
+    def __len__(self):
+        return len(self.arrays[0]) - 1
+
+    @property
+    def nnz(self):
+        """Total number of (token_id, count) pairs in the corpus"""
+        return int(self.arrays[0][-1])
+
+    @property
+    def arrays(self):
+        """The (indptr, indices, counts) arrays"""
+        raise NotImplementedError
+
+    @property
+    def stats(self):
+        """
+        :rtype: CorpusStats
+        """
+        indptr, _, counts = self.arrays
+        return CorpusStats.from_arrays(indptr, counts)
+
+    def __iter__(self):
+        return self.documents()
+
+    def documents(self, start=0, end=None):
+        """Iterate over the documents with index in [start, end), a block at a time"""
+        end = len(self) if end is None else min(end, len(self))
+        indptr, indices, counts = self.arrays
+        for block_start in range(start, end, self.block_size):
+            offsets = indptr[block_start:min(block_start + self.block_size, end) + 1].tolist()
+            for first, last in zip(offsets[:-1], offsets[1:]):
+                yield list(zip(indices[first:last].tolist(), counts[first:last].tolist()))
+
+
+class BowCorpus(BaseBowCorpus):
+    """A bag-of-words corpus held in memory; documents are appended to compact buffers, which the arrays share once read. Documents
+    can not be added while the arrays are in use"""
+
+    def __init__(self):
+        self._buffers = (array('q', [0]), array('I'), array('I'))
+        self._arrays = None
+
+    def __len__(self):
+        return len(self._buffers[0]) - 1
+
+    @property
+    def nnz(self):
+        return self._buffers[0][-1]
+
+    def append(self, token_ids, counts):
+        """Add a document given its token ids (sorted ascending) and their corresponding counts"""
+        self._buffers[1].extend(token_ids)
+        self._buffers[2].extend(counts)
+        self._buffers[0].append(len(self._buffers[1]))
+        self._arrays = None
+
+    def extend(self, lengths, token_ids, counts):
+        """Add consecutive documents given the number of tokens of each one and their token ids and counts, concatenated"""
+        self._buffers[1].frombytes(np.asarray(token_ids, dtype=np.uint32).tobytes())
+        self._buffers[2].frombytes(np.asarray(counts, dtype=np.uint32).tobytes())
+        self._buffers[0].frombytes((self._buffers[0][-1] + np.cumsum(lengths, dtype=np.int64)).tobytes())
+        self._arrays = None
+
+    def close(self):
+        pass
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = tuple(np.frombuffer(buffer, dtype=dtype) if len(buffer) else np.zeros(0, dtype=dtype)
+                                 for buffer, dtype in zip(self._buffers, (np.int64, np.uint32, np.uint32)))
+        return self._arrays
+
+
+class DiskBowCorpus(BaseBowCorpus):
+    """A bag-of-words corpus stored on disk and memory-mapped when read"""
+
+    def __init__(self, directory=None):
+        """
+        :param str directory: the directory to store the arrays in. If not given a temporary directory is created, which is deleted
+            along with the corpus object
+        """
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='tmtk-corpus-')
+            self._finalizer = weakref.finalize(self, shutil.rmtree, directory, True)
+        self.directory = directory
+        self._paths = {name: os.path.join(directory, '{}.bin'.format(name)) for name in ('indptr', 'indices', 'counts')}
+        self._dtypes = {'indptr': np.int64, 'indices': np.uint32, 'counts': np.uint32}
+        self._handlers = {name: open(path, 'wb') for name, path in self._paths.items()}
+        np.zeros(1, dtype=np.int64).tofile(self._handlers['indptr'])
+        self._nnz = 0
+        self._nb_docs = 0
+        self._arrays = None
+
+    def __len__(self):
+        return self._nb_docs
+
+    @property
+    def nnz(self):
+        return self._nnz
+
+    def append(self, token_ids, counts):
+        """Add a document given its token ids (sorted ascending) and their corresponding counts"""
+        self.extend([len(token_ids)], token_ids, counts)
+
+    def extend(self, lengths, token_ids, counts):
+        """Add consecutive documents given the number of tokens of each one and their token ids and counts, concatenated"""
+        np.asarray(token_ids, dtype=np.uint32).tofile(self._handlers['indices'])
+        np.asarray(counts, dtype=np.uint32).tofile(self._handlers['counts'])
+        (self._nnz + np.cumsum(lengths, dtype=np.int64)).tofile(self._handlers['indptr'])
+        self._nnz += int(np.sum(lengths, dtype=np.int64))
+        self._nb_docs += len(lengths)
+
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+
+    @property
+    def arrays(self):
+        """The (indptr, indices, counts) arrays, memory-mapped from disk"""
+        if self._arrays is None:
+            self.close()
+            self._arrays = tuple(self._load(name) for name in ('indptr', 'indices', 'counts'))
+        return self._arrays
+
+    def _load(self, name):
+        if os.path.getsize(self._paths[name]) == 0:
+            return np.zeros(0, dtype=self._dtypes[name])
+        return np.memmap(self._paths[name], dtype=self._dtypes[name], mode='r')
+
+
+def remap_bow_corpus(bow_corpus, id_map, target, sort=False):
+    """Map the token ids of a corpus through id_map, dropping the tokens mapped to a negative id and then the documents left without
+    tokens. Works on a block of documents at a time, with array operations.\n
+    :param BaseBowCorpus bow_corpus: the corpus to remap
+    :param list id_map: the new id of each token id, or -1 to drop the token
+    :param BaseBowCorpus target: an empty corpus to add the remapped documents to
+    :param bool sort: whether to sort the pairs of each document by their new token id; needed unless id_map preserves the order of
+        the ids it keeps
+    :return: the target corpus and a boolean array marking the documents that were kept
+    :rtype: tuple
+    """
+    id_map = np.asarray(id_map, dtype=np.int64)
+    indptr, indices, counts = bow_corpus.arrays
+    kept_docs = []
+    for block_start in range(0, len(bow_corpus), bow_corpus.block_size):
+        offsets = indptr[block_start:block_start + bow_corpus.block_size + 1]
+        block_ids = id_map[indices[offsets[0]:offsets[-1]]] if len(id_map) else np.zeros(0, dtype=np.int64)
+        kept = block_ids >= 0
+        doc_of_pair = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        lengths = np.bincount(doc_of_pair[kept], minlength=len(offsets) - 1)
+        block_ids, block_counts = block_ids[kept], counts[offsets[0]:offsets[-1]][kept]
+        if sort:
+            order = np.lexsort((block_ids, doc_of_pair[kept]))
+            block_ids, block_counts = block_ids[order], block_counts[order]
+        target.extend(lengths[lengths > 0], block_ids, block_counts)
+        kept_docs.append(lengths > 0)
+    target.close()
+    return target, np.concatenate(kept_docs) if kept_docs else np.zeros(0, dtype=bool)
+
+
+class CsrCorpus(object):
+    """A bag-of-words corpus persisted along with a dataset as .npy arrays in 'compressed sparse row' layout and loaded memory-mapped,
+    so that statistics can be computed and other formats exported without parsing the text (uci/vowpal) files. The arrays are:\n
+    - indptr: where the (token_id, count) pairs of each document start; document i spans [indptr[i], indptr[i+1])
+    - indices: the token ids of all documents
+    - counts: the (raw) counts of the tokens of all documents
+    - labels: the index in 'label_names' of the class label of each document
+    - label_names: the distinct class labels
+    - vocab_offsets: the byte offset of each token's line in the vocabulary file, followed by the offset where the tokens end
+    """
+    names = ('indptr', 'indices', 'counts', 'labels', 'label_names', 'vocab_offsets')
+    dtypes = {'indptr': np.int64, 'indices': np.uint32, 'counts': np.uint32, 'labels': np.int32, 'vocab_offsets': np.int64}
+
+    def __init__(self, directory, vocab_file):
+        """
+        :param str directory: the directory with the .npy arrays
+        :param str vocab_file: the vocabulary file of the dataset
+        """
+        self.directory = directory
+        self.vocab_file = vocab_file
+        self._arrays = {name: np.load(self._path(directory, name), mmap_mode='r') for name in self.names}
+        self._vocab = None
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __iter__(self):
+        for start, end in zip(self.indptr[:-1].tolist(), self.indptr[1:].tolist()):
+            yield list(zip(self.indices[start:end].tolist(), self.counts[start:end].tolist()))
+
+    def __getattr__(self, name):
+        if name in self.names:
+            return self._arrays[name]
+        raise AttributeError(name)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    @property
+    def matrix(self):
+        """The corpus as a (documents x tokens) scipy.sparse.csr_matrix of counts, sharing the memory-mapped arrays"""
+        from scipy.sparse import csr_matrix
+        return csr_matrix((self.counts, self.indices, self.indptr), shape=(len(self), len(self.vocab_offsets) - 1))
+
+    def token(self, token_id):
+        """The line of the vocabulary file at the given token id, read through a memory-map of the file"""
+        if self._vocab is None:
+            self._vocab = np.memmap(self.vocab_file, dtype=np.uint8, mode='r')
+        return self._vocab[self.vocab_offsets[token_id]:self.vocab_offsets[token_id + 1] - 1].tobytes().decode('utf-8')
+
+    def class_distribution(self):
+        """Returns the number of documents per class label and the number of documents"""
+        return Counter(dict(zip(self.label_names.tolist(), np.bincount(self.labels, minlength=len(self.label_names)).tolist()))), len(self)
+
+    @classmethod
+    def exists(cls, directory):
+        return all(os.path.isfile(cls._path(directory, name)) for name in cls.names)
+
+    @classmethod
+    def save(cls, directory, bow_corpus, labels, vocab_file, nb_tokens):
+        """Store a bag-of-words corpus and load it memory-mapped.\n
+        :param str directory: the directory to store the arrays in; created if missing
+        :param bow_corpus: a list of documents, each a list of (token_id, count) tuples sorted by token id, or a BaseBowCorpus
+        :param list labels: the class label of each document
+        :param str vocab_file: the vocabulary file of the dataset
+        :param int nb_tokens: the number of tokens in the vocabulary file; the lines that follow them (ie class labels) are not indexed
+        :return: the stored corpus
+        :rtype: CsrCorpus
+        """
+        indptr, indices, counts = _bow_arrays(bow_corpus)
+        label_names = sorted(set(labels))
+        label2index = {label: index for index, label in enumerate(label_names)}
+        labels = np.array([label2index[label] for label in labels], dtype=np.int32)
+        with open(vocab_file, 'rb') as f:
+            vocab_offsets = np.cumsum([0] + [len(line) for line in islice(f, nb_tokens)], dtype=np.int64)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        arrays = dict(zip(cls.names, (indptr, indices, counts, labels, np.array(label_names, dtype=str), vocab_offsets)))
+        for name in cls.names:
+            cls._write(directory, name, arrays[name])
+        return cls(directory, vocab_file)
+
+    def append(self, bow_corpus, labels, nb_tokens):
+        """Add documents after the stored ones and index the tokens added to the end of the vocabulary file. The arrays are grown in
+        place (see append_to_npy), so the cost is proportional to the added documents and tokens; class labels not seen before get
+        the next indices.\n
+        :param bow_corpus: a list of documents, each a list of (token_id, count) tuples sorted by token id, or a BaseBowCorpus
+        :param list labels: the class label of each added document
+        :param int nb_tokens: the number of tokens in the vocabulary file, including the ones already indexed
+        :return: the corpus, loaded with the added documents
+        :rtype: CsrCorpus
+        """
+        indptr, indices, counts = _bow_arrays(bow_corpus)
+        label_names = self.label_names.tolist()
+        label_names.extend(sorted(set(labels) - set(label_names)))
+        label2index = {label: index for index, label in enumerate(label_names)}
+        tokens_end = int(self.vocab_offsets[-1])
+        with open(self.vocab_file, 'rb') as f:
+            f.seek(tokens_end)
+            vocab_offsets = tokens_end + np.cumsum([len(line) for line in islice(f, nb_tokens - (len(self.vocab_offsets) - 1))], dtype=np.int64)
+        for name, values in (('indptr', int(self.indptr[-1]) + indptr[1:]), ('indices', indices), ('counts', counts),
+                             ('labels', [label2index[label] for label in labels]), ('vocab_offsets', vocab_offsets)):
+            append_to_npy(self._path(self.directory, name), values)
+        if len(label_names) > len(self.label_names):
+            self._write(self.directory, 'label_names', np.array(label_names, dtype=str))
+        return type(self)(self.directory, self.vocab_file)
+
+    @classmethod
+    def _write(cls, directory, name, values):
+        """Write a new file and swap it in place, since the existing one might be memory-mapped"""
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.asarray(values, dtype=cls.dtypes.get(name)))
+        os.replace(tmp_path, cls._path(directory, name))
+
+    @staticmethod
+    def _path(directory, name):
+        return os.path.join(directory, '{}.npy'.format(name))
+
+
+def _bow_arrays(bow_corpus):
+    """The (indptr, indices, counts) arrays of a BaseBowCorpus or of a list of documents, each a list of (token_id, count) tuples"""
+    if isinstance(bow_corpus, BaseBowCorpus):
+        return bow_corpus.arrays
+    indptr = np.cumsum([0] + [len(doc) for doc in bow_corpus], dtype=np.int64)
+    indices = np.fromiter((token_id for doc in bow_corpus for token_id, _ in doc), dtype=np.uint32, count=int(indptr[-1]))
+    counts = np.fromiter((count for doc in bow_corpus for _, count in doc), dtype=np.uint32, count=int(indptr[-1]))
+    return indptr, indices, counts
+
+
+def append_to_npy(path, values):
+    """Append values to the one-dimensional array of a .npy file in place. They are written after the stored ones before the length in
+    the header is updated, so that readers (ie memory-maps) of the file keep seeing a valid array. The header is rewritten in the space
+    it takes, which numpy pads so that the length can grow; if the new one does not fit (ie a file written by an old numpy), the whole
+    file is rewritten instead.\n
+    :param str path: the .npy file
+    :param values: the values to append, cast to the dtype of the stored array
+    """
+    with open(path, 'rb+') as f:
+        version = np.lib.format.read_magic(f)
+        if version in ((1, 0), (2, 0)):
+            read_header, write_header = {(1, 0): (np.lib.format.read_array_header_1_0, np.lib.format.write_array_header_1_0),
+                                         (2, 0): (np.lib.format.read_array_header_2_0, np.lib.format.write_array_header_2_0)}[version]
+            (length,), fortran_order, dtype = read_header(f)
+            data_offset = f.tell()
+            values = np.asarray(values, dtype=dtype)
+            header = io.BytesIO()
+            write_header(header, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': fortran_order, 'shape': (length + len(values),)})
+            if len(header.getvalue()) == data_offset:
+                f.seek(data_offset + length * dtype.itemsize)
+                f.write(values.tobytes())
+                f.truncate()
+                f.flush()
+                f.seek(0)
+                f.write(header.getvalue())
+                return
+    stored = np.load(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npy')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, np.concatenate([stored, np.asarray(values, dtype=stored.dtype)]))
+    os.replace(tmp_path, path)
@@ -1,4 +1,7 @@
 import os
+import json
+from .corpus import CsrCorpus
+from .definitions import CSR_CORPUS_DIR_NAME
 
 import sys
 if sys.version_info[0] < 3:
@@ -15,9 +18,9 @@ class TextDataset(object):
         :param int nb_docs:
         :param int unique_words:
         :param int nb_words:
-        :param str weights_file: full path to a uci docwords (Bag of Words) file: */docword.name.txt
+        :param str weights_file: full path to a uci docwords (Bag of Words) file: */docword.name.txt; None when written in shards
         :param str words_file: full path to the uci vocabulary file: */vocab.name.txt
-        :param str vowpal_file: full path to a Vowpal formatted (Bag of Words) file: */vowpal.name.txt
+        :param str vowpal_file: full path to a Vowpal formatted (Bag of Words) file: */vowpal.name.txt; None when written in shards
         """
         self.name = name
         self.id = _id
@@ -32,12 +35,39 @@ class TextDataset(object):
                 "Please set the COLLECTIONS_DIR environment variable with the path to a directory containing collections/datasets")
         self.root_dir = os.path.join(collections_dir, self.name)
         self.vowpal = vowpal_file
+        self.manifest = None  # path to the json file listing the shard files, when the dataset is written in shards
         # self.splits = None
         # self.datapoints = dict([(tag, {}) for tag in split_tags])
 
     def __str__(self):
         return '{}: {}\ndocs: {}\nunique: {}\nbows: {}'.format(self.name, self.id, self._col_len, self._unique_words, self._nb_bows)
 
+    @property
+    def corpus(self):
+        """The bag-of-words of the documents as memory-mapped arrays; None if the dataset was persisted without them\n
+        :rtype: patm.corpus.CsrCorpus
+        """
+        dataset_dir = os.path.dirname(self.path) if hasattr(self, 'path') else self.root_dir
+        directory = os.path.join(dataset_dir, CSR_CORPUS_DIR_NAME)
+        if not CsrCorpus.exists(directory):
+            return None
+        return CsrCorpus(directory, os.path.join(dataset_dir, os.path.basename(self.words)))
+
+    @property
+    def uci_files(self):
+        """The docword file of the dataset or, for a sharded dataset, its docword shards in the order of their documents"""
+        return self._files('uci', self.bowf)
+
+    @property
+    def vowpal_files(self):
+        """The vowpal file of the dataset or, for a sharded dataset, its vowpal shards in the order of their documents"""
+        return self._files('vowpal', self.vowpal)
+
+    def _files(self, file_format, single_file):
+        if not getattr(self, 'manifest', None):
+            return [single_file]
+        return [os.path.join(os.path.dirname(self.manifest), shard[file_format]) for shard in read_manifest(self.manifest)['shards'] if file_format in shard]
+
     @property
     def unigue(self):
         return self._unique_words
@@ -63,3 +93,24 @@ class TextDataset(object):
         except RuntimeError as e:
             print(e)
             print("Failed to save dataset wtih id '{}'".format(self.id))
+
+
+def manifest_path(dataset_dir):
+    """The path of the manifest listing the shards of a dataset (see PipeHandler.pipe_through_shard_writers)"""
+    return os.path.join(dataset_dir, 'manifest.{}.json'.format(os.path.basename(os.path.normpath(dataset_dir))))
+
+
+def read_manifest(path):
+    """The manifest of a sharded dataset: its collection, number of documents, vocabulary file and the list of its shards, each with
+    its 'uci' and 'vowpal' file names (relative to the dataset directory), 'first_doc_num', 'nb_docs' and 'nb_bows'
+
+    :param str path: the manifest file or the dataset directory
+    :return: the manifest; None if the dataset directory holds no manifest (ie the dataset is not sharded)
+    :rtype: dict
+    """
+    if os.path.isdir(path):
+        path = manifest_path(path)
+        if not os.path.isfile(path):
+            return None
+    with open(path) as f:
+        return json.load(f)
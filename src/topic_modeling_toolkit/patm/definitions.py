@@ -33,6 +33,8 @@ COOCURENCE_DICT_FILE_NAMES = ['cooc_tf_', 'cooc_df_', 'ppmi_tf_', 'ppmi_df_']
 
 ###### CONSTANTS #####
 BINARY_DICTIONARY_NAME = 'mydic.dict'
+BATCHES_DIR_NAMES = {True: 'vow-batches', False: 'uci-batches'}  # the BigARTM batches folder of a dataset, with or without the class labels
+CSR_CORPUS_DIR_NAME = 'csr'  # directory in a dataset holding the bag-of-words as .npy arrays (see patm.corpus.CsrCorpus)
 
 ############## IDEOLOGY INFORMATION ##############
 #
@@ -1,6 +1,7 @@
 import sys
 import os
 import pandas as pd
+from collections import OrderedDict
 
 from topic_modeling_toolkit.patm.definitions import CATEGORY_2_FILES_HASH
 from topic_modeling_toolkit.processors.mutators import StringToFieldsGenerator
@@ -46,20 +47,85 @@ def gen_fields(category, cat2files, sample_docs=None, fields=tuple('text')):
     :param dict cat2files: mapping of categories [posts, comments] to their corresponding files: string -> list of strings mapping
     :param int sample_docs: Specifies the maximun number of items to generate. If not specified generates till depletion
     :param tuple fields: the fields of interest to include in the generated dictionaries
+
+    Each generated dictionary also holds the 'index' of the document and the 'source' file it was read from.
+    """
+    for chunk in gen_field_chunks(category, cat2files, sample_docs=sample_docs, fields=fields):
+        for fields_dict in chunk:
+            yield fields_dict
+
+
+def gen_field_chunks(category, cat2files, sample_docs=None, fields=tuple('text'), chunk_size=10000):
+    """
+    Generates lists of (at most 'chunk_size') dictionaries with the requested fields of consecutive documents. Only the requested
+    columns are extracted from each file, as whole arrays, instead of building a pandas Series per document. Pickled DataFrames
+    (.pkl), Parquet (.parquet) and Feather/Arrow (.feather, .arrow) files are supported; the latter two are read column-selectively
+    and memory-mapped (requires the 'pyarrow' package).\n
+    :param str category: The category of files to consider [posts, comments, posts+comments]. Currently supports only posts
+    :param dict cat2files: mapping of categories [posts, comments] to their corresponding files: string -> list of strings mapping
+    :param int sample_docs: Specifies the maximun number of items to generate. If not specified generates till depletion
+    :param tuple fields: the fields of interest to include in the generated dictionaries
+    :param int chunk_size: the maximum number of dictionaries per generated list
     """
     total_docs = 0
     full_docs = 0
     for cat in category.split('+'):
-        for fi, pickle_file in enumerate(cat2files[cat]):
-            print('{}: Working with \'{}\' file'.format(fi, pickle_file))
-            for index, df_entry in pd.read_pickle(pickle_file).iterrows():
-                if sample_docs and total_docs >= sample_docs:
-                    break
-                try:
-                    dd = dict({fld: df_entry[fld] for fld in fields}, **{'index': index})
-                    yield dd
-                    full_docs += 1
-                except KeyError:
-                    yield {'text': df_entry['text'], 'index': index}
-                total_docs += 1
+        for fi, data_file in enumerate(cat2files[cat]):
+            if sample_docs and total_docs >= sample_docs:
+                break
+            print('{}: Working with \'{}\' file'.format(fi, data_file))
+            index, columns = read_columns(data_file, fields)
+            if sample_docs:
+                index = index[:sample_docs - total_docs]
+            names = list(columns.keys())
+            if len(names) == len(fields):
+                full_docs += len(index)
+            total_docs += len(index)
+            values = [columns[name] for name in names]
+            for start in range(0, len(index), chunk_size):
+                yield [dict(zip(names, row[1:]), index=row[0], source=data_file)
+                       for row in zip(index[start:start + chunk_size], *(column[start:start + chunk_size] for column in values))]
     print('Yielded {} documents, with {} full'.format(total_docs, full_docs))
+
+
+def read_columns(data_file, fields):
+    """
+    Reads the index and the requested columns of a file holding a DataFrame. If any of the fields is missing only the 'text' column is read.\n
+    :param str data_file: path to a .pkl, .parquet, .feather or .arrow file
+    :param tuple fields: the columns to read
+    :return: the index values and a dictionary mapping each column read to a list of its values
+    :rtype: tuple
+    """
+    extension = os.path.splitext(data_file)[1]
+    if extension in ('.parquet', '.feather', '.arrow'):
+        try:
+            import pyarrow.parquet
+            import pyarrow.feather
+        except ImportError:
+            raise ImportError("Reading '{}' files requires the 'pyarrow' package".format(extension))
+        available = set(_schema_names(data_file, extension))
+        columns = list(fields) if all(field in available for field in fields) else ['text']
+        if extension == '.parquet':
+            table = pyarrow.parquet.read_table(data_file, columns=columns, memory_map=True, use_pandas_metadata=True)
+        else:
+            table = pyarrow.feather.read_table(data_file, columns=columns, memory_map=True)
+        df = table.to_pandas()
+    else:
+        df = pd.read_pickle(data_file)
+        columns = list(fields) if all(field in df.columns for field in fields) else ['text']
+    return df.index.tolist(), OrderedDict((column, df[column].tolist()) for column in columns)
+
+
+def _schema_names(data_file, extension):
+    """The column names of a parquet or feather (arrow) file, read from its schema without loading any column"""
+    import pyarrow
+    if extension == '.parquet':
+        import pyarrow.parquet
+        return pyarrow.parquet.read_schema(data_file, memory_map=True).names
+    import pyarrow.ipc
+    try:
+        with pyarrow.memory_map(data_file) as source:
+            return pyarrow.ipc.open_file(source).schema.names
+    except pyarrow.ArrowInvalid:  # a legacy (version 1) feather file is not an arrow ipc file; memory mapping it reads no column data
+        import pyarrow.feather
+        return pyarrow.feather.read_table(data_file, memory_map=True).column_names
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 import os
 import re
+import shutil
+import tempfile
+from multiprocessing.pool import ThreadPool
 
 import artm
 
+from topic_modeling_toolkit.patm.definitions import BATCHES_DIR_NAMES
+from topic_modeling_toolkit.patm.dataset import read_manifest
+from topic_modeling_toolkit.patm.cooccurrence import load_cooc_dictionary
+from topic_modeling_toolkit.processors.processor import compression_extensions, file_compression, decompress
 from .regularization.trajectory import get_fit_iteration_chunks
 from .model_factory import ModelFactory
 
@@ -109,7 +116,8 @@ class TrainerFactory(object):
         return cls.__instance
 
     ideology_flag2data_format = {True: 'vowpal_wabbit', False: 'bow_uci'}
-    ideology_flag2batches_dir_name = {True: 'vow-batches', False: 'uci-batches'}
+    ideology_flag2file_prefix = {True: 'vowpal', False: 'docword'}
+    ideology_flag2batches_dir_name = BATCHES_DIR_NAMES  # PipeHandler can write the batches directly (see the 'artm_batch_size' setting)
 
     def create_trainer(self, collection, exploit_ideology_labels=True, force_new_batches=False):
         """
@@ -126,13 +134,11 @@ class TrainerFactory(object):
         self._batches_dir_name = self.ideology_flag2batches_dir_name[exploit_ideology_labels]
         self._batches_target_dir = os.path.join(self._root_dir, self._batches_dir_name)
 
-        self._data_path_hash = {True: os.path.join(self._root_dir, 'vowpal.'+self._col+'.txt'), False: self._root_dir}
+        self._vocab = os.path.join(self._root_dir, 'vocab.' + self._col + '.txt')
         for _ in [self._root_dir, self._batches_target_dir]:
             if not os.path.exists(_):
                 os.makedirs(_)
-        bin_dict = os.path.join(self._root_dir, 'mydic.dict')
-        text_dict = os.path.join(self._root_dir, 'mydic.txt')
-        vocab = os.path.join(self._root_dir, 'vocab.' + self._col + '.txt')
+        vocab = self._vocab
 
         existing_batches = [_ for _ in os.listdir(self._batches_target_dir) if '.batch' in _]
         if not force_new_batches and existing_batches:
@@ -145,11 +151,10 @@ class TrainerFactory(object):
             name = os.path.basename(fname)
             matc = re.match(r'^ppmi_(\d+)_([td]f)\.txt$', name)
             if matc:
-                self._mod_tr.ppmi_dicts[matc.group(2)] = {'obj': artm.Dictionary(name=name), 'min': int(matc.group(1))}
-                self._mod_tr.ppmi_dicts[matc.group(2)]['obj'].gather(data_path=self._root_dir,
-                                                                     cooc_file_path=os.path.join(self._root_dir, name),
-                                                                     vocab_file_path=vocab,
-                                                                     symmetric_cooc_values=True)
+                # gathered from the text file once; later loaded from the binary dictionary saved next to it
+                self._mod_tr.ppmi_dicts[matc.group(2)] = {'obj': load_cooc_dictionary(name, self._root_dir, os.path.join(self._root_dir, name),
+                                                                                      vocab, symmetric_cooc_values=True),
+                                                          'min': int(matc.group(1))}
                 print("Loaded positive pmi dictionary with min_{} = {} from '{}' text file".format(matc.group(2), matc.group(1), name))
         if not 'tf' in self._mod_tr.ppmi_dicts:
             raise RuntimeError("Key 'tf' should be in the coocurrences dictionaries hash: Instead these is the hash: [{}]".format('{}: {}'.format(k, v) for k,v in self._mod_tr.ppmi_dicts.items()))
@@ -157,24 +162,71 @@ class TrainerFactory(object):
         ##### DECIDE HOW TO COMPUTE PPMI
         self._mod_tr.dictionary = self._mod_tr.ppmi_dicts['tf']['obj']
 
-        # if os.path.exists(bin_dict):
-        #     self._mod_tr.dictionary.load(bin_dict)
-        #     print 'Loaded binary dictionary', bin_dict
-        # else:
-        #     self._mod_tr.dictionary.save(bin_dict)
-        #     self._mod_tr.dictionary.save_text(text_dict, encoding='utf-8')
-        #     print 'Saved binary dictionary as', bin_dict
-        #     print 'Saved textual dictionary as', text_dict
-
         return self._mod_tr
 
     def create_batches(self, use_ideology_information=False):
-        self._mod_tr.batch_vectorizer = artm.BatchVectorizer(collection_name=self._col,
-                                                               data_path=self._data_path_hash[use_ideology_information],
-                                                               data_format=self.ideology_flag2data_format[use_ideology_information],
-                                                               target_folder=self._batches_target_dir)
+        manifest = read_manifest(self._root_dir)
+        if manifest:
+            self.create_batches_from_shards(manifest, use_ideology_information=use_ideology_information)
+            return
+        self._mod_tr.batch_vectorizer = self._vectorize(self._collection_file(self.ideology_flag2file_prefix[use_ideology_information]),
+                                                        use_ideology_information, self._batches_target_dir)
         print("Vectorizer initialized from '{}' file".format(self.ideology_flag2data_format[use_ideology_information]))
 
+    def _collection_file(self, prefix):
+        """The path of the vowpal or docword file of the collection, which may be compressed (see the 'compression' setting)"""
+        candidates = [os.path.join(self._root_dir, '{}.{}.txt{}'.format(prefix, self._col, extension)) for extension in [''] + sorted(compression_extensions.values())]
+        return next((_ for _ in candidates if os.path.isfile(_)), candidates[0])
+
+    def _vectorize(self, data_file, use_ideology_information, target_folder):
+        """Parse a vowpal or a uci (docword) file into batches in the target folder. artm reads plain files only, with a uci file
+        found next to the vocabulary under the names of the collection; so a compressed file is first decompressed in a temporary
+        directory, where a uci file is joined by a link to the vocabulary"""
+        data_format = self.ideology_flag2data_format[use_ideology_information]
+        if not file_compression(data_file):
+            if use_ideology_information:
+                return artm.BatchVectorizer(collection_name=self._col, data_path=data_file, data_format=data_format, target_folder=target_folder)
+            if os.path.basename(data_file) == 'docword.{}.txt'.format(self._col):
+                return artm.BatchVectorizer(collection_name=self._col, data_path=os.path.dirname(data_file), data_format=data_format, target_folder=target_folder)
+        staging_dir = tempfile.mkdtemp(prefix='vectorizer-', dir=self._root_dir)
+        try:
+            staged_file = os.path.join(staging_dir, '{}.{}.txt'.format(self.ideology_flag2file_prefix[use_ideology_information], self._col))
+            if file_compression(data_file):
+                decompress(data_file, staged_file)
+            else:
+                os.symlink(os.path.abspath(data_file), staged_file)
+            if use_ideology_information:
+                return artm.BatchVectorizer(collection_name=self._col, data_path=staged_file, data_format=data_format, target_folder=target_folder)
+            os.symlink(os.path.abspath(self._vocab), os.path.join(staging_dir, os.path.basename(self._vocab)))
+            return artm.BatchVectorizer(collection_name=self._col, data_path=staging_dir, data_format=data_format, target_folder=target_folder)
+        finally:
+            shutil.rmtree(staging_dir)
+
+    def create_batches_from_shards(self, manifest, use_ideology_information=False):
+        """Parse the vowpal (or uci) shards listed in the manifest of a sharded dataset concurrently, each one into batches of its own
+        folder, and gather all batches in the batches folder, prefixed by the shard index. Each shard is parsed as a collection of its
+        own, so the ids of its items are shifted by the number of documents in the preceding shards, as if parsed from a single file.\n
+        :param dict manifest: the manifest of the dataset (see patm.dataset.read_manifest)
+        """
+        file_format = 'vowpal' if use_ideology_information else 'uci'
+        shards = manifest['shards']
+        if not all(file_format in shard for shard in shards):
+            raise ValueError("The dataset in '{}' was not written in {} shards".format(self._root_dir, file_format))
+        shard_dirs = [os.path.join(self._batches_target_dir, '{:03d}'.format(index)) for index in range(len(shards))]
+        pool = ThreadPool(min(len(shards), os.cpu_count() or 1))
+        pool.map(lambda x: self._vectorize(os.path.join(self._root_dir, x[0][file_format]), use_ideology_information, x[1]), zip(shards, shard_dirs))
+        pool.close()
+        pool.join()
+        for index, (shard, shard_dir) in enumerate(zip(shards, shard_dirs)):
+            for name in os.listdir(shard_dir):
+                if name.endswith('.batch'):
+                    batch_file = os.path.join(self._batches_target_dir, '{:03d}_{}'.format(index, name))
+                    os.rename(os.path.join(shard_dir, name), batch_file)
+                    if shard['first_doc_num'] > 1:
+                        _shift_item_ids(batch_file, shard['first_doc_num'] - 1)
+            shutil.rmtree(shard_dir)
+        self.load_batches([_ for _ in os.listdir(self._batches_target_dir) if '.batch' in _])
+
     def load_batches(self, batch_files_list):
         self._mod_tr.batch_vectorizer = artm.BatchVectorizer(collection_name=self._col,
                                                        data_path=self._batches_target_dir,
@@ -182,6 +234,18 @@ class TrainerFactory(object):
         print("Vectorizer initialized from [{}] 'batch' files found in '{}'".format(', '.join(batch_files_list), self._batches_target_dir))
 
 
+def _shift_item_ids(batch_file, offset):
+    """Add the offset to the id of every item (document) of a batch file"""
+    from artm import messages
+    batch = messages.Batch()
+    with open(batch_file, 'rb') as f:
+        batch.ParseFromString(f.read())
+    for item in batch.item:
+        item.id += offset
+    with open(batch_file, 'wb') as f:
+        f.write(batch.SerializeToString())
+
+
 if __name__ == '__main__':
     trainer_factory = TrainerFactory()
     model_trainer = trainer_factory.create_trainer('articles', exploit_ideology_labels=False, force_new_batches=False)
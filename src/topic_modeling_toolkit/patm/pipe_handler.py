@@ -1,25 +1,43 @@
 import os
 import re
 import sys
+import copy
+import glob
+import json
+import uuid
+import shutil
 import argparse
+from itertools import islice
 from operator import itemgetter
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from collections import OrderedDict
 import pandas as pd
 from configparser import ConfigParser
 from gensim.corpora import Dictionary
-from gensim.models.tfidfmodel import TfidfModel
 
 from .modeling.dataset_extraction import CategoryToFieldsGenerator
-from .dataset import TextDataset
+from .dataset import TextDataset, manifest_path
+from .corpus import BowCorpus, DiskBowCorpus, CsrCorpus, remap_bow_corpus
+from .weighting import weighting_parameters, weighted_documents
+from .tokens_cache import TokensCache
 from topic_modeling_toolkit.processors import Pipeline
+from topic_modeling_toolkit.processors.processor import BaseDiskWriterWithPrologue, compression_extensions
+from topic_modeling_toolkit.processors.mutators import CountingDictionaryBuilder
+from topic_modeling_toolkit.processors.generator_processors import TokenLemmatizer, LemmaCache
 
-from .definitions import IDEOLOGY_CLASS_NAME, COOCURENCE_DICT_FILE_NAMES# = ['cooc_tf_', 'cooc_df_', 'ppmi_tf_', 'ppmi_df_']
+from .definitions import IDEOLOGY_CLASS_NAME, DEFAULT_CLASS_NAME, BATCHES_DIR_NAMES, CSR_CORPUS_DIR_NAME, COOCURENCE_DICT_FILE_NAMES# = ['cooc_tf_', 'cooc_df_', 'ppmi_tf_', 'ppmi_df_']
 
 # import logging
 # logger = logging.getLogger(__name__)
 
 
 class PipeHandler(object):
+    docs_per_task = 500  # number of documents sent to a worker process at once, when preprocessing in parallel
+    docs_per_batch = 500  # default number of documents each processor processes at once (see the 'batch_size' setting)
+    docs_per_write = 5000  # number of documents formatted by the disk writers into a single buffer
+    compression_extensions = compression_extensions
+
     def __init__(self):
         self.cat2textgen_proc = None
         self.text_generator = None
@@ -35,16 +53,17 @@ class PipeHandler(object):
         self.vowpal_file = ''
         self.outlet_ids = []
         self._pack_data = None
-        self._data_models = {}
-        self._data_model2constructor = {'counts': lambda x: x,
-                                       'tfidf': TfidfModel}
-        self._vec_gen = {'counts': lambda bow_model: (_ for _ in bow_model),
-                         'tfidf': lambda bow_model: (_ for _ in map(lambda x: self._data_models['tfidf'][x], bow_model))}
+        self._data_models = {}  # the corpus statistics of each weighting in use (see patm.weighting.weighting_parameters)
+        self._frequencies = (None, None)  # document frequencies and number of documents to weight tokens by; by default of the corpus
         self._format_data_tr = {
             'uci': lambda x: x[1],
             'vowpal': lambda x: [map(lambda y: (self.dct[y[0]], y[1]), x[1]), {IDEOLOGY_CLASS_NAME: self.label(self.outlet_ids[x[0]])}]
         }
         self._labels_hash = {}
+        self.tokens_cache = None
+        self.unfiltered_dct = None
+        self.documents = []
+        self.corpus_stats = {}  # 'unfiltered' and 'filtered' patm.corpus.CorpusStats of the bag-of-words
 
     @property
     def labels_hash(self):
@@ -83,34 +102,124 @@ class PipeHandler(object):
     def persist(self, dataset_path, labels_hash, class_names, add_class_labels_to_vocab=True):
         self._prepare_storing(dataset_path)
         self._labels_hash = labels_hash
-        self.pipe_through_disk_writers()
+        if self._nb_shards > 1:
+            self.pipe_through_shard_writers(dataset_path, self._nb_shards)
+        else:
+            self.pipe_through_disk_writers()
         self.class_names = class_names
         self.write_vocab(dataset_path, add_class_labels=add_class_labels_to_vocab)
-        return self.create_dataset(dataset_path)
+        self.write_csr_corpus(dataset_path)
+        if 'artm_batch_size' in self._pipeline.runtime_settings:
+            self.write_batches(dataset_path, self._pipeline.runtime_settings['artm_batch_size'])
+        dataset = self.create_dataset(dataset_path)
+        self._save_append_state(dataset_path)
+        return dataset
 
     def preprocess(self, category, pipeline, collection_path, labels_hash, class_names, sample='all', add_class_labels_to_vocab=True):
         self.process(pipeline, category, sample=sample)
         return self.persist(collection_path, labels_hash, class_names, add_class_labels_to_vocab=add_class_labels_to_vocab)
 
-    def _prepare_storing(self, dataset_path):
+    def append(self, pipeline, category, dataset_path, labels_hash, class_names, sample='all', add_class_labels_to_vocab=True):
+        """
+        Process only the documents of the category that are not already part of an existing dataset and append them to the dataset's
+        files. Tokens already in the vocabulary keep their ids and new tokens passing the 'nobelow', 'noabove' (and 'ngrams_min_count')
+        thresholds, as computed on the counts of all the documents, get the next ids. The already stored documents are not
+        re-processed; so no token is removed from the vocabulary and the tokens added are only counted in the new documents.
+        The co-occurrence files are not updated; they have to be recreated with a CoherenceFilesBuilder.\n
+        :param str or processors.pipeline.Pipeline pipeline: the pipeline the dataset was created with
+        :param str category: the category of documents to consider
+        :param str dataset_path: the directory of the dataset, which has to be persisted by this version of the PipeHandler
+        :param dict labels_hash: mapping of outlet ids to document (class) labels
+        :param list class_names: the class labels
+        :param str or int sample: the number of documents to consider
+        :param bool add_class_labels_to_vocab: whether the class labels are included in the vocabulary file
+        :return: the updated dataset
+        :rtype: patm.dataset.TextDataset
+        """
+        self.pipeline = pipeline
+        if 'compression' in self._pipeline.runtime_settings:
+            raise ValueError('Appending to compressed datasets is not supported')
+        if self._nb_shards > 1:
+            raise ValueError('Appending to sharded datasets is not supported')
+        self._labels_hash = labels_hash
+        self.class_names = class_names
+        dataset_file, dataset = self._load_dataset(dataset_path)
+        if dataset.id != self._get_dataset_id(nb_docs=dataset._col_len):
+            raise ValueError("Dataset '{}' was not created with the given pipeline settings".format(dataset.id))
+        with open(self._state_path(dataset_path, 'documents', 'txt')) as f:
+            processed = set(line.rstrip('\n') for line in f)
+        self.vocab_file = self._state_path(dataset_path, 'vocab', 'txt')
+        vocabulary, class_labels, tokens_end = self._read_vocab(self.vocab_file)
+        with open(self._state_path(dataset_path, 'docword', 'txt')) as f:
+            prologue = [int(f.readline()) for _ in range(3)]
+
+        self.unfiltered_dct = Dictionary.load(self._state_path(dataset_path, 'dictionary', 'dict'))
+        nb_docs_before = self.unfiltered_dct.num_docs
+        index = self._pipeline.processors_names.index('dict-builder')
+        self._pipeline.processors[index] = CountingDictionaryBuilder(dictionary=self.unfiltered_dct)
+        self.cat2textgen_proc = CategoryToFieldsGenerator(('text', 'poster_id'), nb_docs=sample)
+        streaming = self._pipeline.runtime_settings.get('streaming', False)
+        unfiltered_corpus = self._unfiltered_bow_corpus((doc for doc in self.cat2textgen_proc.process(category) if _document_key(doc) not in processed), streaming)
+        print('{} new documents'.format(self.unfiltered_dct.num_docs - nb_docs_before))
+
+        new_tokens = self._admitted_tokens(vocabulary)
+        print('{} new tokens in the vocabulary'.format(len(new_tokens)))
+        for token in new_tokens:
+            vocabulary[token] = len(vocabulary)
+        self.dct = Dictionary()
+        self.dct.token2id = vocabulary
+        self.dct.dfs = {token_id: self.unfiltered_dct.dfs.get(self.unfiltered_dct.token2id[token], 0) for token, token_id in vocabulary.items() if token in self.unfiltered_dct.token2id}
+        self.dct.num_docs = self.unfiltered_dct.num_docs
+        self.corpus, self.outlet_ids = self._remap_bow_corpus(unfiltered_corpus, _id_map(self.unfiltered_dct.token2id, vocabulary), streaming=streaming, append=True)
+        del unfiltered_corpus
+        self.corpus_stats = {'filtered': self.corpus.stats}
+        print(self.corpus_stats['filtered'])
+        self._frequencies = ([self.dct.dfs.get(token_id, 0) for token_id in range(len(vocabulary))], self.dct.num_docs)  # of all the documents
+
+        self._prepare_storing(dataset_path, append=True, first_doc_num=dataset._col_len + 1)
+        nb_bows = self.corpus.nnz
+        self.pipe_through_disk_writers(prologue_lines=[prologue[0] + self.unfiltered_dct.num_docs - nb_docs_before, len(vocabulary), prologue[2] + nb_bows])
+        labels = set(self.labels)
+        class_labels = [_ for _ in self.class_names if _ in labels or _ in class_labels] + [_ for _ in class_labels if _ not in self.class_names]
+        self._append_to_vocab(tokens_end, new_tokens, class_labels if add_class_labels_to_vocab else [])
+        self.write_csr_corpus(dataset_path, append=True)
+        if 'artm_batch_size' in self._pipeline.runtime_settings:
+            self.write_batches(dataset_path, self._pipeline.runtime_settings['artm_batch_size'], first_doc_num=dataset._col_len + 1)
+        else:  # batches lacking the new documents would be loaded for training
+            for batches_dir in (os.path.join(dataset_path, _) for _ in BATCHES_DIR_NAMES.values()):
+                if os.path.isdir(batches_dir):
+                    shutil.rmtree(batches_dir)
+                    print("Removed the outdated batches in '{}'".format(batches_dir))
+        self._save_append_state(dataset_path, append=True)
+
+        updated = TextDataset(dataset.name, self._get_dataset_id(nb_docs=dataset._col_len + len(self.corpus)), dataset._col_len + len(self.corpus),
+                              len(vocabulary), dataset.nb_bows + nb_bows, self.uci_file, self.vocab_file, self.vowpal_file)
+        updated.root_dir = dataset_path
+        updated.save()
+        if os.path.basename(dataset_file) != updated.id + '.pkl':
+            os.remove(dataset_file)
+        print("The co-occurrence files of '{}' are not updated; recreate them to compute coherence scores on all documents".format(dataset.name))
+        return updated
+
+    def _prepare_storing(self, dataset_path, append=False, first_doc_num=1):
         self._collection = os.path.basename(dataset_path)
-        self.uci_file = os.path.join(dataset_path, 'docword.{}.txt'.format(self._collection))
-        self.vowpal_file = os.path.join(dataset_path, 'vowpal.{}.txt'.format(self._collection))
-        self.pipeline.initialize(file_paths=[self.uci_file, self.vowpal_file])
+        compression = self._pipeline.runtime_settings.get('compression')
+        extension = self.compression_extensions.get(compression, '')
+        self.uci_file = os.path.join(dataset_path, 'docword.{}.txt{}'.format(self._collection, extension))
+        self.vowpal_file = os.path.join(dataset_path, 'vowpal.{}.txt{}'.format(self._collection, extension))
+        if self._nb_shards < 2:  # otherwise each shard gets its own disk writers (see pipe_through_shard_writers)
+            self.pipeline.initialize(file_paths=[self.uci_file, self.vowpal_file], append=append, first_doc_num=first_doc_num, compression=compression)
+
+    @property
+    def _nb_shards(self):
+        return self._pipeline.runtime_settings.get('shards', 1)
 
     #####
     def pipe_through_processors(self, category, num_docs='all'):
-        doc_gens = []
-        self.outlet_ids = []
-        self.doc_gen_stats['corpus-tokens'] = 0
         self.cat2textgen_proc = CategoryToFieldsGenerator(('text', 'poster_id'), nb_docs=num_docs)
-        self.text_generator = self.cat2textgen_proc.process(category)
-        print(self.cat2textgen_proc, '\n')
-        for i, doc in enumerate(self.text_generator):
-            doc_gens.append(self._pipeline.pipe_through(doc['text'], len(self._pipeline) - 2))
-            self.outlet_ids.append(str(doc['poster_id']))  # index outlets (document authors) ids
+        streaming = self._pipeline.runtime_settings.get('streaming', False)
+        unfiltered_corpus = self._unfiltered_bow_corpus(self.cat2textgen_proc.process(category), streaming)
 
-        self.dct = self._pipeline[self._pipeline.processors_names.index('dict-builder')][1].state
         # self.corpus = [self.dct.doc2bow([token for token in tok_gen]) for tok_gen in doc_gens]
         # print '{} tokens in all generators\n'.format(sum_toks)
         # print 'total bow tuples in corpus: {}'.format(sum(len(_) for _ in self.corpus))
@@ -121,11 +230,14 @@ class PipeHandler(object):
         print("SAMPLE LEXICAL ITEMS:\n{}".format(
             '\n'.join(map(lambda x: '{}: {}'.format(x[0], x[1]), sorted(self.dct.iteritems(), key=itemgetter(0))[:5]))))
 
-        tokens = [[token for token in tok_gen] for tok_gen in doc_gens]
+        self.corpus_stats = {'unfiltered': unfiltered_corpus.stats}  # before applying 'below' and 'above' filtering
+        print(self.corpus_stats['unfiltered'])
+        self.unfiltered_dct = copy.deepcopy(self.dct)  # persisted along with the dataset, to allow appending documents to it
 
-        # print corpus stats before applying 'below' and 'above' filtering
-        c = [self.dct.doc2bow(doc_tokens) for doc_tokens in tokens]
-        self._print_bow_model_stats(c)
+        if self._pipeline.settings.get('ngrams_min_count'):
+            print(' -- filter rare n-grams -- ')
+            self._filter_rare_ngrams(self._pipeline.settings['ngrams_min_count'])
+            self._print_dict_stats()
 
         print(' -- filter extremes -- ')
         self.dct.filter_extremes(no_below=self._pipeline.settings['nobelow'],
@@ -136,35 +248,232 @@ class PipeHandler(object):
         self.dct.compactify()
         self._print_dict_stats()
 
-        # self.corpus = filter(None, [self.dct.doc2bow([token for token in tok_gen]) for tok_gen in doc_gens])
-        self.corpus = [self.dct.doc2bow(doc_tokens) for doc_tokens in tokens]
-        self._print_bow_model_stats(self.corpus)
-
-        # REMOVE EMPTY DOCS
-        c = [_ for _ in self.corpus if _]
-        self.corpus, self.outlet_ids = (list(x) for x in zip(*[[doc, label] for doc, label in zip(self.corpus, self.outlet_ids) if doc]))
-        assert len(c) == len(self.corpus) == len(self.outlet_ids)
-        self._print_bow_model_stats(self.corpus)
+        # map the bag-of-words to the ids of the filtered dictionary (in streaming mode this is a 2nd pass over the spilled documents)
+        self.corpus, self.outlet_ids = self._remap_bow_corpus(unfiltered_corpus, _id_map(self.unfiltered_dct.token2id, self.dct.token2id), streaming=streaming)
+        del unfiltered_corpus
+        self.corpus_stats['filtered'] = self.corpus.stats
+        print(self.corpus_stats['filtered'])
         print
 
-    def pipe_through_disk_writers(self):
-        """Call to pass through the last BaseDiskWriter processors of the pieline. Assumes the last non BaseDsikWriter processor in the pipeline is a 'weight' so that a 'counts 'or 'tfidf' token weight model is computed"""
+    def _unfiltered_bow_corpus(self, docs_generator, streaming):
+        """Pass the documents through the pipeline's processors, building the (unfiltered) dictionary, and collect their bag-of-words;
+        in memory or, when streaming, on disk.\n
+        :param generator docs_generator: the dictionaries of the documents, as generated by a CategoryToFieldsGenerator
+        :param bool streaming: whether to spill the bag-of-words to disk, keeping only the dictionary in memory
+        :return: the bag-of-words of each document, with the ids of the unfiltered dictionary
+        :rtype: patm.corpus.BowCorpus or patm.corpus.DiskBowCorpus
+        """
+        self.outlet_ids = []
+        self.documents = []
+        self.doc_gen_stats['corpus-tokens'] = 0
+        self.text_generator = self._record_documents(docs_generator)
+        print(self.cat2textgen_proc, '\n')
+        self.dct = self._pipeline[self._pipeline.processors_names.index('dict-builder')][1].state
+        workers = self._pipeline.runtime_settings.get('workers', 1)
+        if 'cache' in self._pipeline.runtime_settings:
+            self.tokens_cache = TokensCache(self._pipeline.runtime_settings['cache'], max_size=self._pipeline.runtime_settings.get('cache_size', 1024))
+            self.text_generator = self._with_cache_keys(self.text_generator)
+        lemmatizer = _token_lemmatizer(self._pipeline)
+        if lemmatizer:
+            self.doc_gen_stats.update({'lemma-cache-hits': 0, 'lemma-cache-misses': 0})
+        if workers > 1:
+            bow_generator = self._tokenize_in_parallel(workers)
+        else:
+            bow_generator = self._tokenize(self.text_generator)
+        # when streaming (1st pass) only the dictionary is kept in memory; the bag-of-words of each document are spilled to disk
+        unfiltered_corpus = DiskBowCorpus() if streaming else BowCorpus()
+        for doc_bow in bow_generator:
+            unfiltered_corpus.append([token_id for token_id, _ in doc_bow], [count for _, count in doc_bow])
+        if self.tokens_cache:
+            print(self.tokens_cache)
+            self.doc_gen_stats.update({'cache-hits': self.tokens_cache.hits, 'cache-misses': self.tokens_cache.misses})
+            self.tokens_cache.close()
+        if lemmatizer:
+            for k, v in lemmatizer.cache.stats.items():
+                self.doc_gen_stats['lemma-cache-' + k] += v
+            print('Lemma cache: {} hits, {} misses'.format(self.doc_gen_stats['lemma-cache-hits'], self.doc_gen_stats['lemma-cache-misses']))
+        return unfiltered_corpus
+
+    def _tokenize(self, docs_generator):
+        """Pass the documents through the pipeline, feeding their tokens to the dictionary builder, and generate their bag-of-words"""
+        dict_builder = self._pipeline[self._pipeline.processors_names.index('dict-builder')][1]
+        batch_size = self._pipeline.runtime_settings.get('batch_size', self.docs_per_batch)
+        for docs in _chunks(docs_generator, batch_size):
+            self.outlet_ids.extend(str(doc['poster_id']) for doc in docs)  # index outlets (document authors) ids
+            tokens, cache_hits = _docs_tokens(self._pipeline, docs, self.tokens_cache)
+            for doc, doc_tokens, hit in zip(docs, tokens, cache_hits):
+                if self.tokens_cache and not hit:
+                    self.tokens_cache.put(doc['cache-key'], doc_tokens)
+                yield dict_builder.process(doc_tokens)
+
+    def _tokenize_in_parallel(self, workers):
+        """Spread the documents over a pool of worker processes, each building a partial dictionary out of the documents it was given.
+        The partial dictionaries are merged in the order the documents were generated, so that the token ids assigned are identical to
+        the ones of a single-process run. Workers only read from the tokens cache; newly computed tokens are cached by this process.
+        When lemmatizing tokens, the first documents are processed by this process, to warm its lemma cache up; the workers start from
+        a read-only snapshot of it, which holds the most frequent surface forms.\n
+        :param int workers: the number of worker processes to use
+        :return: a generator of the bag-of-words of each document
+        :rtype: generator
+        """
+        cache_path = self.tokens_cache.path if self.tokens_cache else None
+        batch_size = self._pipeline.runtime_settings.get('batch_size', self.docs_per_batch)
+        lemmatizer = _token_lemmatizer(self._pipeline)
+        lemmas = None
+        if lemmatizer:
+            for doc_bow in self._tokenize(islice(self.text_generator, self.docs_per_task)):
+                yield doc_bow
+            lemmas = lemmatizer.cache.snapshot()
+        pool = Pool(processes=workers, initializer=_init_worker, initargs=(self._pipeline.settings, batch_size, cache_path, lemmas))
+        try:
+            for chunk_bows, chunk_tokens, chunk_outlet_ids, partial_dct, cache_keys, cache_hits, lemma_stats in pool.imap(_tokenize_chunk, _chunks(self.text_generator, self.docs_per_task)):
+                id_map = merge_dictionary(self.dct, partial_dct)
+                for k, v in lemma_stats.items():
+                    self.doc_gen_stats['lemma-cache-' + k] += v
+                self.outlet_ids.extend(chunk_outlet_ids)
+                if self.tokens_cache:
+                    self._update_cache(cache_keys, cache_hits, chunk_tokens)
+                for doc_bow in chunk_bows:
+                    yield sorted((id_map[token_id], count) for token_id, count in doc_bow)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _record_documents(self, docs_generator):
+        for doc in docs_generator:
+            self.documents.append(_document_key(doc))
+            yield doc
+
+    def _admitted_tokens(self, vocabulary):
+        """Returns the tokens of the (unfiltered) dictionary that are not in the vocabulary and pass the pipeline's dictionary filters,
+        in the order of their ids. Like gensim's filter_extremes, the vocabulary is capped to the 100000 most frequent tokens.\n
+        :param dict vocabulary: the tokens already in the vocabulary
+        :rtype: list
+        """
+        no_below, no_above = self._pipeline.settings['nobelow'], int(self._pipeline.settings['noabove'] * self.unfiltered_dct.num_docs)
+        dfs = self.unfiltered_dct.dfs
+        rare_ngrams = set(self._rare_ngram_ids(self.unfiltered_dct, self._pipeline.settings.get('ngrams_min_count') or 0))
+        candidates = [(token_id, token) for token, token_id in self.unfiltered_dct.token2id.items()
+                      if token not in vocabulary and no_below <= dfs.get(token_id, 0) <= no_above and token_id not in rare_ngrams]
+        candidates = sorted(candidates, key=lambda x: dfs.get(x[0], 0), reverse=True)[:max(0, 100000 - len(vocabulary))]
+        return [token for _, token in sorted(candidates)]
+
+    def _filter_rare_ngrams(self, min_count):
+        """Remove the n-grams (tokens generated by joining words, see generator_processors.Ngram) that occur less than min_count times
+        in the corpus; words that merely contain the NGRAMS_SEPARATOR are kept"""
+        self.dct.filter_tokens(bad_ids=self._rare_ngram_ids(self.dct, min_count))
+
+    @staticmethod
+    def _rare_ngram_ids(dictionary, min_count):
+        return [token_id for token_id in getattr(dictionary, 'ngram_ids', ()) if dictionary.cfs.get(token_id, 0) < min_count]
+
+    def _with_cache_keys(self, docs_generator):
+        tokens_id = self._pipeline.tokens_id
+        for doc in docs_generator:
+            doc['cache-key'] = self.tokens_cache.key(doc['source'], doc['index'], tokens_id)
+            yield doc
+
+    def _update_cache(self, keys, hits, tokens):
+        for key, hit, doc_tokens in zip(keys, hits, tokens):
+            if hit:
+                self.tokens_cache.hits += 1
+                self.tokens_cache.touch(key)
+            else:
+                self.tokens_cache.misses += 1
+                self.tokens_cache.put(key, doc_tokens)
+
+    def _remap_bow_corpus(self, bow_corpus, id_map, streaming=False, append=False):
+        """Map the token ids of the bag-of-words of each document, as assigned before filtering, to the ids of the filtered and
+        compacted dictionary. Compacting preserves the relative order of the ids, so the bag-of-words of a new dataset stay sorted.
+        When appending, the tokens admitted to an existing vocabulary get ids after all of its tokens, whatever their unfiltered ids
+        (ie a token that used to be below 'nobelow'), so the pairs of each document are sorted again. Documents left without tokens
+        are dropped along with their outlet id.\n
+        :param patm.corpus.BaseBowCorpus bow_corpus: the bag-of-words of each document, with the token ids assigned before filtering
+        :param list id_map: the filtered id of each unfiltered id, or -1 if the token was filtered out (see _id_map)
+        :param bool streaming: whether to store the resulting bag-of-words on disk instead of in memory
+        :param bool append: whether the ids are the ones of an existing vocabulary extended with new tokens
+        :return: the bag-of-words corpus and the outlet ids of the documents that were kept
+        :rtype: tuple
+        """
+        corpus, kept = remap_bow_corpus(bow_corpus, id_map, DiskBowCorpus() if streaming else BowCorpus(), sort=append)
+        return corpus, [outlet_id for outlet_id, keep in zip(self.outlet_ids, kept.tolist()) if keep]
+
+    def pipe_through_disk_writers(self, prologue_lines=None):
+        """Call to pass through the last BaseDiskWriter processors of the pieline. Assumes the last non BaseDsikWriter processor in the pipeline is a 'weight' so that a 'counts 'or 'tfidf' token weight model is computed\n
+        :param list prologue_lines: the values of the uci prologue; by default computed from the dictionary and the corpus
+        """
         if len(self.corpus) != len(self.outlet_ids):
             logger.warning("Please fix the logic because there is a missmatch between documents and labels: {} != {}".format(len(self.corpus), len(self.outlet_ids)))
-        for _, processor in self.pipeline.disk_writers:
-            for i, vector in enumerate(self._get_iterable_data_model(self.pipeline.settings['weight'])):  # 'counts' only supported (future work: 'tfidf')
-                processor.process(self._format_data_tr[processor.to_id()]((i, vector)))
+        disk_writers = [processor for _, processor in self.pipeline.disk_writers]
+        vectors = enumerate(self._get_iterable_data_model(self.pipeline.settings['weight']))
+        for chunk in _chunks(vectors, self.docs_per_write):  # a single pass over the data model, feeding all writers a chunk at a time
+            for processor in disk_writers:
+                processor.process_batch([self._format_data_tr[processor.to_id()](x) for x in chunk])
         self.doc_gen_stats.update({'docs-gen': self.cat2textgen_proc.nb_processed, 'docs-failed': len(self.cat2textgen_proc.failed)})
 
         # the first 3 lines of a uci formatted file: correspond to nb_docs, vocab_size, sum of nb of tuples (representing the bow model) found in all documents.
         # They should be written on the top
-        prologue_lines = map(lambda x: str(x), [self.dct.num_docs, len(self.dct.items()), sum(len(_) for _ in self.corpus)])
-        self.pipeline.finalize([prologue_lines])
+        if prologue_lines is None:
+            prologue_lines = [self.dct.num_docs, len(self.dct.items()), self.corpus.nnz]
+        self.pipeline.finalize([map(lambda x: str(x), prologue_lines)])
+
+    def pipe_through_shard_writers(self, dataset_path, nb_shards):
+        """Write the documents split in nb_shards consecutive ranges, each one in its own file per format (ie vowpal.<col>.000.txt),
+        concurrently from a pool of threads, along with a 'manifest.<col>.json' file listing the shards. Each uci shard is a complete
+        uci file, numbering its documents from 1, while the vowpal shards keep the numbering of the documents in the whole collection
+
+        :param str dataset_path: the directory of the dataset
+        :param int nb_shards: the number of shards to split the documents in; at most one shard per document is created
+        """
+        nb_docs = len(self.corpus)
+        nb_shards = max(1, min(nb_shards, nb_docs))
+        bounds = [nb_docs * i // nb_shards for i in range(nb_shards + 1)]
+        self._get_iterable_data_model(self.pipeline.settings['weight'], end=0)  # gathers the statistics of the (ie tfidf) weights once, before the threads share them
+        _ = self.corpus.arrays  # build (or memory-map) the arrays once, before the threads share them
+        pool = ThreadPool(min(nb_shards, os.cpu_count() or 1))
+        shards = pool.map(self._write_shard, [(index, bounds[index], bounds[index + 1]) for index in range(nb_shards)])
+        pool.close()
+        pool.join()
+        self.doc_gen_stats.update({'docs-gen': self.cat2textgen_proc.nb_processed, 'docs-failed': len(self.cat2textgen_proc.failed)})
+        with open(manifest_path(dataset_path), 'w') as f:
+            json.dump({'collection': self._collection, 'nb_docs': nb_docs, 'vocab': 'vocab.{}.txt'.format(self._collection), 'shards': shards}, f, indent=2)
+
+    def _write_shard(self, shard):
+        index, start, end = shard
+        file_paths = [_shard_path(path, index) for path in (self.uci_file, self.vowpal_file)]
+        disk_writers = [type(processor)() for _, processor in self.pipeline.disk_writers]
+        entry = {'first_doc_num': start + 1, 'nb_docs': end - start}
+        for disk_writer_index, processor in enumerate(disk_writers):
+            processor.initialize(file_paths=file_paths, disk_writer_index=disk_writer_index, compression=self._pipeline.runtime_settings.get('compression'))
+            processor.doc_num = 1 if isinstance(processor, BaseDiskWriterWithPrologue) else start + 1
+            entry[processor.to_id()] = os.path.basename(file_paths[disk_writer_index])
+        nb_bows = 0
+        for chunk in _chunks(enumerate(self._get_iterable_data_model(self.pipeline.settings['weight'], start, end), start), self.docs_per_write):
+            nb_bows += sum(len(doc_vector) for _, doc_vector in chunk)
+            for processor in disk_writers:
+                processor.process_batch([self._format_data_tr[processor.to_id()](x) for x in chunk])
+        for processor in disk_writers:
+            if isinstance(processor, BaseDiskWriterWithPrologue):
+                processor.finalize([str(end - start), str(len(self.dct.items())), str(nb_bows)])
+            else:
+                processor.finalize()
+        entry['nb_bows'] = nb_bows
+        return entry
 
-    def _get_iterable_data_model(self, data_model):
+    def _get_iterable_data_model(self, data_model, start=0, end=None):
+        """Iterate over the documents in [start, end) as lists of (token_id, weight) tuples. Weights other than 'counts' (see
+        patm.weighting.weightings) are computed a block of documents at a time, so the corpus is never held in memory as a whole; the
+        corpus statistics they depend on are gathered in one pass, the first time they are needed. Tokens of zero weight are left out.\n
+        :param str data_model: one of 'counts', 'tfidf', 'bm25' or 'log-count'
+        :param int start: the index of the first document
+        :param int end: the index after the last document; by default the number of documents
+        :rtype: generator
+        """
+        if data_model == 'counts':
+            return self.corpus.documents(start, end)
         if data_model not in self._data_models:
-            self._data_models[data_model] = self._data_model2constructor[data_model](self.corpus)
-        return self._vec_gen[data_model](self.corpus)
+            self._data_models[data_model] = weighting_parameters(self.corpus, data_model, len(self.dct.token2id), *self._frequencies)
+        return weighted_documents(self.corpus, data_model, len(self.dct.token2id), self._data_models[data_model], start, end)
 
     #######
     def write_vocab(self, dataset_path, add_class_labels=True):
@@ -184,6 +493,44 @@ class PipeHandler(object):
         else:
             print("File '{}' already exists. Skipping.".format(self.vocab_file))
 
+    def write_csr_corpus(self, dataset_path, append=False):
+        """Store the bag-of-words and the class labels of the documents as .npy arrays (see patm.corpus.CsrCorpus). When appending, the
+        documents are added after the ones already stored; datasets persisted without the arrays are left without them"""
+        directory = os.path.join(dataset_path, CSR_CORPUS_DIR_NAME)
+        if append and not CsrCorpus.exists(directory):
+            print("No binary corpus found in '{}'; persist the dataset again to create it".format(dataset_path))
+            return
+        if append:
+            CsrCorpus(directory, self.vocab_file).append(self.corpus, self.labels, len(self.dct.token2id))
+        else:
+            CsrCorpus.save(directory, self.corpus, self.labels, self.vocab_file, len(self.dct.token2id))
+
+    def write_batches(self, dataset_path, docs_per_batch, first_doc_num=1):
+        """Write the documents as BigARTM batches (protobuf messages), with and without their class labels, in the batches folders that
+        TrainerFactory loads batches from, so that training does not have to parse the vowpal or uci files. Each batch is serialized
+        by a pool of 'workers' processes. Tokens are weighted according to the 'weight' setting, like in the vowpal and uci files.\n
+        :param str dataset_path: the directory of the dataset
+        :param int docs_per_batch: the number of documents in each batch
+        :param int first_doc_num: the number of the first document; when appending, the batches are added next to the existing ones
+        """
+        batches_dirs = {labels: os.path.join(dataset_path, name) for labels, name in BATCHES_DIR_NAMES.items()}
+        for batches_dir in batches_dirs.values():
+            if first_doc_num == 1 and os.path.isdir(batches_dir):
+                shutil.rmtree(batches_dir)
+            if not os.path.isdir(batches_dir):
+                os.makedirs(batches_dir)
+        vectors = enumerate(self._get_iterable_data_model(self.pipeline.settings['weight']))
+        tasks = ((batches_dirs, [(first_doc_num + index, [(self.dct[token_id], weight) for token_id, weight in doc_vector], self.label(self.outlet_ids[index]))
+                                 for index, doc_vector in chunk])
+                 for chunk in _chunks(vectors, docs_per_batch))
+        pool = Pool(processes=self._pipeline.runtime_settings.get('workers', os.cpu_count() or 1))
+        try:
+            nb_batches = sum(pool.imap_unordered(_write_artm_batches, tasks))
+        finally:
+            pool.close()
+            pool.join()
+        print("Wrote {} batches of {} documents in each of '{}'".format(nb_batches, docs_per_batch, "', '".join(sorted(batches_dirs.values()))))
+
     def _vocab_tokens_generator(self, include_class_labels=True):
         for gram_id, gram_string in self.dct.iteritems():
             yield gram_id, gram_string
@@ -193,24 +540,204 @@ class PipeHandler(object):
 
     #######
     def create_dataset(self, dataset_path):
+        sharded = self._nb_shards > 1  # the documents are found in the shard files listed in the manifest (see TextDataset.vowpal_files)
         dataset = TextDataset(os.path.basename(dataset_path), self._get_dataset_id(),
-                                   len(self.corpus), len(self.dct.items()), sum(len(_) for _ in self.corpus),
-                                   self.uci_file, self.vocab_file, self.vowpal_file)
+                                   len(self.corpus), len(self.dct.items()), self.corpus.nnz,
+                                   None if sharded else self.uci_file, self.vocab_file, None if sharded else self.vowpal_file)
         dataset.root_dir = dataset_path
+        if sharded:
+            dataset.manifest = manifest_path(dataset_path)
         dataset.save()
         return dataset
 
-    def _get_dataset_id(self):
+    def _get_dataset_id(self, nb_docs=None):
         idd = self._pipeline.get_id()  # get_id(self._pipeline.settings)
         ri = idd.rfind('_')
-        return str(len(self.corpus)) + '_' + idd[:ri] + '.' + idd[ri + 1:]
+        return str(len(self.corpus) if nb_docs is None else nb_docs) + '_' + idd[:ri] + '.' + idd[ri + 1:]
+
+    ###### APPEND MODE
+    @staticmethod
+    def _state_path(dataset_path, name, extension):
+        return os.path.join(dataset_path, '{}.{}.{}'.format(name, os.path.basename(dataset_path), extension))
+
+    def _save_append_state(self, dataset_path, append=False):
+        """Store the unfiltered dictionary and the keys of the processed documents, so that new documents can be appended later"""
+        self.unfiltered_dct.save(self._state_path(dataset_path, 'dictionary', 'dict'))
+        with open(self._state_path(dataset_path, 'documents', 'txt'), 'a' if append else 'w') as f:
+            f.writelines('{}\n'.format(key) for key in self.documents)
+
+    @staticmethod
+    def _load_dataset(dataset_path):
+        datasets = [(path, TextDataset.load(path)) for path in glob.glob(os.path.join(dataset_path, '*.pkl'))]
+        datasets = [(path, dataset) for path, dataset in datasets if isinstance(dataset, TextDataset)]
+        if len(datasets) != 1:
+            raise RuntimeError("Expected exactly one dataset in '{}', found {}".format(dataset_path, len(datasets)))
+        return datasets[0]
+
+    @staticmethod
+    def _read_vocab(vocab_file):
+        """Returns the token to id mapping of a vocabulary file, the class labels listed at its end and the byte offset where its tokens end"""
+        vocabulary, class_labels, tokens_end = {}, [], 0
+        class_suffix = ' ' + IDEOLOGY_CLASS_NAME
+        with open(vocab_file) as f:
+            for line in f:
+                if line.rstrip('\n').endswith(class_suffix):
+                    class_labels.append(line.rstrip('\n')[:-len(class_suffix)])
+                else:
+                    vocabulary[line.rstrip('\n')] = len(vocabulary)
+                    tokens_end += len(line.encode(f.encoding))
+        return vocabulary, class_labels, tokens_end
+
+    def _append_to_vocab(self, tokens_end, new_tokens, class_labels):
+        """Write the new tokens after the stored ones, in place of the class labels listed at the end of the vocabulary file, followed by
+        the given class labels, so that the lines of the stored tokens are not written again"""
+        with open(self.vocab_file, 'r+') as f:
+            f.seek(tokens_end)
+            f.truncate()
+            f.writelines('{}\n'.format(token) for token in new_tokens)
+            f.writelines('{} {}\n'.format(class_label, IDEOLOGY_CLASS_NAME) for class_label in class_labels)
 
     ###### UTILS
     def _print_dict_stats(self):
         print("GENSIM-DICT:\nnum_pos (processes words): {}\nnum_nnz (nb of bow-tuples) {}\nvocab size: {}".format(
             self.dct.num_pos, self.dct.num_nnz, len(self.dct.items())))
 
-    @classmethod
-    def _print_bow_model_stats(cls, bow_corpus):
-        print("BOW-MODEL:\nnumber of word position (num_pos): {}\ntotal number of tuples (num_nnz): {}\n number of docs: {}\nempty docs: {}".format(
-            sum(sum(bow_tuple[1] for bow_tuple in doc) for doc in bow_corpus), sum(len(_) for _ in bow_corpus), len(bow_corpus), len([_ for _ in bow_corpus if not _])))
+
+###### MULTIPROCESSING
+_worker_pipeline = None
+_worker_batch_size = 1
+_worker_cache = None
+
+
+def _init_worker(pipeline_settings, batch_size, cache_path, lemmas):
+    global _worker_pipeline, _worker_batch_size, _worker_cache
+    _worker_pipeline = Pipeline(pipeline_settings)
+    _worker_batch_size = batch_size
+    if cache_path:
+        _worker_cache = TokensCache(cache_path, read_only=True)
+    lemmatizer = _token_lemmatizer(_worker_pipeline)
+    if lemmatizer:
+        lemmatizer.cache = LemmaCache(max_size=lemmatizer.cache.max_size, snapshot=lemmas)
+
+
+def _tokenize_chunk(docs):
+    """Get the tokens of the documents (see _docs_tokens) using the worker's pipeline and their bag-of-words, with ids from a partial
+    dictionary built out of them. The tokens are returned only when they are to be cached."""
+    lemmatizer = _token_lemmatizer(_worker_pipeline)
+    lemma_stats = dict(lemmatizer.cache.stats) if lemmatizer else {}
+    tokens, cache_hits = [], []
+    for batch in _chunks(docs, _worker_batch_size):
+        batch_tokens, batch_cache_hits = _docs_tokens(_worker_pipeline, batch, _worker_cache)
+        tokens.extend(batch_tokens)
+        cache_hits.extend(batch_cache_hits)
+    if lemmatizer:  # report only the lookups made for this chunk
+        lemma_stats = {k: v - lemma_stats[k] for k, v in lemmatizer.cache.stats.items()}
+    dict_builder = CountingDictionaryBuilder()
+    bows = [dict_builder.process(doc_tokens) for doc_tokens in tokens]
+    return bows, tokens if _worker_cache else None, [str(doc['poster_id']) for doc in docs], dict_builder.state, [doc.get('cache-key') for doc in docs], cache_hits, lemma_stats
+
+
+def _token_lemmatizer(pipeline):
+    """Returns the pipeline's TokenLemmatizer or None if it does not lemmatize tokens separately"""
+    return next((processor for processor in pipeline.processors if isinstance(processor, TokenLemmatizer)), None)
+
+
+def _docs_tokens(pipeline, docs, tokens_cache=None):
+    """
+    Get the tokens each document yields when passed through the processors of the pipeline that come before the 'dict-builder'.
+    Tokens found in the cache are reused and the rest of the documents are piped through as one batch.\n
+    :param processors.pipeline.Pipeline pipeline:
+    :param list docs: the dictionaries of the documents, as generated by a CategoryToFieldsGenerator
+    :param patm.tokens_cache.TokensCache tokens_cache: optional cache to look the tokens up in
+    :return: the tokens of each document and whether they were found in the cache
+    :rtype: tuple
+    """
+    tokens = [tokens_cache.get(doc['cache-key']) if tokens_cache else None for doc in docs]
+    cache_hits = [doc_tokens is not None for doc_tokens in tokens]
+    misses = [i for i, hit in enumerate(cache_hits) if not hit]
+    depth = pipeline.processors_names.index('dict-builder')
+    for i, doc_tokens in zip(misses, pipeline.pipe_through_batch([docs[i]['text'] for i in misses], depth)):
+        tokens[i] = [token for token in doc_tokens]
+    return tokens, cache_hits
+
+
+def _document_key(doc):
+    return '{}:{}'.format(os.path.basename(doc['source']), doc['index'])
+
+
+def _id_map(unfiltered_token2id, token2id):
+    """Returns the id in token2id of each token of unfiltered_token2id, indexed by its unfiltered id; -1 if it is not in token2id"""
+    id_map = [-1] * len(unfiltered_token2id)
+    for token, token_id in token2id.items():
+        id_map[unfiltered_token2id[token]] = token_id
+    return id_map
+
+
+def _write_artm_batches(task):
+    """Serialize a chunk of documents into a BigARTM batch with their class labels and into one without them. Each document is a
+    (doc_num, [(token, weight), ...], class_label) tuple; it becomes an item titled 'doc<doc_num>', like in the vowpal files"""
+    try:
+        from artm import messages
+    except ImportError:
+        raise ImportError("Writing BigARTM batches requires the 'artm' package")
+    batches_dirs, docs = task
+    for with_labels, batches_dir in batches_dirs.items():
+        batch = messages.Batch()
+        batch.id = str(uuid.uuid4())
+        token2index = {}
+        for doc_num, doc_vector, label in docs:
+            item = batch.item.add()
+            item.id = doc_num
+            item.title = 'doc{}'.format(doc_num)
+            features = [((token, DEFAULT_CLASS_NAME), weight) for token, weight in doc_vector]
+            if with_labels:
+                features.append(((label, IDEOLOGY_CLASS_NAME), 1.0))
+            for key, weight in features:
+                if key not in token2index:
+                    token2index[key] = len(token2index)
+                    batch.token.append(key[0])
+                    batch.class_id.append(key[1])
+                item.token_id.append(token2index[key])
+                item.token_weight.append(weight)
+        with open(os.path.join(batches_dir, '{}.batch'.format(batch.id)), 'wb') as f:
+            f.write(batch.SerializeToString())
+    return 1
+
+
+def _shard_path(file_path, index):
+    """Insert the zero-padded shard index before the '.txt' extension of a file path; ie vowpal.col.txt.gz -> vowpal.col.003.txt.gz"""
+    head, _, tail = file_path.rpartition('.txt')
+    return '{}.{:03d}.txt{}'.format(head, index, tail)
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def merge_dictionary(dictionary, partial_dictionary):
+    """Merge a partial gensim Dictionary (built from consecutive documents) into the given one. Tokens not seen before get new ids in
+    the order the partial dictionary assigned its own ids, which gives the same result as adding the documents one by one.\n
+    :param gensim.corpora.Dictionary dictionary: the dictionary to update in place
+    :param gensim.corpora.Dictionary partial_dictionary: the dictionary built from the documents that follow the ones already added
+    :return: the id in the given dictionary of each token of the partial one, indexed by the token's id in the partial dictionary
+    :rtype: list
+    """
+    id_map = [0] * len(partial_dictionary.token2id)
+    for partial_id, token in sorted((token_id, token) for token, token_id in partial_dictionary.token2id.items()):
+        token_id = dictionary.token2id.setdefault(token, len(dictionary.token2id))
+        id_map[partial_id] = token_id
+        dictionary.dfs[token_id] = dictionary.dfs.get(token_id, 0) + partial_dictionary.dfs.get(partial_id, 0)
+        dictionary.cfs[token_id] = dictionary.cfs.get(token_id, 0) + partial_dictionary.cfs.get(partial_id, 0)
+    dictionary.ngram_ids.update(id_map[partial_id] for partial_id in partial_dictionary.ngram_ids)
+    dictionary.num_docs += partial_dictionary.num_docs
+    dictionary.num_pos += partial_dictionary.num_pos
+    dictionary.num_nnz += partial_dictionary.num_nnz
+    dictionary.id2token = {}  # lazily rebuilt by gensim on next lookup
+    return id_map
@@ -0,0 +1,105 @@
+import os
+import json
+import sqlite3
+import hashlib
+
+from topic_modeling_toolkit.processors.generator_processors import Ngram
+
+
+class TokensCache(object):
+    """
+    Persistent cache of the tokens each document yields when passed through the processors of a pipeline that come before the
+    'dict-builder'. Entries are addressed by the source file (path, size and modification time), the index of the document in it
+    and the id of the pipeline settings that determine the tokens, so re-running with different dictionary filtering or output
+    settings reuses them. The total size of the stored tokens is capped, evicting the least recently used entries first.
+    N-grams are stored as single element lists, so that they are told apart from words containing the n-gram separator.
+    """
+    commit_interval = 1000  # number of writes to buffer before committing them
+    format_version = 2  # part of the keys; entries stored in an older representation of the tokens are not looked up
+
+    def __init__(self, path, max_size=1024, read_only=False):
+        """
+        :param str path: the sqlite database file to store the cache in
+        :param int max_size: the maximum total size of the cached tokens in MB
+        :param bool read_only: whether to only look up tokens, which allows (worker) processes to read while another process writes
+        """
+        self.path = path
+        self.max_size = max_size * 1024 * 1024
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self._source_signatures = {}
+        self._pending = 0
+        if read_only:
+            self._connection = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+        else:
+            self._connection = sqlite3.connect(path)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, tokens TEXT NOT NULL, size INTEGER NOT NULL, last_used INTEGER NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)')
+            self._connection.commit()
+        self._size, self._clock = self._connection.execute('SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM tokens').fetchone()
+
+    def __str__(self):
+        return "{}('{}', {:.1f}/{}MB, hits: {}, misses: {})".format(type(self).__name__, self.path, self._size / 1024.0 / 1024, self.max_size // (1024 * 1024), self.hits, self.misses)
+
+    def key(self, source_file, doc_index, pipeline_id):
+        """
+        :param str source_file: path to the file the document was extracted from
+        :param doc_index: the index of the document in the source file
+        :param str pipeline_id: the id of the pipeline settings that determine the tokens (see processors.pipeline.Pipeline.get_id)
+        :return: the key of the document's tokens
+        :rtype: str
+        """
+        if source_file not in self._source_signatures:
+            stat = os.stat(source_file)
+            self._source_signatures[source_file] = '{}:{}:{!r}'.format(os.path.abspath(source_file), stat.st_size, stat.st_mtime)
+        return hashlib.sha1('{}|{}|{}|{}'.format(self.format_version, self._source_signatures[source_file], doc_index, pipeline_id).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Returns the cached tokens for the key or None if they are not cached. Unless read-only, marks the entry as recently used"""
+        row = self._connection.execute('SELECT tokens FROM tokens WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if not self.read_only:
+            self.touch(key)
+        return [Ngram(token[0]) if isinstance(token, list) else token for token in json.loads(row[0])]
+
+    def touch(self, key):
+        self._clock += 1
+        self._connection.execute('UPDATE tokens SET last_used = ? WHERE key = ?', (self._clock, key))
+        self._written()
+
+    def put(self, key, tokens):
+        value = json.dumps([[token] if isinstance(token, Ngram) else token for token in tokens])
+        self._clock += 1
+        previous = self._connection.execute('SELECT size FROM tokens WHERE key = ?', (key,)).fetchone()
+        if previous:
+            self._size -= previous[0]
+        self._connection.execute('INSERT OR REPLACE INTO tokens (key, tokens, size, last_used) VALUES (?, ?, ?, ?)', (key, value, len(value), self._clock))
+        self._size += len(value)
+        if self._size > self.max_size:
+            self._evict()
+        self._written()
+
+    def _evict(self):
+        """Delete least recently used entries till the cached tokens occupy at most 90% of the maximum size"""
+        while self._size > 0.9 * self.max_size:
+            rows = self._connection.execute('SELECT key, size FROM tokens ORDER BY last_used LIMIT 1000').fetchall()
+            if not rows:
+                break
+            self._connection.executemany('DELETE FROM tokens WHERE key = ?', ((key,) for key, _ in rows))
+            self._size -= sum(size for _, size in rows)
+
+    def _written(self):
+        self._pending += 1
+        if self._pending >= self.commit_interval:
+            self._connection.commit()
+            self._pending = 0
+
+    def close(self):
+        if not self.read_only:
+            self._connection.commit()
+        self._connection.close()
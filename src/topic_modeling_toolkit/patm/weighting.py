@@ -0,0 +1,160 @@
+"""Token weighting schemes computed over a scipy.sparse.csr_matrix of counts, with one row per document and one column per token. A
+bag-of-words corpus is weighted a block of documents at a time (see weighted_documents): the corpus statistics the weights depend on
+are gathered in a single pass, so only a block of the documents is ever held in a matrix."""
+import math
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from .corpus import BaseBowCorpus
+
+
+def counts_matrix(bow_corpus, nb_tokens):
+    """Build the (documents x tokens) matrix of counts of a bag-of-words corpus.\n
+    :param bow_corpus: a list of documents, each a list of (token_id, count) tuples sorted by token id, or a patm.corpus.BaseBowCorpus
+    :param int nb_tokens: the size of the vocabulary
+    :rtype: scipy.sparse.csr_matrix
+    """
+    if isinstance(bow_corpus, BaseBowCorpus):
+        indptr, indices, counts = bow_corpus.arrays
+    else:
+        indptr = np.cumsum([0] + [len(doc) for doc in bow_corpus], dtype=np.int64)
+        indices = np.fromiter((token_id for doc in bow_corpus for token_id, _ in doc), dtype=np.int64, count=int(indptr[-1]))
+        counts = np.fromiter((count for doc in bow_corpus for _, count in doc), dtype=np.float64, count=int(indptr[-1]))
+    return csr_matrix((np.asarray(counts, dtype=np.float64), indices, indptr), shape=(len(indptr) - 1, nb_tokens))
+
+
+def document_frequencies(matrix):
+    """The number of documents each token appears in"""
+    return np.bincount(matrix.indices, minlength=matrix.shape[1])
+
+
+def tfidf(matrix, dfs=None, nb_docs=None, eps=1e-12, idfs=None):
+    """Weight the counts by the inverse document frequency, log2(nb_docs / df), and scale each document to unit (L2) length; the same
+    weights a default gensim TfidfModel computes. Tokens appearing in all documents get zero weight and are dropped.\n
+    :param scipy.sparse.csr_matrix matrix: the counts of the tokens in each document
+    :param numpy.ndarray dfs: the document frequency of each token; by default computed on the matrix
+    :param int nb_docs: the number of documents the frequencies were computed on; by default the number of rows of the matrix
+    :param float eps: weights with smaller absolute value are dropped
+    :param numpy.ndarray idfs: the inverse document frequencies, if already computed (see inverse_document_frequencies)
+    :rtype: scipy.sparse.csr_matrix
+    """
+    if idfs is None:
+        idfs = inverse_document_frequencies(*_frequencies(matrix, dfs, nb_docs))
+    weighted = csr_matrix((matrix.data * idfs[matrix.indices], matrix.indices.copy(), matrix.indptr.copy()), shape=matrix.shape)
+    weighted.eliminate_zeros()
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(weighted.indptr))
+    norms = np.sqrt(np.bincount(rows, weights=weighted.data ** 2, minlength=matrix.shape[0]))  # sums each row in order
+    weighted.data /= norms[rows]
+    return _drop_small(weighted, eps)
+
+
+def inverse_document_frequencies(dfs, nb_docs):
+    """log2(nb_docs / df) per token and 0 for tokens in no document; computed one token at a time, as gensim computes them"""
+    return np.array([math.log(float(nb_docs) / df, 2) if df else 0.0 for df in np.asarray(dfs).tolist()])
+
+
+def bm25(matrix, dfs=None, nb_docs=None, k1=1.5, b=0.75, average_length=None):
+    """Okapi BM25 weights: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length)), with the non-negative
+    idf = ln(1 + (nb_docs - df + 0.5) / (df + 0.5)) and the length of a document being the sum of its counts\n
+    :param scipy.sparse.csr_matrix matrix: the counts of the tokens in each document
+    :param numpy.ndarray dfs: the document frequency of each token; by default computed on the matrix
+    :param int nb_docs: the number of documents the frequencies were computed on; by default the number of rows of the matrix
+    :param float k1: saturation of the counts
+    :param float b: strength of the document length normalization
+    :param float average_length: the average length of the documents; by default computed on the matrix
+    :rtype: scipy.sparse.csr_matrix
+    """
+    dfs, nb_docs = _frequencies(matrix, dfs, nb_docs)
+    idfs = np.log1p((nb_docs - dfs + 0.5) / (dfs + 0.5))
+    lengths = np.asarray(matrix.sum(axis=1)).ravel()
+    if average_length is None:
+        average_length = lengths.mean() if len(lengths) else 0.0
+    row_lengths = np.repeat(lengths / average_length if average_length else lengths, np.diff(matrix.indptr))
+    tf = matrix.data
+    weighted = csr_matrix((idfs[matrix.indices] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * row_lengths)), matrix.indices.copy(), matrix.indptr.copy()), shape=matrix.shape)
+    return _drop_small(weighted, 0.0)
+
+
+def log_count(matrix, dfs=None, nb_docs=None):
+    """Dampen the counts to ln(1 + count)"""
+    return csr_matrix((np.log1p(matrix.data), matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def documents(matrix, start=0, end=None, block_size=10000):
+    """Iterate over the rows in [start, end) of a weights matrix, each as a list of (token_id, weight) tuples"""
+    end = matrix.shape[0] if end is None else min(end, matrix.shape[0])
+    for block_start in range(start, end, block_size):
+        offsets = matrix.indptr[block_start:min(block_start + block_size, end) + 1].tolist()
+        indices = matrix.indices[offsets[0]:offsets[-1]].tolist()
+        data = matrix.data[offsets[0]:offsets[-1]].tolist()
+        for first, last in zip(offsets[:-1], offsets[1:]):
+            yield list(zip(indices[first - offsets[0]:last - offsets[0]], data[first - offsets[0]:last - offsets[0]]))
+
+
+weightings = {'tfidf': tfidf, 'bm25': bm25, 'log-count': log_count}
+
+
+def corpus_statistics(bow_corpus, nb_tokens, block_size=100000):
+    """The document frequency of each token, the number of documents and their total length (sum of counts) in a single pass over
+    a bag-of-words corpus (patm.corpus.BaseBowCorpus), a block of documents at a time"""
+    indptr, indices, counts = bow_corpus.arrays
+    dfs, total_length = np.zeros(nb_tokens, dtype=np.int64), 0.0
+    for block_start in range(0, len(indptr) - 1, block_size):
+        first, last = int(indptr[block_start]), int(indptr[min(block_start + block_size, len(indptr) - 1)])
+        dfs += np.bincount(indices[first:last], minlength=nb_tokens)  # a token is listed once per document
+        total_length += float(np.sum(counts[first:last], dtype=np.float64))
+    return dfs, len(indptr) - 1, total_length
+
+
+def weighting_parameters(bow_corpus, data_model, nb_tokens, dfs=None, nb_docs=None):
+    """The key arguments the weighting function of the data model ('tfidf', 'bm25' or 'log-count') needs to weight any block of the
+    documents of a bag-of-words corpus the way it would weight all of them at once. They are computed in a pass over the corpus.\n
+    :param numpy.ndarray dfs: the document frequency of each token; by default computed on the corpus
+    :param int nb_docs: the number of documents the frequencies were computed on; by default the number of documents of the corpus
+    :rtype: dict
+    """
+    if data_model not in weightings:
+        raise ValueError("Unsupported weight '{}'; use one of [counts, {}]".format(data_model, ', '.join(sorted(weightings))))
+    if data_model == 'log-count':
+        return {}
+    corpus_dfs, corpus_nb_docs, total_length = corpus_statistics(bow_corpus, nb_tokens)
+    if dfs is None:
+        dfs, nb_docs = corpus_dfs, corpus_nb_docs
+    if data_model == 'tfidf':
+        return {'idfs': inverse_document_frequencies(dfs, nb_docs)}
+    return {'dfs': np.asarray(dfs, dtype=np.float64), 'nb_docs': nb_docs, 'average_length': total_length / corpus_nb_docs if corpus_nb_docs else 0.0}
+
+
+def weighted_documents(bow_corpus, data_model, nb_tokens, parameters, start=0, end=None, block_size=10000):
+    """Iterate over the documents in [start, end) of a bag-of-words corpus, weighted a block of documents at a time, each as a list of
+    (token_id, weight) tuples. Tokens of zero weight are left out.\n
+    :param str data_model: one of 'tfidf', 'bm25' or 'log-count'
+    :param dict parameters: the arguments of the weighting function, computed on the whole corpus (see weighting_parameters)
+    :rtype: generator
+    """
+    nb_docs = len(bow_corpus)
+    end = nb_docs if end is None else min(end, nb_docs)
+    for block_start in range(start, end, block_size):
+        block = block_matrix(bow_corpus, nb_tokens, block_start, min(block_start + block_size, end))
+        for doc in documents(weightings[data_model](block, **parameters)):
+            yield doc
+
+
+def block_matrix(bow_corpus, nb_tokens, start, end):
+    """The (documents x tokens) matrix of counts of the documents in [start, end) of a bag-of-words corpus"""
+    indptr, indices, counts = bow_corpus.arrays
+    offsets = np.asarray(indptr[start:end + 1], dtype=np.int64)
+    first, last = int(offsets[0]), int(offsets[-1])
+    return csr_matrix((np.asarray(counts[first:last], dtype=np.float64), np.asarray(indices[first:last]), offsets - first), shape=(end - start, nb_tokens))
+
+
+def _frequencies(matrix, dfs, nb_docs):
+    if dfs is None:
+        return document_frequencies(matrix).astype(np.float64), matrix.shape[0]
+    return np.asarray(dfs, dtype=np.float64), nb_docs
+
+
+def _drop_small(matrix, eps):
+    matrix.data[np.abs(matrix.data) <= eps] = 0
+    matrix.eliminate_zeros()
+    return matrix
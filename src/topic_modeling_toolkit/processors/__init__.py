@@ -1,3 +1,6 @@
 from .processor import Processor, InitializationNeededComponent, FinalizationNeededComponent, BaseDiskWriterWithPrologue
 
-from .pipeline import Pipeline
+from topic_modeling_toolkit.lazy import lazy_attributes
+
+# the Pipeline pulls in the string processors and their gensim and nltk dependencies, so it is imported on first access
+lazy_attributes(__name__, {'Pipeline': '.pipeline'})
@@ -5,6 +5,8 @@ class UciFormatWriter(BaseDiskWriterWithPrologue):
     """
     Injests a doc_vector at a time. For example [('2', 1), ('15', 4), ('18', 5), ('11', 3)]
     """
+    nb_prologue_lines = 3  # number of documents, vocabulary size and number of nonzero counts
+
     def __init__(self, fname='/data/thesis/data/myuci'):
         super(UciFormatWriter, self).__init__(fname, lambda x: write_uci(self.file_handler, map(lambda word_id_weight_tuple: (word_id_weight_tuple[0]+1, word_id_weight_tuple[1]), x), self.doc_num))
         # super(UciFormatWriter, self).__init__(fname, lambda x: write_uci(self.fname, x, self.doc_num))
@@ -13,6 +15,9 @@ class UciFormatWriter(BaseDiskWriterWithPrologue):
     def to_id(self):
         return 'uci'
 
+    def format_batch(self, data):
+        return uci_lines(data, self.doc_num)
+
 class VowpalFormatWriter(BaseDiskWriter):
     """
     Injests a (doc_vector, classes_ditct) at a time. For example ([('_builder', 1), ('alpha', 4)], {'author': 'Ivan Sokolov'})
@@ -23,11 +28,42 @@ class VowpalFormatWriter(BaseDiskWriter):
     def to_id(self):
         return 'vowpal'
 
+    def format_batch(self, data):
+        return vowpal_lines(data, self.doc_num)
+
 
 def write_uci(file_handler, doc_vector, doc_num):
     file_handler.writelines(map(lambda x: '{} {} {}\n'.format(doc_num, x[0], x[1]), doc_vector))
 
 
+def uci_lines(doc_vectors, first_doc_num):
+    """Formats consecutive document vectors as uci lines (see write_uci), shifting the word ids by one.\n
+    :param list doc_vectors: lists of (word_id, weight) tuples
+    :param int first_doc_num: the number of the first document
+    :return: the lines of all the documents
+    :rtype: list
+    """
+    lines = []
+    for doc_num, doc_vector in enumerate(doc_vectors, first_doc_num):
+        prefix = '{} '.format(doc_num)
+        lines.extend([prefix + str(word_id + 1) + ' ' + str(weight) + '\n' for word_id, weight in doc_vector])
+    return lines
+
+
+def vowpal_lines(docs, first_doc_num):
+    """Formats consecutive documents as Vowpal Wabbit lines (see write_vowpal_v2).\n
+    :param list docs: (doc_vector, class_labels) tuples
+    :param int first_doc_num: the number of the first document
+    :return: the lines of all the documents
+    :rtype: list
+    """
+    return ['doc{} 1.0 {} |@default_class {}\n'.format(
+        doc_num,
+        ' '.join(['|{} {}'.format(modality, ' '.join([str(_) for _ in modality_features[type(labels)](labels)])) for modality, labels in class_labels.items()]),
+        ' '.join([token if weight == 1 else '{}:{}'.format(token, weight) for token, weight in doc_vector]))
+        for doc_num, (doc_vector, class_labels) in enumerate(docs, first_doc_num)]
+
+
 def write_vowpal(file_handler, doc_vector, doc_num, class_labels):
     """
     Dumps a doument vector as a single line in the specified target file path in the "Vowpal Wabbit" format.\n
@@ -1,4 +1,11 @@
+import os
+import re
+import sys
+import hashlib
+from collections import OrderedDict
+
 from .processor import StateLessProcessor
+from .string_processors import gen_lemmatize, english_stopwords
 
 
 class GeneratorProcessor(StateLessProcessor):
@@ -6,32 +13,50 @@ class GeneratorProcessor(StateLessProcessor):
         return type(self).__name__
 
 
+NGRAMS_SEPARATOR = '_'
+
+
+class Ngram(str):
+    """A token generated by joining consecutive words with the NGRAMS_SEPARATOR; tells n-grams apart from words that contain the
+    separator themselves (ie 'user_name'), so that only the former are subject to the 'ngrams_min_count' threshold"""
+    __slots__ = ()
+
+
 def gen_ngrams(word_generator, degree):
     assert degree > 1
-    gen_empty = False
-    total = 0
-    queue = []
-    while total < degree:
-        queue.append(next(word_generator))
-        total += 1
-    yield '_'.join(queue)
-    total = 1  # total unigrams generated
-    while not gen_empty:
-        try:
-            del queue[0]
-            queue.append(next(word_generator))
-            yield '_'.join(queue)
-            total += 1
-        except StopIteration:
-            # print 'Generated {} {}-grams'.format(total, degree)
-            gen_empty = True
+    tokens = list(word_generator)
+    return (Ngram(NGRAMS_SEPARATOR.join(words)) for words in zip(*[tokens[i:] for i in range(degree)]))
+
+
+def gen_ngrams_range(word_generator, min_degree, max_degree):
+    """Generates the n-grams of every degree from min_degree to max_degree (included); degree 1 stands for the words themselves"""
+    tokens = list(word_generator)
+    for degree in range(min_degree, max_degree + 1):
+        if degree == 1:
+            for token in tokens:
+                yield token
+        else:
+            for ngram in gen_ngrams(tokens, degree):
+                yield ngram
 
 
 def ngrams_convertion(word_generator, degree):
     if degree == 1:
         return word_generator
+    elif isinstance(degree, tuple):
+        return gen_ngrams_range(word_generator, *degree)
     else:
-        return (_ for _ in gen_ngrams(word_generator, degree))
+        return gen_ngrams(word_generator, degree)
+
+
+def parse_degree(degree):
+    """Parses an 'ngrams' setting value; either a single degree (ie 2) or a range of degrees (ie '1-2' for unigrams and bigrams)"""
+    if isinstance(degree, int) or '-' not in str(degree):
+        return int(degree)
+    min_degree, max_degree = (int(_) for _ in str(degree).split('-'))
+    if not 1 <= min_degree <= max_degree:
+        raise ValueError("Invalid range of n-gram degrees '{}'".format(degree))
+    return (min_degree, max_degree) if min_degree < max_degree else min_degree
 
 
 def min_length_filter(word_generator, min_length):
@@ -46,37 +71,238 @@ def max_length_filter(word_generator, max_length):
     return (w for w in word_generator if len(w) <= max_length)
 
 
-class MinLengthFilter(GeneratorProcessor):
-    def __init__(self, min_length):
+def token_filter(word_generator, stopwords, min_length, max_length, pattern):
+    """Keeps the tokens with length in [min_length, max_length] that are not stopwords and do not fully match the pattern"""
+    if pattern is None:
+        return (w for w in word_generator if min_length <= len(w) <= max_length and w not in stopwords)
+    match = pattern.fullmatch
+    return (w for w in word_generator if min_length <= len(w) <= max_length and w not in stopwords and match(w) is None)
+
+
+# regular expressions of the tokens that the 'token_filters' setting can drop; each has to match the whole token
+token_patterns = OrderedDict([
+    ('numbers', r'[+-]?\d+(?:[.,:/]\d+)*(?:st|nd|rd|th|s|%)?'),
+    ('urls', r'(?:https?://|www\.)\S+|\S+\.(?:com|org|net|gov|edu|io)(?:/\S*)?'),
+    ('emails', r'[^@\s]+@[^@\s]+\.\w+'),
+    ('punctuation', r'[^\w\s]+'),
+])
+
+
+def parse_stopwords(source):
+    """Parses a 'stopwords' setting value; names of nltk stopwords corpora (ie 'english' or 'english-spanish') or the path of a file
+    with one stopword per line.\n
+    :rtype: frozenset
+    """
+    if os.path.isfile(source):
+        with open(source) as f:
+            return frozenset(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    if source == 'english':
+        return english_stopwords()
+    from nltk.corpus import stopwords
+    return frozenset(word for language in source.split('-') for word in stopwords.words(language))
+
+
+def stopwords_label(source):
+    """The form of a 'stopwords' setting value used in the pipeline id (and so in the key of the cached tokens). For a file path, the
+    file name without extension followed by a short hash of the stopwords it lists, so that editing the file changes the id."""
+    if not os.path.isfile(source):
+        return source
+    digest = hashlib.sha1('\n'.join(sorted(parse_stopwords(source))).encode('utf-8')).hexdigest()
+    return '{}-{}'.format(os.path.splitext(os.path.basename(source))[0], digest[:8])
+
+
+class TokenFilter(GeneratorProcessor):
+    """
+    Drops the tokens that are stopwords, are shorter than min_length or longer than max_length or fully match any of the patterns, in
+    a single pass with one set lookup and at most one regular expression match per token. Consecutive filters of a pipeline are fused
+    into one (see TokenFilter.fuse).
+    """
+    def __init__(self, stopwords=frozenset(), min_length=0, max_length=sys.maxsize, patterns=()):
+        self.stopwords = frozenset(stopwords)
         self.min_length = min_length
-        super(GeneratorProcessor, self).__init__(lambda x: min_length_filter(x, self.min_length))
+        self.max_length = max_length
+        self.patterns = tuple(patterns)
+        self.pattern = re.compile('|'.join('(?:{})'.format(_) for _ in self.patterns)) if self.patterns else None
+        super(GeneratorProcessor, self).__init__(lambda x: token_filter(x, self.stopwords, self._min_length, self._max_length, self.pattern))
+
+    # the effective bounds; subclasses clamp them
+    @property
+    def _min_length(self):
+        return self.min_length
+
+    @property
+    def _max_length(self):
+        return self.max_length
 
     def __str__(self):
-        return super(GeneratorProcessor, self).__str__() + '(' + str(self.min_length) + ')'
+        return super(GeneratorProcessor, self).__str__() + '({}, {}, {}, [{}])'.format(len(self.stopwords), self._min_length,
+                                                                                       self._max_length, ', '.join(self.patterns))
+
+    def to_id(self):
+        return 'token_filter'
+
+    @classmethod
+    def fuse(cls, filters):
+        """A single TokenFilter dropping every token that any of the given filters drops"""
+        return TokenFilter(stopwords=frozenset().union(*[_.stopwords for _ in filters]),
+                           min_length=max(_._min_length for _ in filters),
+                           max_length=min(_._max_length for _ in filters),
+                           patterns=[pattern for _ in filters for pattern in _.patterns])
+
+
+class MinLengthFilter(TokenFilter):
+    def __init__(self, min_length):
+        super(MinLengthFilter, self).__init__(min_length=min_length)
+
+    @property
+    def _min_length(self):
+        return max(2, self.min_length)
+
+    def __str__(self):
+        return type(self).__name__ + '(' + str(self.min_length) + ')'
 
     def to_id(self):
         return 'min_length-{}'.format(self.min_length)
 
 
-class MaxLengthFilter(GeneratorProcessor):
+class MaxLengthFilter(TokenFilter):
     def __init__(self, max_length):
-        self.max_length = max_length
-        super(GeneratorProcessor, self).__init__(lambda x: max_length_filter(x, self.max_length))
+        super(MaxLengthFilter, self).__init__(max_length=max_length)
+
+    @property
+    def _max_length(self):
+        return min(50, self.max_length)
 
     def __str__(self):
-        return super(GeneratorProcessor, self).__str__() + '(' + str(self.max_length) + ')'
+        return type(self).__name__ + '(' + str(self.max_length) + ')'
 
     def to_id(self):
         return 'max_length-{}'.format(self.max_length)
 
 
+class StopwordsFilter(TokenFilter):
+    def __init__(self, source):
+        """
+        :param str source: nltk stopwords corpora or a stopwords file (see parse_stopwords)
+        """
+        self.source = source
+        super(StopwordsFilter, self).__init__(stopwords=parse_stopwords(source))
+
+    def __str__(self):
+        return type(self).__name__ + '(' + stopwords_label(self.source) + ')'
+
+    def to_id(self):
+        return 'stopwords-{}'.format(stopwords_label(self.source))
+
+
+class PatternsFilter(TokenFilter):
+    def __init__(self, names):
+        """
+        :param str names: '-' separated names of token_patterns, ie 'numbers-urls'
+        """
+        self.names = names.split('-')
+        unknown = [_ for _ in self.names if _ not in token_patterns]
+        if unknown:
+            raise ValueError("Unknown token filters [{}]; use any of [{}]".format(', '.join(unknown), ', '.join(token_patterns)))
+        super(PatternsFilter, self).__init__(patterns=[token_patterns[_] for _ in self.names])
+
+    def __str__(self):
+        return type(self).__name__ + '(' + ', '.join(self.names) + ')'
+
+    def to_id(self):
+        return 'token_filters-{}'.format('-'.join(self.names))
+
+
 class WordToNgramGenerator(GeneratorProcessor):
     def __init__(self, degree):
-        super(GeneratorProcessor, self).__init__(lambda x: ngrams_convertion(x, degree))
-        self.degree = degree
+        """
+        :param degree: the degree of the n-grams to generate or a range of degrees as a 'min-max' string (see parse_degree)
+        """
+        self.degree = parse_degree(degree)
+        super(GeneratorProcessor, self).__init__(lambda x: ngrams_convertion(x, self.degree))
 
     def __str__(self):
         return super(GeneratorProcessor, self).__str__() + '(' + str(self.degree) + ')'
 
     def to_id(self):
-        return 'ngrams-{}'.format(self.degree)
+        return 'ngrams-{}'.format('-'.join(str(_) for _ in self.degree) if isinstance(self.degree, tuple) else self.degree)
+
+
+def lemmatize_token(token):
+    """Returns the lemmas of a single (surface form) token; none for stopwords and words not tagged as content words"""
+    return tuple(str(x.decode()).split('/')[0] for x in gen_lemmatize(token, stopwords=english_stopwords(), min_length=2, max_length=50))
+
+
+class LemmaCache(object):
+    """
+    Bounded cache mapping surface forms to their lemmas, evicting the least recently used entries first. It can be seeded with a
+    read-only snapshot of another cache (ie the one of the parent process, when lemmatizing in worker processes), which is looked
+    up when an entry is not found in the cache's own entries.
+    """
+    def __init__(self, max_size=100000, snapshot=None):
+        """
+        :param int max_size: the maximum number of (own) entries to keep
+        :param dict snapshot: read-only surface form to lemmas mapping to fall back to
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._snapshot = snapshot or {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return '{}({}/{}, snapshot: {}, hits: {}, misses: {})'.format(type(self).__name__, len(self), self.max_size, len(self._snapshot), self.hits, self.misses)
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def get(self, token):
+        """Returns the cached lemmas of the token or None if the token is not cached"""
+        if token in self._entries:
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return self._entries[token]
+        if token in self._snapshot:
+            self.hits += 1
+            return self._snapshot[token]
+        self.misses += 1
+        return None
+
+    def put(self, token, lemmas):
+        self._entries[token] = lemmas
+        self._entries.move_to_end(token)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def snapshot(self):
+        """Returns a plain (picklable) dict with all the entries of the cache, to be shared read-only with other processes"""
+        snapshot = dict(self._snapshot)
+        snapshot.update(self._entries)
+        return snapshot
+
+
+class TokenLemmatizer(GeneratorProcessor):
+    """Lemmatizes each token separately, looking its surface form up in a LemmaCache first, instead of lemmatizing the whole document
+    string like the StringLemmatizer does"""
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else LemmaCache()
+        super(GeneratorProcessor, self).__init__(self.lemmatize)
+
+    def __str__(self):
+        return super(GeneratorProcessor, self).__str__() + '(' + str(self.cache) + ')'
+
+    def lemmatize(self, word_generator):
+        for token in word_generator:
+            lemmas = self.cache.get(token)
+            if lemmas is None:
+                lemmas = lemmatize_token(token)
+                self.cache.put(token, lemmas)
+            for lemma in lemmas:
+                yield lemma
+
+    def to_id(self):
+        return 'lemmatize-tokens'
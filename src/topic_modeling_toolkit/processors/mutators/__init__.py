@@ -1 +1 @@
-from .mutators import DefaultTokenGeneratorTolist, OneElemListOfListToGenerator, GensimDictTokenGeneratorToListProcessor, StringToFieldsGenerator
+from .mutators import DefaultTokenGeneratorTolist, OneElemListOfListToGenerator, GensimDictTokenGeneratorToListProcessor, CountingDictionaryBuilder, StringToFieldsGenerator
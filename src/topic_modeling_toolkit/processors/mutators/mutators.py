@@ -1,5 +1,7 @@
+from collections import Counter
 from gensim.corpora import Dictionary
-from topic_modeling_toolkit.processors.processor import StateLessProcessor, PostUpdateSFProcessor, ElementCountingProcessor
+from topic_modeling_toolkit.processors.processor import StateLessProcessor, StateFullProcessor, PostUpdateSFProcessor, ElementCountingProcessor
+from topic_modeling_toolkit.processors.generator_processors import Ngram
 
 
 class TokenGeneratorToList(StateLessProcessor):
@@ -31,6 +33,40 @@ class GensimDictTokenGeneratorToListProcessor(PostUpdateSFProcessor):
         super(PostUpdateSFProcessor, self).__init__(lambda x: [[_ for _ in x]], Dictionary(), 'add_documents')
 
 
+class CountingDictionaryBuilder(StateFullProcessor):
+    """Assigns ids to the tokens of a document, accumulating their document and collection frequencies in a gensim Dictionary, and
+    returns the document's bag-of-words; all in a single pass over the tokens. Ids are assigned like Dictionary.add_documents does.
+    The ids of the tokens generated as n-grams (see generator_processors.Ngram) are collected in the dictionary's 'ngram_ids' set."""
+    def __init__(self, dictionary=None):
+        """
+        :param gensim.corpora.Dictionary dictionary: an existing dictionary to keep adding documents to; a new one by default
+        """
+        super(CountingDictionaryBuilder, self).__init__(self.doc2bow, dictionary if dictionary is not None else Dictionary(), 'add_documents')
+        if not hasattr(self._state, 'ngram_ids'):  # ie a dictionary persisted before n-grams were tracked
+            self._state.ngram_ids = set()
+
+    def doc2bow(self, tokens):
+        """
+        :param tokens: the tokens of the document
+        :return: the (token_id, count) tuples of the document, sorted by token id
+        :rtype: list
+        """
+        tokens = tokens if isinstance(tokens, list) else list(tokens)
+        counts = Counter(tokens)
+        token2id, dfs, cfs = self._state.token2id, self._state.dfs, self._state.cfs
+        for token in sorted(token for token in counts if token not in token2id):
+            token2id[str(token)] = len(token2id)  # n-grams are stored as plain strings
+        self._state.ngram_ids.update(token2id[token] for token in tokens if isinstance(token, Ngram))
+        bow = sorted((token2id[token], count) for token, count in counts.items())
+        for token_id, count in bow:
+            cfs[token_id] = cfs.get(token_id, 0) + count
+            dfs[token_id] = dfs.get(token_id, 0) + 1
+        self._state.num_docs += 1
+        self._state.num_pos += sum(counts.values())
+        self._state.num_nnz += len(bow)
+        return bow
+
+
 class StringToFieldsGenerator(StateLessProcessor):
     def __init__(self, category2files, fields, nb_docs='all'):
         self.failed = []
@@ -1,11 +1,13 @@
+import os
 from collections import OrderedDict
 from configparser import ConfigParser
 
-from topic_modeling_toolkit.processors.string_processors import MonoSpacer, StringProcessor, LowerCaser, UtfEncoder, DeAccenter, StringLemmatizer
-from topic_modeling_toolkit.processors.generator_processors import GeneratorProcessor, MinLengthFilter, MaxLengthFilter, WordToNgramGenerator
-from topic_modeling_toolkit.processors.string2generator import StringToTokenGenerator
+from topic_modeling_toolkit.processors.string_processors import MonoSpacer, StringProcessor, LowerCaser, UtfEncoder, DeAccenter, StringLemmatizer, FusedNormalizer
+from topic_modeling_toolkit.processors.generator_processors import GeneratorProcessor, MinLengthFilter, MaxLengthFilter, WordToNgramGenerator, TokenLemmatizer, \
+    TokenFilter, StopwordsFilter, PatternsFilter, stopwords_label
+from topic_modeling_toolkit.processors.string2generator import NormalizingTokenizer, tokenizers
 from topic_modeling_toolkit.processors import Processor, InitializationNeededComponent, FinalizationNeededComponent, BaseDiskWriterWithPrologue
-from topic_modeling_toolkit.processors.mutators import GensimDictTokenGeneratorToListProcessor, OneElemListOfListToGenerator
+from topic_modeling_toolkit.processors.mutators import CountingDictionaryBuilder
 
 from .disk_writer_processors import UciFormatWriter, VowpalFormatWriter
 from .processor import BaseDiskWriter
@@ -19,43 +21,61 @@ settings_value2processors = {
     'monospace': lambda x: MonoSpacer() if x else None,
     'unicode': lambda x: UtfEncoder() if x else None,
     'deaccent': lambda x: DeAccenter() if x else None,
-    'normalize': lambda x: StringLemmatizer() if x == 'lemmatize' else None,
+    'tokenizer': lambda x: None,  # the tokenizer is injected by the Pipeline (see Pipeline._inject_connectors)
+    'normalize': lambda x: StringLemmatizer() if x == 'lemmatize' else (TokenLemmatizer() if x == 'lemmatize-tokens' else None),
     'minlength': lambda x: MinLengthFilter(x) if x else None,
     'maxlength': lambda x: MaxLengthFilter(x) if x else None,
+    'stopwords': lambda x: StopwordsFilter(x) if x else None,
+    'token_filters': lambda x: PatternsFilter(x) if x else None,
     'ngrams': lambda x: WordToNgramGenerator(x) if x else None,
+    'ngrams_min_count': lambda x: x if x else None,
     'nobelow': lambda x: x if x else None,
     'noabove': lambda x: x if x else None,
     'weight': lambda x: x if x else None,
     'format': lambda x: {'uci': UciFormatWriter(), 'vowpal': VowpalFormatWriter()}[x] if x else None
 }
 
+# settings that only affect how the pipeline is executed and not the data it produces; they do not create processors and are not part of the id
+runtime_settings = ('workers', 'batch_size', 'streaming', 'cache', 'cache_size', 'compression', 'shards', 'artm_batch_size')
+
 
 class Pipeline(object):
 
     def __init__(self, settings):
         assert isinstance(settings, OrderedDict)
         self._parser = lambda x: ('format', x[1]) if x[0][:6] == 'format' else x
-        self._settings = settings
-        self.processors_names = [processor_name for processor_name, v in map(self._parser, settings.items()) if settings_value2processors[processor_name](v) is not None]
-        self.processors = [settings_value2processors[processor_name](v) for processor_name, v in map(self._parser, settings.items()) if settings_value2processors[processor_name](v) is not None]
+        self._settings = OrderedDict([(k, v) for k, v in settings.items() if k not in runtime_settings])
+        self._runtime_settings = {k: v for k, v in settings.items() if k in runtime_settings}
+        self.processors_names = [processor_name for processor_name, v in map(self._parser, self._settings.items()) if settings_value2processors[processor_name](v) is not None]
+        self.processors = [settings_value2processors[processor_name](v) for processor_name, v in map(self._parser, self._settings.items()) if settings_value2processors[processor_name](v) is not None]
         assert len(self.processors_names) == len(self.processors)
         self.str2gen_processor_index = 0
         self.token_gen2list_index = 0
         if not self._check_processors_pipeline():
             print(self)
             raise ProcessorsOrderNotSoundException('The first n components of the pipeline have to be StringProcessors and the following m GeneratorProcessors with n,m>0')
-        if any(isinstance(x, MonoSpacer) for x in self.processors):
-            # self._insert(0, StringToTokenGenerator(' '), 'single-space-tokenizer')
-            self.str2gen_processor = StringToTokenGenerator(' ')
-        else:
+        tokenizer = self._settings.get('tokenizer', 'single-space')
+        if tokenizer not in tokenizers:
+            raise SupportedTokenizerNotFoundException("Tokenizer '{}' is not supported; use one of [{}]".format(tokenizer, ', '.join(sorted(tokenizers))))
+        if tokenizer == 'single-space' and not any(isinstance(x, MonoSpacer) for x in self.processors):
             print(self)
-            raise SupportedTokenizerNotFoundException('The implemented \'single-space\' tokenizer requires the presence of a MonoSpacer processor in the pipeline')
+            raise SupportedTokenizerNotFoundException('The implemented \'single-space\' tokenizer requires the presence of a MonoSpacer processor in the pipeline; set another tokenizer to drop it')
+        self.str2gen_processor = tokenizers[tokenizer]()
+        # the settings of the processors before the 'dict-builder', which alone determine the tokens each document yields
+        self._tokens_settings = set(self.processors_names[:self.token_gen2list_index]) | {'tokenizer'}
         self._inject_connectors()
+        self._fuse_normalizers()
+        self._fuse_filters()
 
     @property
     def settings(self):
         return self._settings
 
+    @property
+    def runtime_settings(self):
+        """The settings that control how the pipeline gets executed (ie number of worker processes), without affecting its output"""
+        return self._runtime_settings
+
     def __len__(self):
         return len(self.processors)
 
@@ -79,14 +99,16 @@ class Pipeline(object):
         return [(name, proc_obj) for name, proc_obj in self if isinstance(proc_obj, BaseDiskWriter)]
 
     def initialize(self, *args, **kwargs):
-        """Call this method to initialize each of the pipeline's processors"""
+        """Call this method to initialize each of the pipeline's processors. Pass 'append=True' and the 'first_doc_num' to make the
+        disk writers append documents to existing files and 'compression' ('gzip' or 'zstd') to compress their output"""
         if self.disk_writers and not 'file_paths' in kwargs:
             logger.error("You have to supply the 'file_paths' list as a key argument, with each element being the target file path one per BaseDiskWriter processor.")
             return
         disk_writer_index = 0
         for pr_name, pr_obj in self:
             if isinstance(pr_obj, InitializationNeededComponent):
-                pr_obj.initialize(file_paths=kwargs.get('file_paths', []), disk_writer_index=disk_writer_index)
+                pr_obj.initialize(file_paths=kwargs.get('file_paths', []), disk_writer_index=disk_writer_index,
+                                  append=kwargs.get('append', False), first_doc_num=kwargs.get('first_doc_num', 1), compression=kwargs.get('compression'))
                 if isinstance(pr_obj, BaseDiskWriter):
                     disk_writer_index += 1
 
@@ -130,6 +152,13 @@ class Pipeline(object):
                 data = proc.process(data)
         return data
 
+    def pipe_through_batch(self, data, depth):
+        """Pass a list of data points (ie documents) through the first 'depth' processors, each processing the whole list at once"""
+        for proc in self.processors[:depth]:
+            if isinstance(proc, Processor):
+                data = proc.process_batch(data)
+        return data
+
     def pipe_through_processing_units(self, data):
         for proc in self.processors:
             if isinstance(proc, Processor) and not isinstance(proc, BaseDiskWriter):
@@ -159,9 +188,37 @@ class Pipeline(object):
         assert (self.str2gen_processor_index != 0 and self.token_gen2list_index != 0)
         # STRING PROCESSORS (strings are passing through)
         self._insert(self.str2gen_processor_index, self.str2gen_processor, 'str2token_gen')
-        # generators passing thorugh
-        self._insert(self.token_gen2list_index + 1, GensimDictTokenGeneratorToListProcessor(), 'dict-builder')
-        self._insert(self.token_gen2list_index + 2, OneElemListOfListToGenerator(), 'list2generator')
+        # generators passing thorugh; the dictionary builder turns them into bag-of-words
+        self._insert(self.token_gen2list_index + 1, CountingDictionaryBuilder(), 'dict-builder')
+
+    def _fuse_normalizers(self):
+        """Replace the leading lowercase, monospace, unicode and deaccent processors with a single FusedNormalizer. If the tokenizer
+        directly follows them, fuse it as well."""
+        i = 0
+        while i < len(self) and FusedNormalizer.can_fuse(self.processors[:i + 1]):
+            i += 1
+        if i < 2:
+            return
+        normalizer = FusedNormalizer(self.processors[:i])
+        name = '+'.join(self.processors_names[:i])
+        if NormalizingTokenizer.can_fuse(normalizer, self.processors[i]):
+            normalizer, name = NormalizingTokenizer(normalizer), 'str2token_gen'
+            i += 1
+        self.processors[:i] = [normalizer]
+        self.processors_names[:i] = [name]
+
+    def _fuse_filters(self):
+        """Replace each run of consecutive token filters (ie stopwords, minlength and maxlength) with a single TokenFilter, which
+        tests every token once"""
+        i = 0
+        while i < len(self):
+            j = i
+            while j < len(self) and isinstance(self.processors[j], TokenFilter):
+                j += 1
+            if j - i > 1:
+                self.processors[i:j] = [TokenFilter.fuse(self.processors[i:j])]
+                self.processors_names[i:j] = ['+'.join(self.processors_names[i:j])]
+            i += 1
 
     def _check_processors_pipeline(self):
         i = 0
@@ -190,12 +247,21 @@ class Pipeline(object):
                 return ''
         elif pipeline_component == 'format':
             return value
+        elif pipeline_component == 'stopwords':
+            return '{}-{}'.format(pipeline_component, stopwords_label(value))
         else:
             return '{}-{}'.format(pipeline_component, value)
 
     def get_id(self):
         return '_'.join(_ for _ in [self._tuple2string(pipeline_component, value) for pipeline_component, value in self._settings.items()] if _)
 
+    @property
+    def tokens_id(self):
+        """Encodes the settings of the string and token processors, which determine the tokens each document yields before reaching
+        the 'dict-builder'; dictionary level settings (ie ngrams_min_count, nobelow, noabove), the weight and the formats are left out"""
+        return '_'.join(_ for _ in [self._tuple2string(pipeline_component, value) for pipeline_component, value in self._settings.items()
+                                    if pipeline_component in self._tokens_settings] if _)
+
     @classmethod
     def from_cfg(cls, cfg_file_path):
         config = ConfigParser()
@@ -217,14 +283,26 @@ encode_pipeline_cfg = {
     'monospace': lambda x: bool(eval(x)),
     'unicode': lambda x: bool(eval(x)),
     'deaccent': lambda x: bool(eval(x)),
+    'tokenizer': str,
     'normalize': str,
     'minlength': int,
     'maxlength': int,
+    'stopwords': lambda x: x.strip() if os.path.isfile(x.strip()) else '-'.join(_.strip() for _ in x.split(',') if _.strip()),
+    'token_filters': lambda x: '-'.join(_.strip() for _ in x.split(',') if _.strip()),
     'nobelow': int,
     'noabove': float,
-    'ngrams': int,
+    'ngrams': lambda x: int(x) if x.strip().isdigit() else x.strip(),
+    'ngrams_min_count': int,
     'weight': str,
-    'format': str
+    'format': str,
+    'workers': int,
+    'batch_size': int,
+    'streaming': lambda x: bool(eval(x)),
+    'cache': str,
+    'cache_size': int,
+    'compression': str,
+    'shards': int,
+    'artm_batch_size': int
 }
 
 
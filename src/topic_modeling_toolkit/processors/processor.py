@@ -1,6 +1,8 @@
 import os
+import gzip
+import shutil
+import tempfile
 from abc import ABCMeta, abstractmethod, abstractproperty
-from functools import reduce
 
 
 import logging
@@ -53,6 +55,10 @@ class Processor(MetaProcessor):
     def process(self, data):
         return self.func(data)
 
+    def process_batch(self, data):
+        """Process a list of data points (ie documents) at once. Subclasses can override it to exploit vectorized implementations"""
+        return [self.process(x) for x in data]
+
     def to_id(self):
         return self.func.__name__
 
@@ -87,11 +93,15 @@ class PreUpdateSFProcessor(StateFullProcessor):
 
 
 class BaseDiskWriter(Processor, DiskWriterMetaProcessor):
-    """Ingests one doc vector at a time"""
+    """Ingests one doc vector at a time; or a batch of them, formatted into one buffer that is written at once"""
+    buffer_size = 16 * 1024 * 1024  # bytes of output buffered before each system write call
+
     def __init__(self, fname, func):
         self.doc_num = 1
         self.fname = fname
         self.file_handler = None
+        self.appending = False
+        self.compression = None
         super(BaseDiskWriter, self).__init__(func)
 
     def __str__(self):
@@ -107,26 +117,142 @@ class BaseDiskWriter(Processor, DiskWriterMetaProcessor):
             print('count:', self.doc_num, data[0])
             return None
 
+    def format_batch(self, data):
+        """Returns the lines representing the given consecutive data points (documents), numbered from self.doc_num on"""
+        raise NotImplementedError
+
+    def process_batch(self, data):
+        try:
+            self.file_handler.write(''.join(self.format_batch(data)))
+        except UnicodeEncodeError:  # locate the offending document(s)
+            for x in data:
+                self.process(x)
+            return
+        self.doc_num += len(data)
+
 
     def initialize(self, *args, **kwargs):
+        """Opens the target file. If the 'append' key argument is True, documents are appended to the existing file, starting the
+        numbering from the 'first_doc_num' key argument"""
         self.fname = kwargs['file_paths'][kwargs['disk_writer_index']]
         mkdir_p(os.path.dirname(self.fname))
-        self.file_handler = open(self.fname, 'w+')
+        self.appending = kwargs.get('append', False)
+        self.compression = kwargs.get('compression', None)
+        if self.appending:
+            self.file_handler = open_output(self.fname, 'a', compression=self.compression, buffer_size=self.buffer_size)
+            self.doc_num = kwargs.get('first_doc_num', 1)
+        else:
+            self.file_handler = open_output(self.fname, 'w', compression=self.compression, buffer_size=self.buffer_size)
 
     def finalize(self):
         self.file_handler.close()
 
 
 class BaseDiskWriterWithPrologue(BaseDiskWriter):
+    """Writes a prologue of 'nb_prologue_lines' numbers at the top of the file, when finalized. For uncompressed files a region of
+    zero-padded, fixed-width lines is reserved on initialization, so that the prologue can be patched in place, without rewriting the body"""
+    nb_prologue_lines = 0
+    prologue_width = 12  # digits per prologue line; a larger number triggers a one-off rewrite of the file
+
     def __init__(self, fname, func):
         super(BaseDiskWriterWithPrologue, self).__init__(fname, func)
 
+    def initialize(self, *args, **kwargs):
+        super(BaseDiskWriterWithPrologue, self).initialize(*args, **kwargs)
+        if not self.appending and self.compression is None:
+            self.file_handler.write(''.join(self._pad(0) + '\n' for _ in range(self.nb_prologue_lines)))
+
     def finalize(self, *args):
-        self.file_handler.seek(0)
-        _ = self.file_handler.read()
-        self.file_handler.seek(0, 0)
-        self.file_handler.write(reduce(lambda x,y: x+y, map(lambda x: x + '\n', args[0])).rstrip('\r\n') + '\n' + _)
         super(BaseDiskWriterWithPrologue, self).finalize()
+        prologue = list(args[0])
+        if self.compression is None:  # the file already starts with a prologue of the same number of lines
+            replace_prologue(self.fname, [self._pad(line) for line in prologue], len(prologue))
+        else:  # a compressed stream can not be patched
+            prepend_lines(self.fname, prologue, compression=self.compression)
+
+    def _pad(self, value):
+        return str(value).zfill(self.prologue_width)
+
+
+def open_output(file_path, mode, compression=None, buffer_size=-1):
+    """Opens a text file for writing ('w') or appending ('a'), optionally gzip or zstd (requires the 'zstandard' package) compressed"""
+    if compression is None:
+        return open(file_path, mode, buffering=buffer_size)
+    if compression == 'gzip':
+        return gzip.open(file_path, mode + 't', compresslevel=6, encoding='utf-8')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Writing zstd compressed files requires the 'zstandard' package")
+        return zstandard.open(file_path, mode + 't', encoding='utf-8')
+    raise ValueError("Unsupported compression '{}'; use one of [gzip, zstd]".format(compression))
+
+
+compression_extensions = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def file_compression(file_path):
+    """The compression of a file ('gzip' or 'zstd') according to its extension; None for an uncompressed file"""
+    for compression, extension in compression_extensions.items():
+        if file_path.endswith(extension):
+            return compression
+    return None
+
+
+def open_input(file_path, mode='r'):
+    """Opens a text ('r') or binary ('rb') file for reading, decompressing it on the fly if it has a .gz or .zst extension (see
+    open_output). Compressed files can not be seeked, so they can only be read from start to end"""
+    compression = file_compression(file_path)
+    if compression is None:
+        return open(file_path, mode)
+    text_mode = 'b' not in mode
+    if compression == 'gzip':
+        return gzip.open(file_path, 'rt' if text_mode else 'rb', encoding='utf-8' if text_mode else None)
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading zstd compressed files requires the 'zstandard' package")
+    return zstandard.open(file_path, 'rt' if text_mode else 'rb', encoding='utf-8' if text_mode else None)
+
+
+def decompress(file_path, target_path):
+    """Write the decompressed content of a .gz or .zst file in target_path, for readers that only accept plain files (ie artm)"""
+    with open_input(file_path, 'rb') as source, open(target_path, 'wb') as target:
+        shutil.copyfileobj(source, target, 16 * 1024 * 1024)
+
+
+def prepend_lines(file_path, lines, compression=None):
+    """Write the lines in a new file and copy the bytes of the given file after them, without decoding; a compressed file becomes a
+    multi-member gzip or multi-frame zstd stream, which decompresses to the concatenation of the lines and the original content"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)))
+    os.close(fd)
+    with open_output(tmp_path, 'w', compression=compression) as tmp_handler:
+        tmp_handler.write(''.join('{}\n'.format(line) for line in lines))
+    with open(tmp_path, 'ab') as tmp_handler, open(file_path, 'rb') as file_handler:
+        shutil.copyfileobj(file_handler, tmp_handler, 16 * 1024 * 1024)
+    os.replace(tmp_path, file_path)
+
+
+def replace_prologue(file_path, lines, nb_lines):
+    """Replace the first nb_lines lines of a file with the given lines. If they occupy the same number of bytes the file is patched in
+    place; otherwise the rest of the file is copied after the new lines into a new file, which replaces the original.\n
+    :param str file_path: the file to edit
+    :param list lines: the new prologue lines (without line endings)
+    :param int nb_lines: the number of lines of the existing prologue
+    """
+    new_prologue = ''.join('{}\n'.format(line) for line in lines).encode('utf-8')
+    with open(file_path, 'rb+') as file_handler:
+        old_prologue = b''.join(file_handler.readline() for _ in range(nb_lines))
+        if len(old_prologue) == len(new_prologue):
+            file_handler.seek(0)
+            file_handler.write(new_prologue)
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)))
+        with os.fdopen(fd, 'wb') as tmp_handler:
+            tmp_handler.write(new_prologue)
+            shutil.copyfileobj(file_handler, tmp_handler, 16 * 1024 * 1024)
+    os.replace(tmp_path, file_path)
 
 
 class StateLessProcessor(Processor):
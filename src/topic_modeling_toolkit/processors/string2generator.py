@@ -1,9 +1,7 @@
-from gensim.utils import lemmatize as gen_lemmatize
-from nltk.corpus import stopwords
+import re
 
 from .processor import StateLessProcessor
-
-en_stopwords = set(stopwords.words('english'))
+from .string_processors import FusedNormalizer
 
 
 class StringToGenerator(StateLessProcessor):
@@ -22,6 +20,56 @@ class StringToTokenGenerator(StringToGenerator):
     def __str__(self):
         return type(self).__name__ + "('" + str(self.splitter) + "')"
 
+
+class WhitespaceTokenizer(StringToGenerator):
+    """Splits on runs of any whitespace with the (C implemented) str.split, so the strings do not need to be mono-spaced first"""
+    def __init__(self):
+        super(StringToGenerator, self).__init__(lambda x: (_ for _ in x.split()))
+
+    def __str__(self):
+        return type(self).__name__
+
+
+class RegexTokenizer(StringToGenerator):
+    """Generates the words matched by a compiled regular expression, dropping punctuation along with whitespace"""
+    def __init__(self, pattern=r'\w+'):
+        self.regex = re.compile(pattern)
+        super(StringToGenerator, self).__init__(lambda x: (match.group() for match in self.regex.finditer(x)))
+
+    def __str__(self):
+        return type(self).__name__ + "('" + self.regex.pattern + "')"
+
+
+class NormalizingTokenizer(StringToTokenGenerator):
+    """Fuses a FusedNormalizer that includes a MonoSpacer with the single-space tokenizer that follows it: whitespace runs are
+    collapsed and the tokens are split in the same regex pass"""
+    splitter_regex = re.compile(r'\s{2,}| ')
+
+    def __init__(self, normalizer):
+        self.normalizer = normalizer
+        super(NormalizingTokenizer, self).__init__(' ')
+        self.func = self.tokenize
+
+    def __str__(self):
+        return '{}({})'.format(type(self).__name__, self.normalizer)
+
+    @staticmethod
+    def can_fuse(normalizer, tokenizer):
+        return isinstance(normalizer, FusedNormalizer) and normalizer.mono_space and type(tokenizer) is StringToTokenGenerator and tokenizer.splitter == ' '
+
+    def tokenize(self, a_string):
+        mapped = self.normalizer.map_characters(a_string)
+        if mapped is None:
+            return string2tokengenerator(self.normalizer.process(a_string), ' ')
+        return (_ for _ in self.splitter_regex.split(mapped))
+
+# the tokenizers that can be selected with the 'tokenizer' setting of a pipeline; 'single-space' is the default one
+tokenizers = {
+    'single-space': lambda: StringToTokenGenerator(' '),
+    'whitespace': WhitespaceTokenizer,
+    'regex': RegexTokenizer
+}
+
 #
 # class StringToLemmatizedTokenGenerator(StringToTokenGenerator):
 #     def __init__(self):
@@ -1,22 +1,51 @@
 import re
-from gensim.utils import deaccent as gen_deaccent
-from gensim.utils import lemmatize as gen_lemmatize
-from nltk.corpus import stopwords
+import unicodedata
+from functools import lru_cache
 
 from .processor import StateLessProcessor
 
-en_stopwords = set(stopwords.words('english'))
+
+# gensim and the nltk stopwords corpus are loaded on first use, instead of whenever a processor module is imported
+
+@lru_cache(maxsize=None)
+def english_stopwords():
+    """The nltk english stopwords, read once per process"""
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+
+def gen_deaccent(text):
+    from gensim.utils import deaccent
+    return deaccent(text)
+
+
+def gen_lemmatize(content, **kwargs):
+    from gensim.utils import lemmatize
+    return lemmatize(content, **kwargs)
 
 
 class StringProcessor(StateLessProcessor):
     pass
 
 
+DOCUMENTS_SEPARATOR = '\x00'
+
+
+def joined(strings):
+    """Joins the strings into one buffer, so that a string operation can run once over all of them. Returns None if the
+    separator character used is found inside any of the strings, in which case the buffer could not be split back correctly."""
+    buffer = DOCUMENTS_SEPARATOR.join(strings)
+    if buffer.count(DOCUMENTS_SEPARATOR) != max(len(strings) - 1, 0):
+        return None
+    return buffer
+
+
 def lowercase(a_string):
     return a_string.lower()
 
 
 reg = re.compile(r'\s{2,}')
+non_ascii = re.compile(r'[^\x00-\x7f]')  # str.isascii needs python 3.7
 
 
 def mono_space(a_string):
@@ -35,7 +64,7 @@ def utf8encode(a_string):
 
 def lemmatize(a_string):
     try:
-        return ' '.join(x[0] for x in [str(x.decode()).split('/') for x in gen_lemmatize(a_string, stopwords=en_stopwords, min_length=2, max_length=50)])
+        return ' '.join(x[0] for x in [str(x.decode()).split('/') for x in gen_lemmatize(a_string, stopwords=english_stopwords(), min_length=2, max_length=50)])
     except TypeError as e:
         raise TypeError("Error: {}. Input {} of type {}".format(e, a_string, type(a_string).__name__))
 
@@ -44,22 +73,113 @@ class LowerCaser(StringProcessor):
     def __init__(self):
         super(StringProcessor, self).__init__(lowercase)
 
+    def process_batch(self, data):
+        return [a_string.lower() for a_string in data]
+
 
 class MonoSpacer(StringProcessor):
     def __init__(self):
         super(StringProcessor, self).__init__(mono_space)
 
+    def process_batch(self, data):
+        buffer = joined(data)
+        if buffer is None or not data:
+            return super(MonoSpacer, self).process_batch(data)
+        return reg.sub(' ', buffer).split(DOCUMENTS_SEPARATOR)
+
 
 class UtfEncoder(StringProcessor):
     def __init__(self):
         super(StringProcessor, self).__init__(utf8encode)
 
+    def process_batch(self, data):
+        return list(data)
+
 
 class DeAccenter(StringProcessor):
     def __init__(self):
         super(StringProcessor, self).__init__(deaccent)
 
+    def process_batch(self, data):
+        buffer = joined(data)
+        if buffer is None or not data:
+            return super(DeAccenter, self).process_batch(data)
+        return gen_deaccent(buffer).split(DOCUMENTS_SEPARATOR)
+
 
 class StringLemmatizer(StringProcessor):
     def __init__(self):
         super(StringProcessor, self).__init__(lemmatize)
+
+
+class CharacterMappingTable(dict):
+    """A str.translate table, filled lazily with the lowercased and/or deaccented form of each character met. Characters that vanish
+    when deaccented (ie standalone combining marks) are mapped to the DOCUMENTS_SEPARATOR, so that their presence can be detected."""
+    def __init__(self, lower, strip_accents):
+        super(CharacterMappingTable, self).__init__()
+        self.lower = lower
+        self.strip_accents = strip_accents
+
+    def __missing__(self, ordinal):
+        character = chr(ordinal)
+        if self.lower:
+            character = character.lower()
+        if self.strip_accents:
+            character = gen_deaccent(character)
+        if not character:
+            character = DOCUMENTS_SEPARATOR
+        self[ordinal] = character
+        return character
+
+
+class FusedNormalizer(StringProcessor):
+    """
+    Does the job of a sequence of LowerCaser, MonoSpacer, UtfEncoder and DeAccenter processors (in that order; any of them can be
+    missing) with a single translation of the string through a precomputed character mapping table, followed by a single
+    whitespace collapsing pass. The results are identical to the ones of the sequence: the rare strings that a per character
+    mapping cannot handle (containing a capital sigma, whose lowercase form depends on its position, or a character that vanishes
+    when deaccented) are passed through the original processors instead.
+    """
+    fusable = (LowerCaser, MonoSpacer, UtfEncoder, DeAccenter)
+
+    def __init__(self, processors):
+        """
+        :param list processors: the processors to fuse; instances of the 'fusable' classes, in the order these are listed
+        """
+        if not self.can_fuse(processors):
+            raise ValueError("Can only fuse a sequence of [{}] processors, in that order".format(', '.join(x.__name__ for x in self.fusable)))
+        self.processors = list(processors)
+        self.lower = any(isinstance(x, LowerCaser) for x in processors)
+        self.strip_accents = any(isinstance(x, DeAccenter) for x in processors)
+        self.mono_space = any(isinstance(x, MonoSpacer) for x in processors)
+        self.table = CharacterMappingTable(self.lower, self.strip_accents)
+        super(StringProcessor, self).__init__(self.normalize)
+
+    def __str__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(str(x) for x in self.processors))
+
+    @classmethod
+    def can_fuse(cls, processors):
+        positions = [[isinstance(x, fusable_type) for fusable_type in cls.fusable].index(True) if isinstance(x, cls.fusable) else None for x in processors]
+        return None not in positions and positions == sorted(set(positions))
+
+    def map_characters(self, a_string):
+        """Lowercases and/or deaccents the string in one pass. Returns None if the per character mapping is not safe for this string"""
+        if self.lower and u'\u03a3' in a_string:
+            return None
+        mapped = a_string.translate(self.table)
+        if DOCUMENTS_SEPARATOR in mapped:
+            return None
+        if self.strip_accents and non_ascii.search(mapped):  # recompose characters split across the mapped ones (ie Hangul jamo)
+            mapped = unicodedata.normalize('NFC', mapped)
+        return mapped
+
+    def normalize(self, a_string):
+        mapped = self.map_characters(a_string)
+        if mapped is None:
+            for processor in self.processors:
+                a_string = processor.process(a_string)
+            return a_string
+        if self.mono_space:
+            return reg.sub(' ', mapped)
+        return mapped
@@ -2,7 +2,7 @@
 
 import os
 import click
-from .reporting import PsiReporter
+from . import reporting  # artm is imported on first access, after the arguments are parsed
 
 
 import logging
@@ -17,7 +17,7 @@ def main(dataset, model):
     if not collections_dir:
         raise RuntimeError(
             "Please set the COLLECTIONS_DIR environment variable with the path to a directory containing collections/datasets")
-    reporter = PsiReporter()
+    reporter = reporting.PsiReporter()
     dataset_path = os.path.join(collections_dir, dataset)
     reporter.dataset = dataset_path
 
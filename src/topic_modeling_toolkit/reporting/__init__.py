@@ -1,6 +1,11 @@
-from .model_selection import ResultsHandler
-from .reporter import ModelReporter
-from .dataset_reporter import DatasetReporter
-from .topics import TopicsHandler
-from .graph_builder import GraphMaker
-from .psi import PsiReporter
\ No newline at end of file
+from topic_modeling_toolkit.lazy import lazy_attributes
+
+# the reporters are imported on first access; ie only the PsiReporter needs artm and only the GraphMaker needs matplotlib
+lazy_attributes(__name__, {
+    'ResultsHandler': '.model_selection',
+    'ModelReporter': '.reporter',
+    'DatasetReporter': '.dataset_reporter',
+    'TopicsHandler': '.topics',
+    'GraphMaker': '.graph_builder',
+    'PsiReporter': '.psi',
+})
@@ -4,7 +4,8 @@ import glob
 import argparse
 from collections import Counter
 from topic_modeling_toolkit.patm.dataset import TextDataset
-from topic_modeling_toolkit.patm.definitions import BINARY_DICTIONARY_NAME, COOCURENCE_DICT_FILE_NAMES
+from topic_modeling_toolkit.patm.corpus import CsrCorpus
+from topic_modeling_toolkit.patm.definitions import BINARY_DICTIONARY_NAME, COOCURENCE_DICT_FILE_NAMES, CSR_CORPUS_DIR_NAME
 
 
 class bcolors(object):
@@ -44,13 +45,20 @@ class DatasetReporter(object):
         if not details:
             return '\n'.join(map(lambda x: '{}/{}'.format(self._cur_col, os.path.basename(x.path)), self.load_dts()))
         else:
-            c, n = class_distribution(os.path.join(self._r, self._cur_col, 'vowpal.{}.txt'.format(os.path.basename(self._cur_col))))
+            c, n = self._class_distribution()
             return '{}\n{}\n{}'.format('\n'.join(map(lambda x: self._wrap_color(str(x)), self.load_dts())),
                                        ', '.join(self._extract_files_info()),
                                        'Classes: [{}] with documents distribution [{}]'.format(
                                            ' '.join(sorted(c.keys())), ' '.join('{:.3f}'.format(c[x]/float(n)) for x in sorted(c.keys()))
                                        ))
 
+    def _class_distribution(self):
+        """Count the documents per class from the binary corpus of the collection if present, otherwise by parsing its vowpal file"""
+        col_dir = os.path.join(self._r, self._cur_col)
+        if CsrCorpus.exists(os.path.join(col_dir, CSR_CORPUS_DIR_NAME)):
+            return CsrCorpus(os.path.join(col_dir, CSR_CORPUS_DIR_NAME), os.path.join(col_dir, 'vocab.{}.txt'.format(os.path.basename(self._cur_col)))).class_distribution()
+        return class_distribution(os.path.join(col_dir, 'vowpal.{}.txt'.format(os.path.basename(self._cur_col))))
+
     def _wrap_color(self, b):
         ind = b.index(':')
         return bcolors.UNDERLINE + b[:ind] + bcolors.ENDC + b[ind:]
@@ -6,6 +6,7 @@ from collections import defaultdict
 import attr
 from math import log
 from topic_modeling_toolkit.results.experimental_results import ExperimentalResults
+from topic_modeling_toolkit.patm.cooccurrence import load_cooc_dictionary
 import artm
 import warnings
 import pandas as pd
@@ -368,17 +369,14 @@ class DatasetCollection(object):
     allowed_modality_names = attr.ib(init=True, default=['@labels_class', '@ideology_class'])
     name = attr.ib(init=False, default=attr.Factory(lambda self: path.basename(self.dir_path), takes_self=True))
     vocab_file = attr.ib(init=False, default=attr.Factory(lambda self: path.join(self.dir_path, 'vocab.{}.txt'.format(self.name)), takes_self=True))
-    lexicon = attr.ib(init=False, default=attr.Factory(lambda self: artm.Dictionary(name=self.name), takes_self=True))
+    lexicon = attr.ib(init=False, default=None)
     doc_labeling_modality_name = attr.ib(init=False, default='')
     class_names = attr.ib(init=False, default=[], validator=_class_names)
     # nb_docs = attr.ib(init=False, default=attr.Factory(lambda self: _file_len(path.join(self.dir_path, 'vowpal.{}.txt'.format(self.name))), takes_self=True))
     ppmi_file = attr.ib(init=False, default=attr.Factory(lambda self: self._cooc_tf(), takes_self=True))
 
     def __attrs_post_init__(self):
-        self.lexicon.gather(data_path=self.dir_path,
-                                       cooc_file_path=self.ppmi_file,
-                                       vocab_file_path=self.vocab_file,
-                                       symmetric_cooc_values=True)
+        self.lexicon = load_cooc_dictionary(self.name, self.dir_path, self.ppmi_file, self.vocab_file, symmetric_cooc_values=True)
 
     def _cooc_tf(self):
         c = glob('{}/ppmi_*tf.txt'.format(self.dir_path))
@@ -2,7 +2,7 @@ import re
 import os
 import sys
 from glob import glob
-from collections import Iterable
+from collections.abc import Iterable
 
 from .fitness import FitnessCalculator
 from .model_selection import ResultsHandler
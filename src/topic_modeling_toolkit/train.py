@@ -4,7 +4,7 @@ import os
 import sys
 import argparse
 
-from topic_modeling_toolkit.patm import TrainerFactory, Experiment
+from topic_modeling_toolkit import patm  # artm is imported on first access, after the arguments are parsed
 
 
 def get_cl_arguments():
@@ -28,9 +28,9 @@ def main():
         raise RuntimeError(
             "Please set the COLLECTIONS_DIR environment variable to the directory containing collections/datasets")
     root_dir = os.path.join(collections_dir, args.collection)
-    model_trainer = TrainerFactory().create_trainer(root_dir, exploit_ideology_labels=True,
+    model_trainer = patm.TrainerFactory().create_trainer(root_dir, exploit_ideology_labels=True,
                                                     force_new_batches=args.new_batches)
-    experiment = Experiment(root_dir)
+    experiment = patm.Experiment(root_dir)
     model_trainer.register(
         experiment)  # when the model_trainer trains, the experiment object keeps track of evaluation metrics
 
@@ -4,9 +4,14 @@ import argparse
 import os
 import sys
 import re
-from PyInquirer import prompt
 
-from topic_modeling_toolkit.patm import PipeHandler, CoherenceFilesBuilder, political_spectrum
+from topic_modeling_toolkit import patm  # its classes are imported on first access, after the arguments are parsed
+
+
+def prompt(questions):
+    """Ask the questions interactively; PyInquirer is imported only when a command actually prompts the user"""
+    from PyInquirer import prompt as inquirer_prompt
+    return inquirer_prompt(questions)
 
 
 def get_cl_arguments():
@@ -82,7 +87,7 @@ def _class_names(string):
 def ask_persist(pol_spctrum):
     return prompt([{'type': 'confirm',
                     'name': 'create-dataset',
-                    'message': "Use scheme [{}] with resulting distribution [{}]?".format(' '.join(pol_spctrum.class_names), ', '.join('{:.2f}'.format(x) for x in political_spectrum.class_distribution)),
+                    'message': "Use scheme [{}] with resulting distribution [{}]?".format(' '.join(pol_spctrum.class_names), ', '.join('{:.2f}'.format(x) for x in pol_spctrum.class_distribution)),
                     'default': True}])['create-dataset']
 
 
@@ -115,7 +120,8 @@ def main():
         raise RuntimeError(
             "Please set the COLLECTIONS_DIR environment variable with the path to a directory containing collections/datasets")
 
-    ph = PipeHandler()
+    political_spectrum = patm.political_spectrum
+    ph = patm.PipeHandler()
     ph.process(args.config, args.category, sample=nb_docs, verbose=True)
     political_spectrum.datapoint_ids = ph.outlet_ids
 
@@ -159,7 +165,7 @@ def main():
                 # print("Add the below to the DISCREETIZATION_SCHEMES_HASH")
                 # print("[{}]".format())
                 print('\nBuilding coocurences information')
-                coherence_builder = CoherenceFilesBuilder(os.path.join(collections_dir, args.collection))
+                coherence_builder = patm.CoherenceFilesBuilder(os.path.join(collections_dir, args.collection))
                 coherence_builder.create_files(cooc_window=args.window,
                                                min_tf=args.min_tf,
                                                min_df=args.min_df,
@@ -177,7 +183,7 @@ if __name__ == '__main__':
     # print(uci_dt)
     #
     # print('\nBuilding coocurences information')
-    # coherence_builder = CoherenceFilesBuilder(os.path.join(collections_dir, args.collection))
+    # coherence_builder = patm.CoherenceFilesBuilder(os.path.join(collections_dir, args.collection))
     # coherence_builder.create_files(cooc_window=args.window,
     #                                min_tf=args.min_tf,
     #                                min_df=args.min_df,
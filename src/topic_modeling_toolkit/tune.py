@@ -3,7 +3,7 @@
 from os import path
 import re
 import click
-from topic_modeling_toolkit.patm import Tuner
+from topic_modeling_toolkit import patm  # artm is imported on first access, after the arguments are parsed
 
 #parser = argparse.ArgumentParser(description='Performs grid-search over the parameter space by creating and training topic models', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
@@ -28,7 +28,7 @@ def main(dataset, prefix, overwrite, labeling_parameters, constants, explorables
     if not collections_dir:
         raise RuntimeError("Please set the COLLECTIONS_DIR environment variable with the path to a directory containing collections/datasets")
 
-    tuner = Tuner(path.join(collections_dir, dataset), {
+    tuner = patm.Tuner(path.join(collections_dir, dataset), {
         'perplexity': 'per',
         'sparsity-phi-@dc': 'sppd',
         'sparsity-phi-@ic': 'sppi',
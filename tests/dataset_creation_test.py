@@ -33,6 +33,19 @@ class TestDatasetTransformation(object):
 
         # assert pipe_handler.dict
         assert '|@default_class sign aftermath action call gop legislation spectrum take show subtle political make gun craft violence compel form similar shooting congress controlled'
+    def test_binary_corpus(self, test_dataset, pipe_n_quantities):
+        corpus = test_dataset.corpus
+        assert len(corpus) == pipe_n_quantities['resulting-nb-docs']
+        assert corpus.nnz == pipe_n_quantities['nb-bows']
+        assert corpus.matrix.shape == (pipe_n_quantities['resulting-nb-docs'], pipe_n_quantities['word-vocabulary-length'])
+        with open(test_dataset.bowf, 'r') as f:
+            lines = f.readlines()[3:]
+        assert lines == ['{} {} {}\n'.format(doc_num, token_id + 1, count) for doc_num, doc in enumerate(corpus, 1) for token_id, count in doc]
+        with open(test_dataset.words, 'r') as f:
+            assert [corpus.token(token_id) for token_id in range(3)] == [f.readline().rstrip('\n') for _ in range(3)]
+        class_distribution, nb_docs = corpus.class_distribution()
+        assert nb_docs == sum(class_distribution.values()) == pipe_n_quantities['resulting-nb-docs']
+
     def _formatter(self, pipe_settings):
         return lambda x: x if x in ['lowercase', 'monospace', 'unicode', 'deaccent'] else '{}-{}'.format(x, pipe_settings[x])
 
@@ -0,0 +1,181 @@
+import os
+import json
+from collections import OrderedDict
+import pytest
+import numpy as np
+
+from topic_modeling_toolkit.patm import PipeHandler
+from topic_modeling_toolkit.processors import Pipeline
+
+
+def _preprocess(pipe_n_quantities, **runtime_settings):
+    settings = Pipeline.from_cfg(pipe_n_quantities['unittest-pipeline-cfg']).settings
+    pipe_handler = PipeHandler()
+    pipe_handler.docs_per_task = 30
+    pipe_handler.process(Pipeline(OrderedDict(settings, **runtime_settings)), pipe_n_quantities['category'], sample=pipe_n_quantities['sample'])
+    return pipe_handler
+
+
+@pytest.fixture(scope='module')
+def parallel_preprocess_phase(pipe_n_quantities):
+    return _preprocess(pipe_n_quantities, workers=3)
+
+
+@pytest.fixture(scope='module')
+def streaming_preprocess_phase(pipe_n_quantities):
+    return _preprocess(pipe_n_quantities, streaming=True)
+
+
+class TestParallelPreprocessing(object):
+
+    def test_same_dictionary(self, preprocess_phase, parallel_preprocess_phase):
+        assert parallel_preprocess_phase.dct.token2id == preprocess_phase.dct.token2id
+        assert parallel_preprocess_phase.dct.dfs == preprocess_phase.dct.dfs
+        assert parallel_preprocess_phase.dct.num_docs == preprocess_phase.dct.num_docs
+
+    def test_same_corpus(self, preprocess_phase, parallel_preprocess_phase):
+        assert list(parallel_preprocess_phase.corpus) == list(preprocess_phase.corpus)
+        assert parallel_preprocess_phase.corpus_stats == preprocess_phase.corpus_stats
+        assert parallel_preprocess_phase.outlet_ids == preprocess_phase.outlet_ids
+
+
+class TestStreamingPreprocessing(object):
+
+    def test_same_dictionary(self, preprocess_phase, streaming_preprocess_phase):
+        assert streaming_preprocess_phase.dct.token2id == preprocess_phase.dct.token2id
+
+    def test_same_corpus(self, preprocess_phase, streaming_preprocess_phase):
+        assert len(streaming_preprocess_phase.corpus) == len(preprocess_phase.corpus)
+        assert [doc for doc in streaming_preprocess_phase.corpus] == list(preprocess_phase.corpus)
+        assert streaming_preprocess_phase.corpus_stats == preprocess_phase.corpus_stats
+        assert streaming_preprocess_phase.outlet_ids == preprocess_phase.outlet_ids
+
+
+@pytest.fixture(scope='module')
+def tokens_cache_path(tmpdir_factory):
+    return str(tmpdir_factory.mktemp('tokens-cache').join('tokens.sqlite'))
+
+
+class TestTokensCache(object):
+
+    def test_cached_tokens_reused(self, preprocess_phase, pipe_n_quantities, tokens_cache_path):
+        first_run = _preprocess(pipe_n_quantities, cache=tokens_cache_path)
+        second_run = _preprocess(pipe_n_quantities, cache=tokens_cache_path)
+        assert first_run.doc_gen_stats['cache-hits'] == 0
+        assert second_run.doc_gen_stats['cache-misses'] == 0
+        assert second_run.doc_gen_stats['cache-hits'] == first_run.doc_gen_stats['cache-misses']
+        assert list(second_run.corpus) == list(first_run.corpus) == list(preprocess_phase.corpus)
+
+    def test_dictionary_filtering_reuses_cached_tokens(self, pipe_n_quantities, tokens_cache_path):
+        _preprocess(pipe_n_quantities, cache=tokens_cache_path)
+        run = _preprocess(pipe_n_quantities, cache=tokens_cache_path, nobelow=2, ngrams_min_count=3)
+        assert run.doc_gen_stats['cache-misses'] == 0
+
+
+class TestAppendMode(object):
+
+    def test_append_documents(self, preprocess_phase, pipe_n_quantities, political_spectrum, collections_root_dir):
+        dataset_path = os.path.join(collections_root_dir, 'append-collection')
+        os.mkdir(dataset_path)
+        settings = Pipeline.from_cfg(pipe_n_quantities['unittest-pipeline-cfg']).settings
+        pipe_handler = PipeHandler()
+        pipe_handler.process(Pipeline(settings), pipe_n_quantities['category'], sample=pipe_n_quantities['sample'] // 2)
+        initial = pipe_handler.persist(dataset_path, political_spectrum.poster_id2ideology_label, political_spectrum.class_names)
+        with open(initial.words) as f:
+            initial_vocab = [line for line in f if '@labels_class' not in line]
+
+        appended = PipeHandler().append(Pipeline(settings), pipe_n_quantities['category'], dataset_path, political_spectrum.poster_id2ideology_label,
+                                        political_spectrum.class_names, sample=pipe_n_quantities['sample'])
+        assert appended._col_len == len(preprocess_phase.corpus)
+        with open(appended.words) as f:
+            assert f.readlines()[:len(initial_vocab)] == initial_vocab
+        with open(appended.bowf) as f:
+            assert [int(f.readline()) for _ in range(3)] == [preprocess_phase.dct.num_docs, appended.unigue, appended.nb_bows]
+        with open(appended.vowpal) as f:
+            assert sum(1 for _ in f) == appended._col_len
+        assert os.path.isfile(os.path.join(dataset_path, '{}.pkl'.format(appended.id)))
+        assert not os.path.isfile(os.path.join(dataset_path, '{}.pkl'.format(initial.id)))
+
+    def test_admitted_tokens_keep_the_documents_sorted(self, pipe_n_quantities, political_spectrum, collections_root_dir):
+        """Tokens below 'nobelow' in the initial documents have lower unfiltered ids than tokens of the vocabulary, but get ids after
+        it once the appended documents make them frequent enough"""
+        dataset_path = os.path.join(collections_root_dir, 'append-admitted-collection')
+        os.mkdir(dataset_path)
+        settings = OrderedDict(Pipeline.from_cfg(pipe_n_quantities['unittest-pipeline-cfg']).settings, nobelow=2)
+        PipeHandler().preprocess(pipe_n_quantities['category'], Pipeline(settings), dataset_path, political_spectrum.poster_id2ideology_label,
+                                 political_spectrum.class_names, sample=pipe_n_quantities['sample'] // 2)
+        with open(os.path.join(dataset_path, 'vocab.append-admitted-collection.txt')) as f:
+            initial_vocab_size = sum(1 for line in f if '@labels_class' not in line)
+        appended = PipeHandler().append(Pipeline(settings), pipe_n_quantities['category'], dataset_path, political_spectrum.poster_id2ideology_label,
+                                        political_spectrum.class_names, sample=pipe_n_quantities['sample'])
+        assert appended.unigue > initial_vocab_size
+        with open(appended.bowf) as f:
+            pairs = [tuple(int(_) for _ in line.split()[:2]) for line in f.readlines()[3:]]
+        assert pairs == sorted(pairs)
+        corpus = appended.corpus
+        assert all((np.diff(corpus.indices[start:end].astype(np.int64)) > 0).all() for start, end in zip(corpus.indptr[:-1], corpus.indptr[1:]))
+
+
+class TestShardedOutput(object):
+
+    def test_shards_concatenate_to_the_collection(self, preprocess_phase, pipe_n_quantities, political_spectrum, collections_root_dir):
+        dataset_path = os.path.join(collections_root_dir, 'sharded-collection')
+        os.mkdir(dataset_path)
+        pipe_handler = _preprocess(pipe_n_quantities, shards=3)
+        dataset = pipe_handler.persist(dataset_path, political_spectrum.poster_id2ideology_label, political_spectrum.class_names)
+        with open(dataset.manifest) as f:
+            manifest = json.load(f)
+        assert len(manifest['shards']) == 3
+        assert sum(shard['nb_docs'] for shard in manifest['shards']) == manifest['nb_docs'] == len(preprocess_phase.corpus)
+        assert sum(shard['nb_bows'] for shard in manifest['shards']) == dataset.nb_bows
+        titles = []
+        for shard in manifest['shards']:
+            with open(os.path.join(dataset_path, shard['uci'])) as f:
+                assert [int(f.readline()) for _ in range(3)] == [shard['nb_docs'], dataset.unigue, shard['nb_bows']]
+            with open(os.path.join(dataset_path, shard['vowpal'])) as f:
+                titles.extend(line.split(' ', 1)[0] for line in f)
+        assert titles == ['doc{}'.format(i) for i in range(1, len(preprocess_phase.corpus) + 1)]
+        assert dataset.vowpal_files == [os.path.join(dataset_path, shard['vowpal']) for shard in manifest['shards']]
+        assert dataset.uci_files == [os.path.join(dataset_path, shard['uci']) for shard in manifest['shards']]
+
+    @pytest.mark.parametrize('exploit_ideology_labels', [True, False])
+    def test_sharded_dataset_trains(self, exploit_ideology_labels, pipe_n_quantities, political_spectrum, collections_root_dir):
+        from artm import messages
+        from topic_modeling_toolkit.patm import CoherenceFilesBuilder, TrainerFactory
+        dataset_path = os.path.join(collections_root_dir, 'sharded-collection-{}'.format(exploit_ideology_labels))
+        os.mkdir(dataset_path)
+        pipe_handler = _preprocess(pipe_n_quantities, shards=3)
+        dataset = pipe_handler.persist(dataset_path, political_spectrum.poster_id2ideology_label, political_spectrum.class_names)
+        CoherenceFilesBuilder(dataset_path).create_files(cooc_window=10)
+        assert os.path.isfile(os.path.join(dataset_path, 'ppmi_0_tf.txt'))
+        trainer = TrainerFactory().create_trainer(dataset_path, exploit_ideology_labels=exploit_ideology_labels, force_new_batches=True)
+        assert 'tf' in trainer.ppmi_dicts
+        batches_dir = os.path.join(dataset_path, TrainerFactory.ideology_flag2batches_dir_name[exploit_ideology_labels])
+        item_ids = []
+        for name in os.listdir(batches_dir):
+            batch = messages.Batch()
+            with open(os.path.join(batches_dir, name), 'rb') as f:
+                batch.ParseFromString(f.read())
+            item_ids.extend(item.id for item in batch.item)
+        assert len(set(item_ids)) == len(item_ids) == dataset._col_len
+
+
+class TestArtmBatches(object):
+
+    def test_batches_match_vowpal_file(self, pipe_n_quantities, political_spectrum, collections_root_dir):
+        from artm import messages
+        dataset_path = os.path.join(collections_root_dir, 'batches-collection')
+        os.mkdir(dataset_path)
+        pipe_handler = _preprocess(pipe_n_quantities, artm_batch_size=40)
+        dataset = pipe_handler.persist(dataset_path, political_spectrum.poster_id2ideology_label, political_spectrum.class_names)
+        for batches_dir_name, class_ids in (('vow-batches', {'@default_class', '@labels_class'}), ('uci-batches', {'@default_class'})):
+            batches_dir = os.path.join(dataset_path, batches_dir_name)
+            titles = {}
+            for name in os.listdir(batches_dir):
+                batch = messages.Batch()
+                with open(os.path.join(batches_dir, name), 'rb') as f:
+                    batch.ParseFromString(f.read())
+                assert len(batch.item) <= 40
+                assert set(batch.class_id) == class_ids
+                titles.update((item.id, item.title) for item in batch.item)
+            assert [titles[doc_num] for doc_num in sorted(titles)] == ['doc{}'.format(i) for i in range(1, dataset._col_len + 1)]
@@ -0,0 +1,69 @@
+import os
+import pytest
+from topic_modeling_toolkit.processors.string_processors import LowerCaser, MonoSpacer, UtfEncoder, DeAccenter
+from topic_modeling_toolkit.processors.disk_writer_processors import UciFormatWriter, VowpalFormatWriter
+
+
+@pytest.fixture(scope='module')
+def documents():
+    return ['Similar calls  have been made', u'Café   naïve ÉCOLE', '', '  leading and trailing  ', 'null\x00separated  text']
+
+
+@pytest.mark.parametrize('processor', [LowerCaser(), MonoSpacer(), UtfEncoder(), DeAccenter()])
+def test_batch_matches_per_document(processor, documents):
+    assert processor.process_batch(documents) == [processor.process(doc) for doc in documents]
+    assert processor.process_batch(documents[:2]) == [processor.process(doc) for doc in documents[:2]]
+    assert processor.process_batch([]) == []
+
+
+@pytest.mark.parametrize('writer, docs', [
+    (UciFormatWriter(), [[(0, 1), (4, 2)], [], [(2, 0.25)]]),
+    (VowpalFormatWriter(), [([('alpha', 1), ('beta', 3)], {'@labels_class': 'liberal'}), ([('gamma', 0.5)], {'@labels_class': ['a', 'b']})]),
+])
+def test_batch_writing_matches_per_document(writer, docs, tmpdir):
+    batch_file, per_document_file = str(tmpdir.join('batch.txt')), str(tmpdir.join('per-document.txt'))
+    for target, write in ((batch_file, lambda: writer.process_batch(docs)), (per_document_file, lambda: [writer.process(doc) for doc in docs])):
+        writer.doc_num = 1
+        writer.initialize(file_paths=[target], disk_writer_index=0)
+        write()
+        writer.file_handler.close()
+        assert writer.doc_num == len(docs) + 1
+    with open(batch_file) as f1, open(per_document_file) as f2:
+        assert f1.read() == f2.read()
+
+
+def test_uci_prologue_is_patched_in_place(tmpdir):
+    writer, target = UciFormatWriter(), str(tmpdir.join('docword.txt'))
+    writer.initialize(file_paths=[target], disk_writer_index=0)
+    writer.process_batch([[(0, 1), (4, 2)], [(2, 3)]])
+    inode = os.stat(target).st_ino
+    writer.finalize(['2', '5', '3'])
+    assert os.stat(target).st_ino == inode
+    with open(target) as f:
+        assert f.read() == '000000000002\n000000000005\n000000000003\n1 1 1\n1 5 2\n2 3 3\n'
+
+
+def test_uci_prologue_wider_than_reserved(tmpdir):
+    writer, target = UciFormatWriter(), str(tmpdir.join('docword.txt'))
+    writer.initialize(file_paths=[target], disk_writer_index=0)
+    writer.process_batch([[(0, 1)]])
+    writer.finalize(['1', '1', str(10 ** 13)])
+    with open(target) as f:
+        assert [int(f.readline()) for _ in range(3)] == [1, 1, 10 ** 13]
+        assert f.read() == '1 1 1\n'
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+def test_compressed_output_reads_back(compression, tmpdir):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    from topic_modeling_toolkit.processors.processor import open_input, decompress
+    writer, target = VowpalFormatWriter(), str(tmpdir.join('vowpal.txt' + {'gzip': '.gz', 'zstd': '.zst'}[compression]))
+    writer.initialize(file_paths=[target], disk_writer_index=0, compression=compression)
+    writer.process_batch([([('alpha', 1), ('beta', 3)], {'@labels_class': 'liberal'})])
+    writer.finalize()
+    expected = 'doc1 1.0 |@labels_class liberal |@default_class alpha beta:3\n'
+    with open_input(target) as f:
+        assert f.read() == expected
+    decompress(target, str(tmpdir.join('plain.txt')))
+    assert tmpdir.join('plain.txt').read() == expected
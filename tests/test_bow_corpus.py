@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pytest
+from topic_modeling_toolkit.patm.corpus import BowCorpus, DiskBowCorpus, CorpusStats, CsrCorpus, remap_bow_corpus, append_to_npy
+
+
+@pytest.fixture(scope='module')
+def documents():
+    return [[(0, 2), (3, 1)], [], [(1, 1), (2, 4), (4, 1)], [(3, 3)], [(0, 1), (4, 2)]]
+
+
+@pytest.mark.parametrize('corpus_type', [BowCorpus, DiskBowCorpus])
+def test_corpus_layout(corpus_type, documents):
+    corpus = corpus_type()
+    for doc in documents:
+        corpus.append([token_id for token_id, _ in doc], [count for _, count in doc])
+    assert (len(corpus), corpus.nnz) == (5, 8)
+    assert list(corpus) == documents
+    assert list(corpus.documents(1, 4)) == documents[1:4]
+    assert corpus.stats == CorpusStats(nb_docs=5, num_pos=15, num_nnz=8, empty_docs=1)
+
+
+@pytest.mark.parametrize('corpus_type', [BowCorpus, DiskBowCorpus])
+def test_remap_drops_filtered_tokens_and_empty_documents(corpus_type, documents):
+    corpus = BowCorpus()
+    for doc in documents:
+        corpus.append([token_id for token_id, _ in doc], [count for _, count in doc])
+    corpus.block_size = 2
+    id_map = [0, -1, 1, -1, 2]
+    remapped, kept = remap_bow_corpus(corpus, id_map, corpus_type())
+    expected = [[(id_map[token_id], count) for token_id, count in doc if id_map[token_id] >= 0] for doc in documents]
+    assert list(remapped) == [doc for doc in expected if doc]
+    assert kept.tolist() == [True, False, True, False, True]
+    assert remapped.stats == CorpusStats(nb_docs=3, num_pos=10, num_nnz=5, empty_docs=0)
+
+
+def test_remap_sorts_the_pairs_of_each_document(documents):
+    corpus = BowCorpus()
+    for doc in documents:
+        corpus.append([token_id for token_id, _ in doc], [count for _, count in doc])
+    corpus.block_size = 2
+    id_map = [0, 1, 2, 4, 3]  # ie token 3 was below 'nobelow' and got admitted after the existing vocabulary when appending
+    remapped, _ = remap_bow_corpus(corpus, id_map, BowCorpus(), sort=True)
+    assert list(remapped) == [sorted((id_map[token_id], count) for token_id, count in doc) for doc in documents if doc]
+    assert list(remapped)[3] == [(0, 1), (3, 2)]
+
+
+def test_appending_grows_the_binary_corpus_in_place(tmpdir, documents):
+    vocab_file = str(tmpdir.join('vocab.txt'))
+    with open(vocab_file, 'w') as f:
+        f.write('alpha\nbeta\ngamma\n|@labels_class\nliberal @labels_class\n')
+    directory = str(tmpdir.join('csr'))
+    corpus = CsrCorpus.save(directory, documents[:3], ['liberal', 'liberal', 'conservative'], vocab_file, 3)
+    inodes = {name: os.stat(os.path.join(directory, name + '.npy')).st_ino for name in ('indptr', 'indices', 'counts', 'labels')}
+    with open(vocab_file, 'w') as f:  # the admitted tokens follow the existing ones, before the class labels
+        f.write('alpha\nbeta\ngamma\ndelta\nepsilon\n|@labels_class\nliberal @labels_class\n')
+    corpus = corpus.append(documents[3:], ['socialist', 'liberal'], 5)
+    assert inodes == {name: os.stat(os.path.join(directory, name + '.npy')).st_ino for name in inodes}
+    assert list(corpus) == documents
+    assert [corpus.label_names[label] for label in corpus.labels] == ['liberal', 'liberal', 'conservative', 'socialist', 'liberal']
+    assert [corpus.token(token_id) for token_id in range(5)] == ['alpha', 'beta', 'gamma', 'delta', 'epsilon']
+    assert corpus.matrix.shape == (5, 5)
+
+
+def test_append_to_npy_rewrites_files_without_room_in_the_header(tmpdir):
+    path = str(tmpdir.join('values.npy'))
+    np.save(path, np.arange(3, dtype=np.int64))
+    with open(path, 'rb') as f:
+        data = f.read()
+    header_length = np.frombuffer(data[8:10], dtype='<u2')[0]
+    header = data[10:10 + header_length].rstrip(b' \n')
+    with open(path, 'wb') as f:  # a header without padding, leaving no room for a longer shape
+        f.write(data[:8] + np.array([len(header) + 1], dtype='<u2').tobytes() + header + b'\n' + data[10 + header_length:])
+    append_to_npy(path, np.arange(3, 13))
+    assert np.load(path).tolist() == list(range(13))
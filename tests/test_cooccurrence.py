@@ -0,0 +1,208 @@
+import os
+import sys
+import math
+import types
+import pytest
+import numpy as np
+from topic_modeling_toolkit.patm.build_coherence import CoherenceFilesBuilder
+from topic_modeling_toolkit.patm.cooccurrence import count_cooccurrences, ppmi_tf, ppmi_df, count_files, line_aligned_ranges, read_vocabulary, \
+    vowpal_token_ids, load_cooc_dictionary, top_k_per_token, frequent_pairs
+
+
+@pytest.fixture(scope='module')
+def documents():
+    return [[0, 1, 2, 1], [1, 2], [3], [2, 0, 3]]
+
+
+def test_counts(documents):
+    counts = count_cooccurrences(documents, 4, window=2, block_size=3)
+    assert counts.nb_docs == 4
+    assert counts.token_dfs.tolist() == [2, 2, 3, 2]
+    assert counts.tf.toarray().tolist() == [[0, 1, 2, 1],
+                                            [1, 0, 3, 0],
+                                            [2, 3, 0, 1],
+                                            [1, 0, 1, 0]]
+    assert counts.df.toarray().tolist() == [[0, 1, 2, 1],
+                                            [1, 0, 2, 0],
+                                            [2, 2, 0, 1],
+                                            [1, 0, 1, 0]]
+    assert (counts.tf != counts.tf.T).nnz == 0
+
+
+
+def test_blocks_are_not_added_to_the_whole_counts(monkeypatch):
+    from topic_modeling_toolkit.patm.cooccurrence import CooccurrenceCounts
+    documents = np.random.RandomState(0).randint(0, 1000, size=(200, 30)).tolist()
+    expected = count_cooccurrences(documents, 1000, window=3, block_size=len(documents))
+    pushed, merged, push, merge = [], [], CooccurrenceCounts._push, CooccurrenceCounts._merge_last
+
+    def counting_push(self, tf, df):
+        pushed.append(tf.nnz)
+        push(self, tf, df)
+
+    def counting_merge(self):
+        merge(self)
+        merged.append(self._partial_counts[-1][0].nnz)
+    monkeypatch.setattr(CooccurrenceCounts, '_push', counting_push)
+    monkeypatch.setattr(CooccurrenceCounts, '_merge_last', counting_merge)
+    counts = count_cooccurrences(documents, 1000, window=3, block_size=1)
+    assert (counts.tf != expected.tf).nnz == 0 and (counts.df != expected.df).nnz == 0
+    # adding each block to the accumulated counts would copy about len(documents) / 2 times as many entries as the blocks hold
+    assert sum(merged) < 2 * math.log(len(documents), 2) * sum(pushed)
+
+def test_ppmi(documents):
+    counts = count_cooccurrences(documents, 4, window=2)
+    tf = ppmi_tf(counts.tf, min_tf=2)
+    assert sorted(zip(*tf.nonzero())) == [(0, 2), (1, 2), (2, 0), (2, 1)]
+    assert tf[1, 2] == pytest.approx(math.log(3 * 16. / (4 * 6)))
+    df = ppmi_df(counts.df, counts.token_dfs, counts.nb_docs)
+    assert df[0, 3] == 0  # ln(1 * 4 / (2 * 2)) is not positive
+    assert df[1, 2] == pytest.approx(math.log(2 * 4. / (2 * 3)))
+
+
+def test_pruning():
+    from scipy.sparse import csr_matrix
+    matrix = csr_matrix(np.array([[0, 3., 1, 2], [3, 0, 0, 5], [1, 0, 0, 1], [2, 5, 1, 0]]))
+    assert top_k_per_token(matrix, 2).toarray().tolist() == [[0, 3, 0, 2], [3, 0, 0, 5], [1, 0, 0, 1], [2, 5, 0, 0]]
+    assert top_k_per_token(matrix, 9).toarray().tolist() == matrix.toarray().tolist()
+    assert frequent_pairs(matrix, [4, 1, 2, 3], 2).toarray().tolist() == [[0, 0, 1, 2], [0, 0, 0, 0], [1, 0, 0, 1], [2, 0, 1, 0]]
+
+
+def test_pruned_ppmi_files(random_collection, tmpdir):
+    collection = tmpdir.mkdir('col')
+    for name, source in zip(('vowpal.col.txt', 'vocab.col.txt'), random_collection):
+        collection.join(name).write(open(source).read())
+    builder = CoherenceFilesBuilder(str(collection))
+    builder.create_files(cooc_window=3)
+    full = collection.join('ppmi_0_tf.txt').read()
+    builder.create_files(cooc_window=3, top_k=4, min_token_df=30)
+    pruned = [line.split() for line in collection.join('ppmi_0_tf.txt').read().splitlines()]
+    assert len(collection.join('ppmi_0_tf.txt').read()) < len(full)
+    assert all(len(line) <= 1 + 2 * 4 for line in pruned)
+    full_values = {(line[0], v): float(val) for line in (_.split() for _ in full.splitlines()) for v, val in zip(line[1::2], line[2::2])}
+    assert all(full_values[(line[0], v)] == float(val) for line in pruned for v, val in zip(line[1::2], line[2::2]))
+
+
+def test_files_are_zero_indexed(tmpdir):
+    collection = tmpdir.mkdir('col')
+    collection.join('vocab.col.txt').write('alpha\nbeta\ngamma\nliberal @labels_class\n')
+    collection.join('vowpal.col.txt').write('doc1 1.0 |@labels_class liberal |@default_class alpha beta:2 gamma\n'
+                                            'doc2 1.0 |@labels_class liberal |@default_class beta gamma\n')
+    CoherenceFilesBuilder(str(collection)).create_files(cooc_window=1)
+    assert collection.join('cooc_0_tf.txt').read() == '0 1 1\n1 0 1 2 2\n2 1 2\n'
+    assert collection.join('cooc_0_df.txt').read() == '0 1 1\n1 0 1 2 2\n2 1 2\n'
+    assert sorted(_.basename for _ in collection.listdir()) == ['cooc_0_df.txt', 'cooc_0_tf.txt', 'ppmi_0_df.txt', 'ppmi_0_tf.txt',
+                                                                'vocab.col.txt', 'vowpal.col.txt']
+
+
+@pytest.fixture
+def random_collection(tmpdir):
+    random = np.random.RandomState(1)
+    tmpdir.join('vocab.txt').write(''.join('token{}\n'.format(i) for i in range(50)) + 'liberal @labels_class\n')
+    tmpdir.join('vowpal.txt').write(''.join('doc{} 1.0 |@labels_class liberal |@default_class {}\n'.format(
+        i, ' '.join('token{}:{}'.format(_, random.randint(1, 4)) for _ in random.randint(0, 50, size=random.randint(0, 30))))
+        for i in range(300)))
+    return str(tmpdir.join('vowpal.txt')), str(tmpdir.join('vocab.txt'))
+
+
+def test_compressed_vowpal_file(random_collection, tmpdir):
+    import gzip
+    plain, compressed = tmpdir.mkdir('plain'), tmpdir.mkdir('compressed')
+    for collection in (plain, compressed):
+        collection.join('vocab.{}.txt'.format(collection.basename)).write(open(random_collection[1]).read())
+    plain.join('vowpal.plain.txt').write(open(random_collection[0]).read())
+    with gzip.open(str(compressed.join('vowpal.compressed.txt.gz')), 'wt') as f:
+        f.write(open(random_collection[0]).read())
+    for collection in (plain, compressed):
+        CoherenceFilesBuilder(str(collection)).create_files(cooc_window=3, workers=2)
+    for name in ('cooc_0_tf.txt', 'cooc_0_df.txt', 'ppmi_0_tf.txt', 'ppmi_0_df.txt'):
+        assert compressed.join(name).read() == plain.join(name).read()
+
+
+def test_sharded_collection(random_collection, tmpdir):
+    import json
+    single, sharded = tmpdir.mkdir('single'), tmpdir.mkdir('sharded')
+    for collection in (single, sharded):
+        collection.join('vocab.{}.txt'.format(collection.basename)).write(open(random_collection[1]).read())
+    lines = open(random_collection[0]).readlines()
+    single.join('vowpal.single.txt').write(''.join(lines))
+    shards = []
+    for index, start in enumerate(range(0, len(lines), 120)):
+        sharded.join('vowpal.sharded.{:03d}.txt'.format(index)).write(''.join(lines[start:start + 120]))
+        shards.append({'vowpal': 'vowpal.sharded.{:03d}.txt'.format(index), 'first_doc_num': start + 1, 'nb_docs': len(lines[start:start + 120])})
+    sharded.join('manifest.sharded.json').write(json.dumps({'collection': 'sharded', 'nb_docs': len(lines), 'shards': shards}))
+    for collection in (single, sharded):
+        CoherenceFilesBuilder(str(collection)).create_files(cooc_window=3, workers=2)
+    for name in ('cooc_0_tf.txt', 'cooc_0_df.txt', 'ppmi_0_tf.txt', 'ppmi_0_df.txt'):
+        assert sharded.join(name).read() == single.join(name).read()
+
+
+def test_line_aligned_ranges(random_collection):
+    ranges = line_aligned_ranges(random_collection[0], 7)
+    assert ranges[0][0] == 0 and all(end == start for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]))
+    with open(random_collection[0], 'rb') as f:
+        content = f.read()
+    assert ranges[-1][1] == len(content) and all(content[start - 1:start] == b'\n' for start, _ in ranges[1:])
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_parallel_spilled_counts_match(workers, random_collection, tmpdir):
+    vowpal_file, vocab_file = random_collection
+    token2id, nb_tokens = read_vocabulary(vocab_file)
+    expected = count_cooccurrences(vowpal_token_ids(vowpal_file, token2id), nb_tokens, window=4)
+    counts = count_files({'train': vowpal_file, 'test': vowpal_file}, vocab_file, window=4, workers=workers, max_bytes=1, block_size=20,
+                         spill_dir=str(tmpdir))
+    for split in ('train', 'test'):
+        assert (counts[split].tf != expected.tf).nnz == 0 and (counts[split].df != expected.df).nnz == 0
+        assert counts[split].token_dfs.tolist() == expected.token_dfs.tolist() and counts[split].nb_docs == 300
+    assert not [_ for _ in tmpdir.listdir() if _.basename.startswith('cooc-')]
+
+
+def test_legacy_files_get_zero_indexed(tmpdir):
+    collection = tmpdir.mkdir('col')
+    collection.join('vocab.col.txt').write('alpha\nbeta\ngamma\n')
+    collection.join('vowpal.col.txt').write('doc1 1.0 |@default_class alpha beta gamma\n')
+    for name in ('cooc_0_tf.txt', 'cooc_0_df.txt', 'ppmi_0_tf.txt', 'ppmi_0_df.txt'):
+        collection.join(name).write('1 2 3\n2 1 3 3 0.5\n3 2 1e-05\n')
+    CoherenceFilesBuilder(str(collection)).zero_index(workers=2)
+    for name in ('cooc_0_tf.txt', 'cooc_0_df.txt', 'ppmi_0_tf.txt', 'ppmi_0_df.txt'):
+        assert collection.join(name).read() == '0 1 3\n1 0 3 2 0.5\n2 1 1e-05\n'
+    assert sorted(_.basename for _ in collection.listdir())[:4] == ['cooc_0_df.txt', 'cooc_0_tf.txt', 'ppmi_0_df.txt', 'ppmi_0_tf.txt']
+    assert len(collection.listdir()) == 6
+
+
+class Dictionary(object):
+    """Records how the artm dictionaries of the test below get their content"""
+    calls = []
+
+    def __init__(self, name=None):
+        self.name = name
+
+    def gather(self, **kwargs):
+        self.calls.append('gather')
+
+    def save(self, dictionary_path):
+        with open(dictionary_path, 'w') as f:
+            f.write(self.name)
+
+    def load(self, dictionary_path):
+        self.calls.append('load')
+
+
+def test_binary_dictionary_is_reused_until_the_sources_change(tmpdir, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'artm', types.SimpleNamespace(Dictionary=Dictionary))
+    cooc_file, vocab_file = tmpdir.join('ppmi_0_tf.txt'), tmpdir.join('vocab.col.txt')
+    cooc_file.write('0 1 0.5\n')
+    vocab_file.write('alpha\nbeta\n')
+
+    def load():
+        load_cooc_dictionary('ppmi_0_tf.txt', str(tmpdir), str(cooc_file), str(vocab_file))
+
+    load()
+    load()
+    assert Dictionary.calls == ['gather', 'load'] and tmpdir.join('ppmi_0_tf.dict').check()
+    cooc_file.write('0 1 0.75\n')
+    os.utime(str(cooc_file), ns=(0, 10 ** 9))
+    load()
+    load()
+    assert Dictionary.calls == ['gather', 'load', 'gather', 'load']
@@ -0,0 +1,31 @@
+import pytest
+import pandas as pd
+
+pyarrow = pytest.importorskip('pyarrow')
+import pyarrow.feather
+
+from topic_modeling_toolkit.patm.modeling.dataset_extraction import read_columns
+
+
+@pytest.fixture
+def dataframe():
+    return pd.DataFrame({'text': ['alpha beta', 'gamma'], 'poster_id': ['p1', 'p2'], 'likes': [3, 4]})
+
+
+@pytest.mark.parametrize('version', [1, 2])
+def test_feather_reads_the_requested_columns_only(version, dataframe, tmpdir, monkeypatch):
+    data_file = str(tmpdir.join('posts.feather'))
+    pyarrow.feather.write_feather(dataframe, data_file, version=version)
+    read_table, requested = pyarrow.feather.read_table, []
+    monkeypatch.setattr(pyarrow.feather, 'read_table', lambda *args, **kwargs: requested.append(kwargs.get('columns')) or read_table(*args, **kwargs))
+    assert read_columns(data_file, ('text', 'poster_id')) == ([0, 1], {'text': ['alpha beta', 'gamma'], 'poster_id': ['p1', 'p2']})
+    assert requested[-1] == ['text', 'poster_id']
+    if version == 2:
+        assert requested == [['text', 'poster_id']]
+    assert read_columns(data_file, ('text', 'missing'))[1] == {'text': ['alpha beta', 'gamma']}
+
+
+def test_parquet_reads_the_requested_columns_only(dataframe, tmpdir):
+    data_file = str(tmpdir.join('posts.parquet'))
+    dataframe.to_parquet(data_file)
+    assert read_columns(data_file, ('poster_id',)) == ([0, 1], {'poster_id': ['p1', 'p2']})
@@ -0,0 +1,13 @@
+from gensim.corpora import Dictionary
+from topic_modeling_toolkit.processors.mutators import CountingDictionaryBuilder
+
+
+def test_matches_gensim_dictionary():
+    documents = [['similar', 'calls', 'have', 'been', 'made', 'calls'], [], ['made', 'anew', 'zebra', 'anew'], ['calls']]
+    builder = CountingDictionaryBuilder()
+    bows = [builder.process(iter(doc)) for doc in documents]
+    dictionary = Dictionary()
+    assert bows == [dictionary.doc2bow(doc, allow_update=True) for doc in documents]
+    assert builder.state.token2id == dictionary.token2id
+    assert (builder.state.dfs, builder.state.cfs) == (dictionary.dfs, dictionary.cfs)
+    assert (builder.state.num_docs, builder.state.num_pos, builder.state.num_nnz) == (dictionary.num_docs, dictionary.num_pos, dictionary.num_nnz)
@@ -0,0 +1,30 @@
+import pytest
+from topic_modeling_toolkit.processors.string_processors import LowerCaser, MonoSpacer, UtfEncoder, DeAccenter, FusedNormalizer
+from topic_modeling_toolkit.processors.string2generator import NormalizingTokenizer
+
+
+@pytest.fixture(scope='module')
+def documents():
+    return ['Similar calls  have been made', u'Café   naïve ÉCOLE', '', '  leading\t and trailing \n', u'ΟΔΥΣΣΕΥΣ  Σ', u'combininǵ mark', u'가 jamo']
+
+
+@pytest.mark.parametrize('processors', [
+    [LowerCaser(), MonoSpacer(), UtfEncoder(), DeAccenter()],
+    [LowerCaser(), DeAccenter()],
+    [MonoSpacer(), UtfEncoder()],
+])
+def test_fused_matches_sequence(processors, documents):
+    normalizer = FusedNormalizer(processors)
+    for doc in documents:
+        expected = doc
+        for processor in processors:
+            expected = processor.process(expected)
+        assert normalizer.process(doc) == expected
+        if normalizer.mono_space:
+            assert list(NormalizingTokenizer(normalizer).process(doc)) == expected.split(' ')
+
+
+def test_only_canonical_order_is_fused():
+    assert not FusedNormalizer.can_fuse([DeAccenter(), LowerCaser()])
+    with pytest.raises(ValueError):
+        FusedNormalizer([MonoSpacer(), MonoSpacer()])
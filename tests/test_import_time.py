@@ -0,0 +1,51 @@
+import os
+import sys
+import subprocess
+import pytest
+
+import topic_modeling_toolkit
+
+# the interpreter is spawned afresh for every measurement, since modules imported by this process are cached
+heavy_dependencies = ('artm', 'gensim', 'pandas', 'matplotlib', 'easyplot', 'nltk', 'PyInquirer')
+
+# generous, so that only regressions in the order of re-introducing a heavy dependency fail the test
+IMPORT_TIME_BUDGET = float(os.getenv('IMPORT_TIME_BUDGET', 1.5))  # seconds
+
+
+def _run(code, *options):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(topic_modeling_toolkit.__file__))] +
+                                                      [_ for _ in [os.getenv('PYTHONPATH')] if _]))
+    ro = subprocess.run([sys.executable] + list(options) + ['-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True)
+    assert ro.returncode == 0, ro.stderr
+    return ro
+
+
+def _cumulative_import_time(module):
+    """Microseconds importing the module took, including its own imports, as reported by 'python -X importtime'"""
+    lines = _run('import {}'.format(module), '-X', 'importtime').stderr.splitlines()
+    return max(int(line.split('|')[1]) for line in lines if line.startswith('import time:') and line.split('|')[2].strip() == module)
+
+
+@pytest.mark.parametrize('module', ['report_datasets', 'report_models', 'report_topics', 'report_kl', 'make_graphs', 'transform', 'train', 'tune'])
+def test_entry_points_import_no_heavy_dependency(module):
+    loaded = _run('import sys; import topic_modeling_toolkit.{}; print(" ".join(sorted(set(_.split(".")[0] for _ in sys.modules))))'.format(module)).stdout.split()
+    assert not [_ for _ in heavy_dependencies if _ in loaded]
+
+
+def test_reporters_import_neither_artm_nor_gensim():
+    loaded = _run('import sys; from topic_modeling_toolkit.reporting import ModelReporter, DatasetReporter, TopicsHandler, ResultsHandler; '
+                  'print(" ".join(sorted(set(_.split(".")[0] for _ in sys.modules))))').stdout.split()
+    assert 'artm' not in loaded and 'gensim' not in loaded
+
+
+@pytest.mark.parametrize('module', ['topic_modeling_toolkit.report_models', 'topic_modeling_toolkit.report_datasets', 'topic_modeling_toolkit.transform'])
+def test_import_time_budget(module):
+    assert _cumulative_import_time(module) < IMPORT_TIME_BUDGET * 1e6
+
+
+@pytest.mark.parametrize('package, name', [('topic_modeling_toolkit.reporting', 'ResultsHandler'), ('topic_modeling_toolkit.processors', 'Pipeline')])
+def test_lazy_attributes_need_no_module_getattr(package, name):
+    # python 3.6 ignores a module level __getattr__, so the names must resolve through the class of the package module
+    out = _run('import importlib; p = importlib.import_module("{0}"); print("__getattr__" in vars(p), type(p).__name__, "{1}" in dir(p), '
+               'getattr(p, "{1}").__name__, "{1}" in vars(p))'.format(package, name)).stdout.split()
+    assert out == ['False', 'LazyModule', 'True', name, 'True']
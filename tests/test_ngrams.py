@@ -0,0 +1,74 @@
+import pytest
+from topic_modeling_toolkit.processors.generator_processors import WordToNgramGenerator
+
+
+@pytest.fixture(scope='module')
+def words():
+    return ['similar', 'calls', 'have', 'been', 'made']
+
+
+@pytest.mark.parametrize('degree, expected', [
+    (1, ['similar', 'calls', 'have', 'been', 'made']),
+    (2, ['similar_calls', 'calls_have', 'have_been', 'been_made']),
+    (3, ['similar_calls_have', 'calls_have_been', 'have_been_made']),
+    ('1-2', ['similar', 'calls', 'have', 'been', 'made', 'similar_calls', 'calls_have', 'have_been', 'been_made']),
+    ('2-3', ['similar_calls', 'calls_have', 'have_been', 'been_made', 'similar_calls_have', 'calls_have_been', 'have_been_made']),
+])
+def test_ngrams(degree, expected, words):
+    assert list(WordToNgramGenerator(degree).process(iter(words))) == expected
+
+
+def test_documents_shorter_than_degree(words):
+    assert list(WordToNgramGenerator(3).process(iter(words[:2]))) == []
+    assert list(WordToNgramGenerator('1-3').process(iter(words[:1]))) == words[:1]
+    with pytest.raises(ValueError):
+        WordToNgramGenerator('2-1')
+
+
+def test_dictionary_level_settings_keep_the_tokens_id():
+    from collections import OrderedDict
+    from topic_modeling_toolkit.processors import Pipeline
+
+    def pipeline(**settings):
+        return Pipeline(OrderedDict([('lowercase', True), ('monospace', True), ('minlength', 2), ('ngrams', settings.get('ngrams', 2)),
+                                     ('ngrams_min_count', settings.get('ngrams_min_count', 2)), ('nobelow', settings.get('nobelow', 1)),
+                                     ('noabove', 0.5), ('weight', 'counts'), ('format1', 'uci')]))
+    tokens_id = pipeline().tokens_id
+    assert tokens_id == 'lowercase_monospace_minlength-2_ngrams-2'
+    assert pipeline(ngrams_min_count=5).tokens_id == pipeline(nobelow=3).tokens_id == tokens_id
+    assert pipeline(ngrams_min_count=5).get_id() != pipeline().get_id()
+    assert pipeline(ngrams='1-2').tokens_id != tokens_id
+
+
+def test_ngrams_are_told_apart_from_words_with_the_separator():
+    from topic_modeling_toolkit.processors.generator_processors import Ngram
+    from topic_modeling_toolkit.processors.mutators import CountingDictionaryBuilder
+    tokens = list(WordToNgramGenerator('1-2').process(iter(['user_name', 'says', 'hello'])))
+    assert [isinstance(token, Ngram) for token in tokens] == [False, False, False, True, True]
+    builder = CountingDictionaryBuilder()
+    builder.process(tokens)
+    assert sorted(token for token, token_id in builder.state.token2id.items() if token_id in builder.state.ngram_ids) == ['says_hello', 'user_name_says']
+    assert all(type(token) is str for token in builder.state.token2id)
+
+
+def test_cached_tokens_keep_their_ngrams(tmpdir):
+    from topic_modeling_toolkit.processors.generator_processors import Ngram
+    from topic_modeling_toolkit.patm.tokens_cache import TokensCache
+    cache = TokensCache(str(tmpdir.join('tokens.sqlite')))
+    cache.put('key', list(WordToNgramGenerator('1-2').process(iter(['user_name', 'says']))))
+    tokens = cache.get('key')
+    cache.close()
+    assert tokens == ['user_name', 'says', 'user_name_says']
+    assert [isinstance(token, Ngram) for token in tokens] == [False, False, True]
+
+
+def test_rare_ngrams_filter_keeps_words_with_the_separator():
+    from topic_modeling_toolkit.processors.mutators import CountingDictionaryBuilder
+    from topic_modeling_toolkit.patm.pipe_handler import PipeHandler, merge_dictionary
+    partial_builder = CountingDictionaryBuilder()
+    partial_builder.process(list(WordToNgramGenerator('1-2').process(iter(['user_name', 'says', 'hello']))))
+    pipe_handler = PipeHandler()
+    pipe_handler.dct = CountingDictionaryBuilder().state
+    merge_dictionary(pipe_handler.dct, partial_builder.state)
+    pipe_handler._filter_rare_ngrams(2)
+    assert sorted(pipe_handler.dct.token2id) == ['hello', 'says', 'user_name']
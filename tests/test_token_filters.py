@@ -0,0 +1,66 @@
+from collections import OrderedDict
+import pytest
+from topic_modeling_toolkit.processors import Pipeline
+from topic_modeling_toolkit.processors.generator_processors import TokenFilter, MinLengthFilter, MaxLengthFilter, StopwordsFilter, PatternsFilter
+
+
+@pytest.fixture(scope='module')
+def tokens():
+    return ['a', 'visit', 'on', '12', '3.5', '1990s', 'https://example.com/page', 'www.example.org', 'me@example.com', '--', 'extraordinarily']
+
+
+@pytest.fixture
+def stopwords_file(tmpdir):
+    target = tmpdir.join('my-stopwords.txt')
+    target.write('# comment\nvisit\n\non\n')
+    return str(target)
+
+
+@pytest.mark.parametrize('processor, expected', [
+    (MinLengthFilter(1), ['visit', 'on', '12', '3.5', '1990s', 'https://example.com/page', 'www.example.org', 'me@example.com', '--', 'extraordinarily']),
+    (MaxLengthFilter(10), ['a', 'visit', 'on', '12', '3.5', '1990s', '--']),
+    (PatternsFilter('numbers'), ['a', 'visit', 'on', 'https://example.com/page', 'www.example.org', 'me@example.com', '--', 'extraordinarily']),
+    (PatternsFilter('urls-emails-punctuation'), ['a', 'visit', 'on', '12', '3.5', '1990s', 'extraordinarily']),
+])
+def test_filters(processor, expected, tokens):
+    assert list(processor.process(iter(tokens))) == expected
+
+
+def test_stopwords_file(stopwords_file, tokens):
+    processor = StopwordsFilter(stopwords_file)
+    assert processor.stopwords == frozenset(['visit', 'on'])
+    assert processor.to_id().startswith('stopwords-my-stopwords-')
+    assert list(processor.process(iter(tokens[:3]))) == ['a']
+
+
+def test_editing_the_stopwords_file_changes_the_ids(stopwords_file):
+    def pipeline():
+        return Pipeline(OrderedDict([('lowercase', True), ('monospace', True), ('stopwords', stopwords_file), ('nobelow', 1), ('noabove', 0.5),
+                                     ('weight', 'counts')]))
+    ids = pipeline().get_id(), pipeline().tokens_id
+    with open(stopwords_file, 'a') as f:
+        f.write('a\n')
+    assert pipeline().get_id() != ids[0] and pipeline().tokens_id != ids[1]
+
+
+def test_unknown_pattern():
+    with pytest.raises(ValueError):
+        PatternsFilter('numbers-hashtags')
+
+
+def test_fused_filter_drops_what_each_filter_drops(stopwords_file, tokens):
+    filters = [MinLengthFilter(2), MaxLengthFilter(20), StopwordsFilter(stopwords_file), PatternsFilter('numbers-urls')]
+    fused = TokenFilter.fuse(filters)
+    expected = list(tokens)
+    for processor in filters:
+        expected = list(processor.process(iter(expected)))
+    assert list(fused.process(iter(tokens))) == expected == ['--', 'extraordinarily']
+
+
+def test_pipeline_fuses_consecutive_filters(stopwords_file):
+    pipeline = Pipeline(OrderedDict([('lowercase', True), ('monospace', True), ('minlength', 2), ('maxlength', 25), ('stopwords', stopwords_file),
+                                     ('token_filters', 'numbers'), ('nobelow', 1), ('noabove', 0.5), ('weight', 'counts')]))
+    assert pipeline.processors_names[1] == 'minlength+maxlength+stopwords+token_filters'
+    assert isinstance(pipeline.processors[1], TokenFilter)
+    assert '_token_filters-numbers' in pipeline.get_id() and 'stopwords-my-stopwords-' in pipeline.get_id()
+    assert list(pipeline.pipe_through('A visit  on 12 May', pipeline.processors_names.index('dict-builder'))) == ['may']
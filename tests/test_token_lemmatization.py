@@ -1,5 +1,6 @@
 import pytest
 from topic_modeling_toolkit.processors.string_processors import StringLemmatizer
+from topic_modeling_toolkit.processors.generator_processors import LemmaCache, TokenLemmatizer
 
 @pytest.fixture(scope='module')
 def lemmatize():
@@ -18,3 +19,33 @@ class TestLemmatizationBehaviour(object):
     def test_str_n_bytes_result(self, lemmatize, str_n_bytes_pair):
         assert lemmatize(str_n_bytes_pair) == 'similar call make'
         # assert lemmatize(str_n_bytes_pair[0]) == lemmatize(str_n_bytes_pair[1])
+
+
+class TestLemmaCache(object):
+
+    def test_least_recently_used_are_evicted(self):
+        cache = LemmaCache(max_size=2)
+        cache.put('calls', ('call',))
+        cache.put('made', ('make',))
+        assert cache.get('calls') == ('call',)
+        cache.put('been', ())
+        assert cache.get('made') is None
+        assert cache.get('been') == ()
+        assert len(cache) == 2
+        assert cache.stats == {'hits': 2, 'misses': 1}
+
+    def test_snapshot_is_looked_up(self):
+        cache = LemmaCache(max_size=1)
+        cache.put('calls', ('call',))
+        shared = LemmaCache(max_size=1, snapshot=cache.snapshot())
+        shared.put('made', ('make',))
+        assert shared.get('calls') == ('call',)
+        assert shared.snapshot() == {'calls': ('call',), 'made': ('make',)}
+        assert len(shared) == 1
+
+    def test_token_lemmatizer_uses_cache(self):
+        cache = LemmaCache()
+        cache.put('calls', ('call',))
+        cache.put('have', ())
+        assert list(TokenLemmatizer(cache=cache).process(iter(['calls', 'have', 'calls']))) == ['call', 'call']
+        assert cache.stats == {'hits': 3, 'misses': 0}
@@ -0,0 +1,26 @@
+import pytest
+from collections import OrderedDict
+from topic_modeling_toolkit.processors import Pipeline
+from topic_modeling_toolkit.processors.pipeline import SupportedTokenizerNotFoundException
+
+
+def _pipeline(**settings):
+    return Pipeline(OrderedDict([('lowercase', True)] + list(settings.items()) + [('minlength', 2), ('nobelow', 1), ('noabove', 0.5), ('weight', 'counts')]))
+
+
+@pytest.mark.parametrize('tokenizer, tokens', [
+    ('whitespace', ['hello,', 'world', 'foo', 'bar.']),
+    ('regex', ['hello', 'world', 'foo', 'bar']),
+])
+def test_tokenizer_setting(tokenizer, tokens):
+    pipeline = _pipeline(tokenizer=tokenizer)
+    assert list(pipeline.pipe_through(' Hello,  World\tfoo bar.', pipeline.processors_names.index('dict-builder'))) == tokens
+    assert 'tokenizer-{}'.format(tokenizer) in pipeline.get_id()
+
+
+def test_single_space_tokenizer_requires_monospace():
+    with pytest.raises(SupportedTokenizerNotFoundException):
+        _pipeline()
+    with pytest.raises(SupportedTokenizerNotFoundException):
+        _pipeline(tokenizer='nltk')
+    assert 'tokenizer' not in _pipeline(monospace=True).get_id()
@@ -0,0 +1,74 @@
+import os
+import gzip
+import pytest
+
+artm = pytest.importorskip('artm')
+
+from topic_modeling_toolkit.patm.modeling import trainer
+
+
+@pytest.fixture
+def vectorized(monkeypatch):
+    """Records the format and the content of the files each BatchVectorizer is given, while they exist"""
+    calls = []
+
+    def batch_vectorizer(collection_name=None, data_path='', data_format='batches', target_folder=None):
+        paths = [os.path.join(data_path, _) for _ in sorted(os.listdir(data_path))] if os.path.isdir(data_path) else [data_path]
+        calls.append((data_format, {os.path.basename(path): open(path).read() for path in paths}))
+    monkeypatch.setattr(trainer.artm, 'BatchVectorizer', batch_vectorizer)
+    return calls
+
+
+@pytest.fixture
+def factory(tmpdir):
+    collection = tmpdir.mkdir('col')
+    collection.join('vocab.col.txt').write('alpha\nbeta\nliberal @labels_class\n')
+    trainer_factory = trainer.TrainerFactory()
+    trainer_factory._col, trainer_factory._root_dir, trainer_factory._vocab = 'col', str(collection), str(collection.join('vocab.col.txt'))
+    return trainer_factory
+
+
+@pytest.mark.parametrize('use_ideology_information, name, content', [
+    (True, 'vowpal.col.txt', 'doc1 1.0 |@labels_class liberal |@default_class alpha beta:2\n'),
+    (False, 'docword.col.txt', '1\n2\n2\n1 1 1\n1 2 2\n'),
+])
+def test_compressed_files_are_vectorized_from_a_plain_copy(use_ideology_information, name, content, factory, vectorized, tmpdir):
+    with gzip.open(os.path.join(factory._root_dir, name + '.gz'), 'wt') as f:
+        f.write(content)
+    data_file = factory._collection_file(factory.ideology_flag2file_prefix[use_ideology_information])
+    assert data_file.endswith('.gz')
+    factory._vectorize(data_file, use_ideology_information, str(tmpdir.join('batches')))
+    expected = {name: content} if use_ideology_information else {name: content, 'vocab.col.txt': 'alpha\nbeta\nliberal @labels_class\n'}
+    assert vectorized == [(factory.ideology_flag2data_format[use_ideology_information], expected)]
+    assert sorted(os.listdir(factory._root_dir)) == sorted(['vocab.col.txt', name + '.gz'])  # the temporary copy is removed
+
+
+def test_sharded_uci_batches_number_the_documents_of_the_collection(factory, monkeypatch, tmpdir):
+    from artm import messages
+
+    def batch_vectorizer(collection_name=None, data_path='', data_format='batches', target_folder=None):
+        if data_format == 'batches':
+            return
+        with open(os.path.join(data_path, 'docword.col.txt')) as f:  # a batch of the documents of the shard, numbered like artm does
+            doc_nums = sorted(set(int(line.split()[0]) for line in f.readlines()[3:]))
+        batch = messages.Batch()
+        batch.id = os.path.basename(target_folder)
+        for doc_num in doc_nums:
+            batch.item.add().id = doc_num
+        os.makedirs(target_folder)
+        with open(os.path.join(target_folder, 'aaaaaa.batch'), 'wb') as f:
+            f.write(batch.SerializeToString())
+    monkeypatch.setattr(trainer.artm, 'BatchVectorizer', batch_vectorizer)
+    collection = tmpdir.join('col')
+    collection.join('docword.col.000.txt').write('2\n2\n3\n1 1 1\n1 2 2\n2 1 1\n')
+    collection.join('docword.col.001.txt').write('1\n2\n1\n1 2 1\n')
+    factory._mod_tr, factory._batches_target_dir = trainer.ModelTrainer(), str(collection.mkdir('uci-batches'))
+    factory.create_batches_from_shards({'shards': [{'uci': 'docword.col.000.txt', 'first_doc_num': 1, 'nb_docs': 2},
+                                                   {'uci': 'docword.col.001.txt', 'first_doc_num': 3, 'nb_docs': 1}]})
+    item_ids = {}
+    for name in sorted(os.listdir(factory._batches_target_dir)):
+        batch = messages.Batch()
+        with open(os.path.join(factory._batches_target_dir, name), 'rb') as f:
+            batch.ParseFromString(f.read())
+        item_ids[name] = [item.id for item in batch.item]
+    assert item_ids == {'000_aaaaaa.batch': [1, 2], '001_aaaaaa.batch': [3]}
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from gensim.corpora import Dictionary
+from gensim.models import TfidfModel
+from topic_modeling_toolkit.patm.weighting import counts_matrix, tfidf, bm25, log_count, documents
+
+
+@pytest.fixture(scope='module')
+def bow_corpus():
+    dictionary = Dictionary()
+    texts = [['similar', 'calls', 'have', 'been', 'made', 'calls'], ['made', 'anew', 'zebra', 'anew'], ['calls'], [], ['made', 'made', 'zebra']]
+    return [dictionary.doc2bow(text, allow_update=True) for text in texts], len(dictionary)
+
+
+def test_tfidf_matches_gensim(bow_corpus):
+    corpus, nb_tokens = bow_corpus
+    assert list(documents(tfidf(counts_matrix(corpus, nb_tokens)))) == [TfidfModel(corpus)[doc] for doc in corpus]
+
+
+def test_tfidf_with_given_frequencies(bow_corpus):
+    corpus, nb_tokens = bow_corpus
+    dfs, nb_docs = [2, 3, 1, 1, 5, 1, 1], 10
+    dictionary = Dictionary()
+    dictionary.dfs, dictionary.num_docs = dict(enumerate(dfs)), nb_docs
+    model = TfidfModel(dictionary=dictionary)
+    assert list(documents(tfidf(counts_matrix(corpus[1:], nb_tokens), dfs, nb_docs))) == [model[doc] for doc in corpus[1:]]
+
+
+def test_bm25_and_log_count(bow_corpus):
+    corpus, nb_tokens = bow_corpus
+    matrix = counts_matrix(corpus, nb_tokens)
+    weights = bm25(matrix)
+    assert weights.shape == matrix.shape
+    assert (weights.data > 0).all()
+    assert np.array_equal(weights.indices, matrix.indices)
+    assert list(documents(log_count(matrix), start=1, end=3)) == [[(token_id, np.log1p(count)) for token_id, count in doc] for doc in corpus[1:3]]
+
+
+@pytest.mark.parametrize('data_model', ['tfidf', 'bm25', 'log-count'])
+def test_streamed_weights_match_whole_corpus(data_model, bow_corpus, monkeypatch):
+    from topic_modeling_toolkit.patm import weighting
+    from topic_modeling_toolkit.patm.corpus import DiskBowCorpus
+    corpus, nb_tokens = bow_corpus
+    expected = list(documents(weighting.weightings[data_model](counts_matrix(corpus, nb_tokens))))
+    disk_corpus = DiskBowCorpus()
+    for doc in corpus:
+        disk_corpus.append([token_id for token_id, _ in doc], [count for _, count in doc])
+    rows = []
+    csr_matrix = weighting.csr_matrix
+    monkeypatch.setattr(weighting, 'csr_matrix', lambda *args, **kwargs: rows.append(kwargs['shape'][0]) or csr_matrix(*args, **kwargs))
+    parameters = weighting.weighting_parameters(disk_corpus, data_model, nb_tokens)
+    streamed = list(weighting.weighted_documents(disk_corpus, data_model, nb_tokens, parameters, block_size=2))
+    assert [[(token_id, pytest.approx(weight)) for token_id, weight in doc] for doc in expected] == streamed
+    assert list(weighting.weighted_documents(disk_corpus, data_model, nb_tokens, parameters, start=1, end=4, block_size=2)) == streamed[1:4]
+    assert rows and max(rows) <= 2  # no matrix of more than a block of documents is built